@@ -52,5 +52,31 @@ class ReferenceDistribution():
                 self.Distribution[0] += cap_vol
                 self.Distribution[1] += 1 - cap_vol
 
+    def classify_distribution(self, _vals, radius):
+        # update_distribution for an array of z values (e.g. every NP in a frame) at once.
+        # returns the (brush, solvent) amounts the NPs add to the distribution without changing it.
+        _vals = np.asarray(_vals, dtype=np.float64)
+        reference = self.ReferenceValue
+
+        in_brush = _vals <= reference
+        # NPs within a radius of the brush height are split between the brush and the solvent by their caps
+        partial = np.where(in_brush, _vals >= reference - radius, _vals <= reference + radius)
+
+        # cap height in the solvent for NPs centered in the brush, in the brush for NPs centered in the solvent
+        h = np.where(in_brush, _vals + radius - reference, radius - (_vals - reference))[partial]
+        cap_vol = self.calculate_ball_Vol_percentage(radius, h)
+        # fraction of each partial NP that is in the solvent
+        solvent_part = np.where(in_brush[partial], cap_vol, 1 - cap_vol)
+
+        solvent = np.count_nonzero(~in_brush & ~partial) + np.sum(solvent_part)
+        brush = np.count_nonzero(in_brush & ~partial) + np.sum(1 - solvent_part)
+        return float(brush), float(solvent)
+
+    def update_distribution_batch(self, _vals, radius):
+        #add an array of NP z values to the distribution in one call
+        brush, solvent = self.classify_distribution(_vals, radius)
+        self.Distribution[0] += brush
+        self.Distribution[1] += solvent
+
 
 
@@ -1,6 +1,7 @@
 import numpy as np
 import matplotlib.pyplot as plt
 import plotly.graph_objects as go
+import voxel_io
 
 #base_dir = "/scratch/chdavis/exp_3_c/NP_BRUSH/Umin_-0.175/rad_2/den_0.03/den_128/den_32/NP_1024"
 #base_dir = "/scratch/chdavis/exp_3_d/NP_BRUSH/Umin_-0.175/rad_2/den_0.3/gap_128/len_64/NP_4"
@@ -8,7 +9,7 @@ base_dir = "/scratch/chdavis/exp_3_d/NP_BRUSH/Umin_-0.175/rad_2/den_0.3/gap_0/le
 # Example 3D numpy array
 
 np.random.seed(0)  # Seed for reproducibility
-data = np.load(base_dir+"/voxel_data.dat")
+data = voxel_io.load_voxels(voxel_io.voxel_path(base_dir))
 Polymer_array = data[...,0]  # grab polymers
 NP_array = data[...,1]  # grab NPs
 
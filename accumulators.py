@@ -0,0 +1,61 @@
+# accumulators holds running statistics that are fed one frame at a time.
+# averaging a z profile over part of a simulation used to mean keeping every frame's profile in a list and
+# calling np.mean on the tail of it. the accumulators keep a fixed number of arrays no matter how many frames
+# go through them, and give the variance and standard error of the average as well.
+import numpy as np
+
+
+class ProfileAccumulator():
+    """
+    running mean and variance (Welford's method) of equally shaped arrays, e.g. one z profile per frame.
+    """
+
+    def __init__(self, shape):
+        self.Count = 0
+        self.Sum = np.zeros(shape, dtype=np.float64)
+        self.M2 = np.zeros(shape, dtype=np.float64)  # sum of the squared differences from the mean
+
+    def add(self, values):
+        # the mean is kept as a running sum so integer counts (e.g. histograms) average exactly like np.mean
+        values = np.asarray(values, dtype=np.float64)
+        old_mean = self.mean() if self.Count > 0 else values
+        self.Count += 1
+        self.Sum += values
+        self.M2 += (values - old_mean) * (values - self.mean())
+
+    def mean(self):
+        return self.Sum / self.Count
+
+    def variance(self):
+        """
+        sample variance (ddof=1) of the values added so far.
+        """
+        if self.Count < 2:
+            return np.zeros_like(self.M2)
+        return self.M2 / (self.Count - 1)
+
+    def sem(self):
+        """
+        standard error of the mean. frames of a simulation are correlated so this is a lower bound.
+        """
+        if self.Count < 2:
+            return np.zeros_like(self.M2)
+        return np.sqrt(self.variance() / self.Count)
+
+
+class WindowAccumulator(ProfileAccumulator):
+    """
+    ProfileAccumulator that only counts the frames in [start, stop). frames are numbered by the order they
+    are added, so every frame of a simulation can be passed to add and the window picks out the ones it needs.
+    """
+
+    def __init__(self, shape, start=0, stop=None):
+        super().__init__(shape)
+        self.Start = start
+        self.Stop = stop
+        self.Frame = 0  # number of the next frame passed to add
+
+    def add(self, values):
+        if self.Frame >= self.Start and (self.Stop is None or self.Frame < self.Stop):
+            super().add(values)
+        self.Frame += 1
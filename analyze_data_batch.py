@@ -7,6 +7,11 @@ import sys
 from ComputationalEquilibriums import ReferenceDistribution
 import numpy as np
 import brush_analysis
+import frame_reader
+import frame_cache
+import compressed_frames
+import campaign
+import catalog
 
 from matplotlib import pyplot as plt
 
@@ -20,186 +25,215 @@ from matplotlib import pyplot as plt
 #base_dir = "/scratch/chdavis/exp_2_f/NP_BRUSH"
 
 base_dir = "/scratch/chdavis"
-processed = 0
-total = 0
-
-height_sigma = []
-
-
-# walk the data path to access the data sets. this is the main part of the code
-# for root, dirs, files in os.walk(base_dir):
-
-for root, dirs, files in os.walk(base_dir):
-    print(root, dirs)
-    error_list = {"no_files":[], "no_data":[]}
-    path = root.split(os.sep)
-
-    #check to make sure we aren't in a known bad directory
-    if len(root.split("/")) < 4:
-        continue
-
-    if ("35" in root.split("/")[-4]) or ("BRUSH" in root.split("/")[-1]):
-        #ignore the -.35 Umins because of the PBC issue in the Z direction
-        #ignore Brush because of the NP_Brush directory
-        continue
-
-    #check to make sure you are in a directory with data.
-    if ("NP" in root.split("/")[-1]):
-        print("root " + root)
-        num_NPs = int(root.split("/")[-1].split("_")[-1])
-        print("num NPs", num_NPs)
-
-        dir_base = root
-        total += 1  #number of directories with data
-
-        # dist holds number of particles loaded in brush and floating in solvent at each time step
-        dist = ReferenceDistribution(_type="Binary", _reference=0.0, _dist=[0, 0])
-        significance_level = 0.05
-        sim_track = 0
-
-        # info_lag holds the dist objects for each time step
-        info_lag = []
-        # brushz_lag holds the brush height at each time step
-        brushz_lag = []
-
-        # bins for z axis profiling
-        bin_length = 0.5  # this bin length is used to cut the system height into intervals for binning
-        total_bins = int(1000.0 / bin_length)  # 1000 is used because it is a sim max. i.e. the system can only have a height of 1000
-        bin_values = np.asarray([x*bin_length  for x in range(total_bins)]) # z values for the bins
-
-        # poly_profile holds the number of polymers at sectional slice
-        poly_profile_lag = []
-        poly_profile_current = np.zeros(total_bins, dtype=int)
-        np_profile_lag = []
-        np_profile_current = np.zeros(total_bins, dtype=int)
-
-        #hold average height based "top" calculation
-        poly_avg_height_lag = []
-        poly_avg_height_lag.append(0)
-        tempheight = 0
-        monocount = 0
-
-        system_dimensions = [0.0, 0.0, 0.0]  # default values that will be overwritten by file data
-
-        # retrieve radius from filename and calculate NP Volume. relies on naming conventions from create_exp.sh
-
-        sigma =  float(dir_base.split("/")[-2].split("_")[-1])
-        print("sigma ", sigma)
-
-        radius = float(dir_base.split("/")[-3].split("_")[-1])
-        print("radius ", radius)
-        NP_Volume = 4.0 / 3.0 * np.pi * radius * radius * radius
-        print("NP_Volume ", NP_Volume)
-
-        print("Reading Simulation Global Values")
-
-        # get information about the simulation
-        filecheck = [s for s in files if ".mpd" in s]
-
-        if len(filecheck) == 1:
-            filename = filecheck[0]
-        else:
-            pass # why is this else clause here?
-
-
-        with open(dir_base +"/"+ filename, 'r') as fp:
-            for i, line in enumerate(fp):
-                if i == 9:  # this is the line with the sim dimensions when MD is used to create the file.
-                    split_line = line.strip().split(" ")  # split the file line into its components
-                    system_dimensions = [float(split_line[1]), float(split_line[2]), float(split_line[3])]
-
-        # grab the number of particles and the name of the experiment from the save file
-        parts = None
-        name = None
-
-        # calculate the density for the top of the brush. If the density is less than this on average
-        # we are at the top of the brush
-        brush_top_density = 1.0 / system_dimensions[0] / system_dimensions[1] /bin_length
-
-
-        primary_process = True # primary process holds standard processing. the else clause is for experiments
-
-        if primary_process :
-            print("Opening Simulation Data File")
-
-            with open(dir_base + "/frames_" + filename[:-4] + ".xyz", 'r') as fp:
-                for i, line in enumerate(fp):
-                    if i == 0:
-                        parts = int(line.strip())  # the first line has the number of particles in the simulation
-                    if i == 1:
-                        name = line.strip()  # I don't think we use this anymore it can probably go
-                    if i > 1:
-                        break
-
-            print("processing brush")
-
-            frame_file = dir_base + "/frames_" + filename[:-4] + ".xyz"
-            #get top of brush
-            top = brush_analysis.get_brush_height_inflection(frame_file,
-                                            parts,
-                                            total_bins,
-                                            bin_length,
-                                            .2,
-                                            save_to_dir=True,
-                                            dir_base=dir_base)
-
-            print("top \t", top)
-            if top < 2:
-                print("*******************************************\nBAD TOP calculation in "+root+"******************************************")
-
-
-            # calculate volumes for brush and solvent
-            Solvent_Volume = system_dimensions[0]*system_dimensions[1]*(system_dimensions[2]-top)
-            Brush_Volume = system_dimensions[0] * system_dimensions[1] * top
-            print("solvent volume\t", Solvent_Volume)
-            print("brush volume\t", Brush_Volume)
-
-            #get NPs in brush
-
-            returndict = brush_analysis.calc_loading(frame_file,
-                                                  parts,
-                                                  top,
-                                                  radius,
-                                                  total_bins,
-                                                  bin_length
-                                                  )
-            loading_array = np.array(returndict["loading"])
-            loading_array[:, 1] = loading_array[:, 1] * NP_Volume / Solvent_Volume
-            loading_array[:, 0] = loading_array[:, 0] * NP_Volume / Brush_Volume
-
-            np_profile_current = np.array(returndict["np_profile"])
-            poly_profile_current = np.array(returndict["poly_profile"])
-
-            results_dir = "/post"
-            if not os.path.exists(dir_base + results_dir):
-                os.makedirs(dir_base + results_dir)
-
-            with open(dir_base + results_dir + "/loading_solv.dat", 'w') as fp:
-                np.savetxt(fp, loading_array[:,1], fmt='%.6e', delimiter=' ', newline='\n', header=str(top), footer='', comments='# ',
-                          encoding=None)
-            with open(dir_base + results_dir + "/loading_brush.dat", 'w') as fp:
-                np.savetxt(fp, loading_array[:,0], fmt='%.6e', delimiter=' ', newline='\n', header=str(top), footer='', comments='# ',
-                          encoding=None)
-
-            with open(dir_base + results_dir + "/z_profile.dat", 'w') as fp:
-                np.savetxt(fp, np_profile_current, fmt='%.6e', delimiter=' ', newline='\n', header=str(top), footer='', comments='# ',
-                          encoding=None)
-
-            #save a file with profile data
-            #record the top of the brush and system
-            # use 1 because things are normalized to a pdf for the profiles
-            brush_top = np.zeros(total_bins, dtype=np)
-            brush_top[int(top//bin_length)] += 1
-            brush_top[int(system_dimensions[2]//bin_length)] += 1
-            z_data = np.column_stack((bin_values, np_profile_current, poly_profile_current, brush_top))
-            with open(dir_base + results_dir +  "/z_profile_data.dat", 'w') as fp:
-                np.savetxt(fp, z_data, fmt='%.6e', delimiter=' ', newline='\n', header=str(top), footer='', comments='# ',
-                          encoding=None)
-
-
-        else:
-            dummy = brush_analysis.retrieve_height(dir_base)
-            height_sigma.append([radius, sigma, dummy[0], dummy[1]] )
-
-print("processing finished")
+workers = None # worker processes, None uses the whole allocation (see campaign.default_workers)
+build_sidecars = False # write a memory mappable copy of each frame file (see frame_cache.py). only pays off when the frames are read again later
+catalog_file = None # sqlite catalog of the sims (see catalog.py). when set the sims are looked up in it instead of walking base_dir
 
+# analysis parameters. they are recorded in the manifest so changing one re-processes every sim
+bin_length = 0.5  # this bin length is used to cut the system height into intervals for binning
+equil_percent = .2 # 1 minus what percentage of the simulation time to include in the brush height
+height_window = 20 # frames in the trailing average of the per frame brush height
+time_resolved_top = False # use the per frame brush height (trailing average) instead of the averaged one for the loading
+# sims whose inputs and parameters didn't change since the last run are skipped (see campaign.run_campaign)
+manifest_path = base_dir + "/analysis_manifest_data_batch.json"
+
+
+def process_sim(root, files):
+    """
+    processes one simulation directory. this is the main part of the code and runs in a worker process.
+    """
+    print("root " + root)
+    # the parameters are read by name from the path. relies on naming conventions from create_exp.sh
+    params = catalog.parse_path(root)
+    num_NPs = params["NP"]
+    print("num NPs", num_NPs)
+
+    dir_base = root
+
+    # dist holds number of particles loaded in brush and floating in solvent at each time step
+    dist = ReferenceDistribution(_type="Binary", _reference=0.0, _dist=[0, 0])
+    significance_level = 0.05
+    sim_track = 0
+
+    # info_lag holds the dist objects for each time step
+    info_lag = []
+    # brushz_lag holds the brush height at each time step
+    brushz_lag = []
+
+    # bins for z axis profiling
+    total_bins = int(1000.0 / bin_length)  # 1000 is used because it is a sim max. i.e. the system can only have a height of 1000
+    bin_values = np.asarray([x*bin_length  for x in range(total_bins)]) # z values for the bins
+
+    # poly_profile holds the number of polymers at sectional slice
+    poly_profile_lag = []
+    poly_profile_current = np.zeros(total_bins, dtype=int)
+    np_profile_lag = []
+    np_profile_current = np.zeros(total_bins, dtype=int)
+
+    #hold average height based "top" calculation
+    poly_avg_height_lag = []
+    poly_avg_height_lag.append(0)
+    tempheight = 0
+    monocount = 0
+
+    system_dimensions = [0.0, 0.0, 0.0]  # default values that will be overwritten by file data
+
+    # calculate NP Volume from the radius
+
+    sigma = params["den"]
+    print("sigma ", sigma)
+
+    radius = params["rad"]
+    print("radius ", radius)
+    NP_Volume = 4.0 / 3.0 * np.pi * radius * radius * radius
+    print("NP_Volume ", NP_Volume)
+
+    print("Reading Simulation Global Values")
+
+    # get information about the simulation
+    filecheck = [s for s in files if ".mpd" in s]
+
+    if len(filecheck) == 1:
+        filename = filecheck[0]
+    else:
+        pass # why is this else clause here?
+
+
+    mpd_dimensions = catalog.read_mpd(dir_base + "/" + filename)[1]
+    if mpd_dimensions is not None:
+        system_dimensions = mpd_dimensions
+
+    # grab the number of particles and the name of the experiment from the save file
+    parts = None
+    name = None
+
+    # calculate the density for the top of the brush. If the density is less than this on average
+    # we are at the top of the brush
+    brush_top_density = 1.0 / system_dimensions[0] / system_dimensions[1] /bin_length
+
+
+    primary_process = True # primary process holds standard processing. the else clause is for experiments
+
+    if primary_process :
+        print("Opening Simulation Data File")
+
+        frame_file = compressed_frames.find_frames(dir_base + "/frames_" + filename[:-4] + ".xyz")
+        parts, name = frame_reader.read_header(frame_file)
+
+        # later analyses of this sim read the binary sidecar instead of the ascii frames
+        if build_sidecars:
+            frame_cache.ensure_sidecar(frame_file)
+
+        print("processing brush")
+
+        # one pass over the frame file collects the polymer profiles for the top of the brush and the NP
+        # positions for the loading
+        frame_metrics = brush_analysis.read_frame_metrics(frame_file,
+                                                          parts,
+                                                          total_bins,
+                                                          bin_length)
+        #get top of brush
+        top = brush_analysis.inflection_height(frame_metrics["poly_profile"],
+                                               total_bins,
+                                               bin_length,
+                                               equil_percent,
+                                               save_to_dir=True,
+                                               dir_base=dir_base)
+
+        print("top \t", top)
+        # brush height of every frame from the same profiles
+        frame_heights = brush_analysis.frame_brush_heights(frame_metrics["poly_profile"], bin_length, height_window)
+        failed_frames = int(np.count_nonzero(~frame_heights["passed"]))
+
+        # inflection_height is 0 when the averaged profile failed the inflection check
+        top_passed = top > 0.0
+        if not top_passed or (time_resolved_top and failed_frames > 0):
+            print("*******************************************\nBAD TOP calculation in "+root+"******************************************")
+            print("averaged profile passed", top_passed, "\tframes without an inflection point", failed_frames)
+
+        frame_top = top
+        if time_resolved_top:
+            # windows where every frame failed the check use the averaged height
+            frame_top = np.where(np.isfinite(frame_heights["windowed"]), frame_heights["windowed"], top)
+
+        # calculate volumes for brush and solvent
+        Solvent_Volume = system_dimensions[0]*system_dimensions[1]*(system_dimensions[2]-frame_top)
+        Brush_Volume = system_dimensions[0] * system_dimensions[1] * frame_top
+        print("solvent volume\t", np.mean(Solvent_Volume))
+        print("brush volume\t", np.mean(Brush_Volume))
+
+        #get NPs in brush
+
+        returndict = brush_analysis.calc_loading_from_metrics(frame_metrics,
+                                                           frame_top,
+                                                           radius
+                                                           )
+        loading_array = np.array(returndict["loading"])
+        loading_array[:, 1] = loading_array[:, 1] * NP_Volume / Solvent_Volume
+        loading_array[:, 0] = loading_array[:, 0] * NP_Volume / Brush_Volume
+
+        np_profile_current = np.array(returndict["np_profile"])
+        poly_profile_current = np.array(returndict["poly_profile"])
+
+        results_dir = "/post"
+        if not os.path.exists(dir_base + results_dir):
+            os.makedirs(dir_base + results_dir)
+
+        with open(dir_base + results_dir + "/loading_solv.dat", 'w') as fp:
+            np.savetxt(fp, loading_array[:,1], fmt='%.6e', delimiter=' ', newline='\n', header=str(top), footer='', comments='# ',
+                      encoding=None)
+        with open(dir_base + results_dir + "/loading_brush.dat", 'w') as fp:
+            np.savetxt(fp, loading_array[:,0], fmt='%.6e', delimiter=' ', newline='\n', header=str(top), footer='', comments='# ',
+                      encoding=None)
+
+        # frame, height, trailing average height, 1 if the frame has an inflection point (nan height otherwise),
+        # 1 if the height came from the smoothed fallback
+        height_data = np.column_stack((np.arange(frame_heights["height"].shape[0]),
+                                       frame_heights["height"],
+                                       frame_heights["windowed"],
+                                       frame_heights["passed"],
+                                       frame_heights["smoothed"]))
+        with open(dir_base + results_dir + "/brush_height_frames.dat", 'w') as fp:
+            np.savetxt(fp, height_data, fmt='%.6e', delimiter=' ', newline='\n', header=str(top), footer='', comments='# ',
+                      encoding=None)
+
+        with open(dir_base + results_dir + "/z_profile.dat", 'w') as fp:
+            np.savetxt(fp, np_profile_current, fmt='%.6e', delimiter=' ', newline='\n', header=str(top), footer='', comments='# ',
+                      encoding=None)
+
+        #save a file with profile data
+        #record the top of the brush and system
+        # use 1 because things are normalized to a pdf for the profiles
+        brush_top = np.zeros(total_bins)
+        brush_top[int(top//bin_length)] += 1
+        brush_top[int(system_dimensions[2]//bin_length)] += 1
+        z_data = np.column_stack((bin_values, np_profile_current, poly_profile_current, brush_top))
+        with open(dir_base + results_dir +  "/z_profile_data.dat", 'w') as fp:
+            np.savetxt(fp, z_data, fmt='%.6e', delimiter=' ', newline='\n', header=str(top), footer='', comments='# ',
+                      encoding=None)
+
+        return {"top": float(top), "top_passed": bool(top_passed), "failed_frames": failed_frames}
+
+    else:
+        dummy = brush_analysis.retrieve_height(dir_base)
+        return {"height_sigma": [radius, sigma, dummy[0], dummy[1]]}
+
+
+if __name__ == "__main__":
+    # walk the data path once (or look the sims up in the catalog) to find the data sets, then process them in parallel
+    sim_dirs = catalog.sim_dirs(catalog_file, base_dir) if catalog_file is not None else None
+    summary = campaign.run_campaign(base_dir, process_sim, workers, sim_dirs=sim_dirs,
+                                    manifest_path=manifest_path,
+                                    params={"bin_length": bin_length, "equil_percent": equil_percent,
+                                            "height_window": height_window, "time_resolved_top": time_resolved_top},
+                                    outputs=["post/loading_brush.dat", "post/loading_solv.dat",
+                                             "post/brush_height_frames.dat"])
+
+    height_sigma = [result["height_sigma"] for result in summary["results"].values() if "height_sigma" in result]
+    bad_tops = [root for root, result in summary["results"].items()
+                if not result.get("top_passed", True) or (time_resolved_top and result.get("failed_frames", 0) > 0)]
+
+    print("processed", len(summary["results"]) - len(summary["skipped"]), "sims, reused", len(summary["skipped"]))
+    print("bad top calculations", bad_tops)
+    print("errors", summary["errors"])
+    print("processing finished")
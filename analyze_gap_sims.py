@@ -4,6 +4,11 @@ import sys
 from ComputationalEquilibriums import ReferenceDistribution
 import numpy as np
 import gap_brush_analysis
+import frame_cache
+import campaign
+import catalog
+import compressed_frames
+import reverseread
 import subprocess
 
 #from matplotlib import pyplot as plt
@@ -15,116 +20,124 @@ import subprocess
 #base_dir = "/scratch/chdavis/exp_4/NP_BRUSH/Umin_-0.175/rad_2/den_0.1/gap_32/len_32/NP_0"
 
 base_dir = "/scratch/chdavis/exp_5/NP_BRUSH"
-processed = 0
-total = 0
-processing_missing = []
-height_sigma = []
-
-
-# walk the data path to access the data sets. this is the main part of the code
-# for root, dirs, files in os.walk(base_dir):
-
-for root, dirs, files in os.walk(base_dir):
-    # walking the directories from the root directory
-    error_list = {"no_files":[], "no_data":[]}
-    path = root.split(os.sep)
-
-    #check to make sure we aren't in a known bad directory
-    # this is used because by default data is in a directory that is at least 4 directies deep
-    if len(root.split("/")) < 4:
-        continue
-
-    if ("35" in root.split("/")[-4]) or ("BRUSH" in root.split("/")[-1]):
-        #ignore the -.35 Umins because of the PBC issue in the Z direction
-        #ignore Brush because of the NP_Brush directory
-        continue
-
-    #check to make sure you are in a directory with data.
-    if ("NP" in root.split("/")[-1]):
-        print("Data Directory: " + root)
-        num_NPs = int(root.split("/")[-1].split("_")[-1])
-        print("num NPs", num_NPs)
-
-        dir_base = root
-        total += 1  #number of directories with data
-
-        system_dimensions = [0.0, 0.0, 0.0]  # default values that will be overwritten by file data
-
-        # retrieve values from path. relies on naming conventions from create_exp.sh
-        # Umin_-0.175/rad_2/den_0.03/gap_64/len_32/NP_1024/
-
-        poly_len = float(dir_base.split("/")[-2].split("_")[-1])
-        gap_len = float(dir_base.split("/")[-3].split("_")[-1])
-        sigma =  float(dir_base.split("/")[-4].split("_")[-1])
-        radius = float(dir_base.split("/")[-5].split("_")[-1])
-        print("radius: ", radius,
-              "\tsigma: ", sigma,
-              "\tgap: ", gap_len,
-              "\tpoly len: ", poly_len)
-
-        NP_Volume = 4.0 / 3.0 * np.pi * radius * radius * radius
-        #print("NP_Volume ", NP_Volume)
-
-        print("Reading Simulation Global Values")
-
-        #see if data was processed
-        slurm_yes = [s for s in files if "slurm" in s]
-        if len(slurm_yes) == 0:
-            print(root,"\t missing processing")
-            processing_missing.append(root)
-            continue
-
-        # get information about the simulation
-        filecheck = [s for s in files if ".mpd" in s]
-
-        filename= None
-        if len(filecheck) == 1:
-            filename = filecheck[0]
-        else:
-            pass # why is this else clause here?
-
-        if filename is None:
-            print(root + "\t" + filename + ".mpd doesn't exist")
-            continue
-        particles = 0
-        with open(dir_base +"/"+ filename, 'r') as fp:
-            for i, line in enumerate(fp):
-                if i == 6:
-                    split_line = line.strip().split(" ")  # split the file line into its components
-                    particles = int(split_line[1])
-                if i == 9:  # this is the line with the sim dimensions when MD is used to create the file.
-                    split_line = line.strip().split(" ")  # split the file line into its components
-                    system_dimensions = [float(split_line[1]), float(split_line[2]), float(split_line[3])]
-
-        #This is here because the NP = 0 runs don't save a value .mpd file
-        if system_dimensions[0] <1:
-            continue
-
-        warmup = .8
-        frame_file = dir_base + "/frames_" + filename[:-4] + ".xyz"
-
-        #get last frame from frame file and save it
-        frame_lines = 0
-        with open(frame_file, 'r') as fp:
-            frame_lines = int(fp.readline()) +2
-
-        with open(dir_base + "/last_frame.xyz", 'w') as outfile:
+workers = None # worker processes, None uses the whole allocation (see campaign.default_workers)
+build_sidecars = False # write a memory mappable copy of each frame file (see frame_cache.py). only pays off when the frames are read again later
+catalog_file = None # sqlite catalog of the sims (see catalog.py). when set the sims are looked up in it instead of walking base_dir
+voxel_workers = 1 # worker processes per trajectory in build_density_voxels. raise it when there are fewer sims than cores
+voxel_format = "dat" # "npz" writes the compressed voxel_data.npz instead of voxel_data.dat (see voxel_io.py)
+
+# analysis parameters. they are recorded in the manifest so changing one re-processes every sim
+warmup = .8 # fraction of the simulation skipped before the voxels are averaged
+# sims whose inputs and parameters didn't change since the last run are skipped (see campaign.run_campaign)
+manifest_path = base_dir + "/analysis_manifest_gap_sims.json"
+
+
+def process_sim(root, files):
+    """
+    processes one simulation directory. this is the main part of the code and runs in a worker process.
+    """
+    print("Data Directory: " + root)
+    # the parameters are read by name from the path. relies on naming conventions from create_exp.sh
+    # Umin_-0.175/rad_2/den_0.03/gap_64/len_32/NP_1024/
+    params = catalog.parse_path(root)
+    num_NPs = params["NP"]
+    print("num NPs", num_NPs)
+
+    dir_base = root
+
+    system_dimensions = [0.0, 0.0, 0.0]  # default values that will be overwritten by file data
+
+    poly_len = params["len"]
+    gap_len = params["gap"]
+    sigma = params["den"]
+    radius = params["rad"]
+    print("radius: ", radius,
+          "\tsigma: ", sigma,
+          "\tgap: ", gap_len,
+          "\tpoly len: ", poly_len)
+
+    NP_Volume = 4.0 / 3.0 * np.pi * radius * radius * radius
+    #print("NP_Volume ", NP_Volume)
+
+    print("Reading Simulation Global Values")
+
+    #see if data was processed
+    slurm_yes = [s for s in files if "slurm" in s]
+    if len(slurm_yes) == 0:
+        print(root,"\t missing processing")
+        return {"status": "missing processing"}
+
+    # get information about the simulation
+    filecheck = [s for s in files if ".mpd" in s]
+
+    filename= None
+    if len(filecheck) == 1:
+        filename = filecheck[0]
+    else:
+        pass # why is this else clause here?
+
+    if filename is None:
+        print(root + "\t .mpd doesn't exist")
+        return {"status": "no mpd"}
+    particles, mpd_dimensions = catalog.read_mpd(dir_base + "/" + filename)
+    if mpd_dimensions is not None:
+        system_dimensions = mpd_dimensions
+
+    #This is here because the NP = 0 runs don't save a value .mpd file
+    if system_dimensions[0] <1:
+        return {"status": "no dimensions"}
+
+    frame_file = compressed_frames.find_frames(dir_base + "/frames_" + filename[:-4] + ".xyz")
+
+    # the voxels and every later analysis of this sim read the binary sidecar instead of the ascii frames
+    if build_sidecars:
+        frame_cache.ensure_sidecar(frame_file)
+
+    #get last frame from frame file and save it
+    frame_lines = 0
+    with compressed_frames.open_frames(frame_file, 'rt') as fp:
+        frame_lines = int(fp.readline()) +2
+        frame_name = fp.readline().strip()
+
+    with open(dir_base + "/last_frame.xyz", 'w') as outfile:
+        if compressed_frames.compression(frame_file) is None:
             subprocess.run(['tail', f'-n{frame_lines}', frame_file], stdout=outfile, check=True)
-
-        # RDF = gap_brush_analysis.calc_RDP(dir_base + "/last_frame.xyz",
-        #                                   system_dimensions,
-        #                                   particles,
-        #                                   gap_len,
-        #                                   num_NPs,
-        #                                   poly_len)
-        voxel_array, error = gap_brush_analysis.build_density_voxels(frame_file,
-                                                                     particles,
-                                                                     warmup,
-                                                                     system_dimensions,
-                                                                     save_to_dir=True,
-                                                                     dir_base=dir_base)
-        print(error)
-
-
-print("done \t processing missing for ", len(processing_missing)," sims")
-print(processing_missing)
\ No newline at end of file
+        else:
+            # tail can't read a compressed file, the last frame is written back out from its arrays
+            for types, coords in reverseread.read_frames_from_end(frame_file, frames=1):
+                outfile.write("{}\n{}\n".format(frame_lines - 2, frame_name))
+                np.savetxt(outfile, np.column_stack((types, coords)), fmt=["%d", "%.4f", "%.4f", "%.4f"],
+                           delimiter="\t")
+
+    # RDF = gap_brush_analysis.calc_RDP(dir_base + "/last_frame.xyz",
+    #                                   system_dimensions,
+    #                                   particles,
+    #                                   gap_len,
+    #                                   num_NPs,
+    #                                   poly_len)
+    voxel_array, error = gap_brush_analysis.build_density_voxels(frame_file,
+                                                                 particles,
+                                                                 warmup,
+                                                                 system_dimensions,
+                                                                 save_to_dir=True,
+                                                                 dir_base=dir_base,
+                                                                 workers=voxel_workers,
+                                                                 save_format=voxel_format)
+    print(error)
+    return {"status": "processed", "error": bool(error)}
+
+
+if __name__ == "__main__":
+    # walk the data path once (or look the sims up in the catalog) to find the data sets, then process them in parallel
+    sim_dirs = catalog.sim_dirs(catalog_file, base_dir) if catalog_file is not None else None
+    summary = campaign.run_campaign(base_dir, process_sim, workers, sim_dirs=sim_dirs,
+                                    manifest_path=manifest_path,
+                                    params={"warmup": warmup},
+                                    outputs=["voxel_data." + voxel_format])
+
+    processing_missing = sorted(root for root, result in summary["results"].items()
+                                if result["status"] == "missing processing")
+    print("errors", summary["errors"])
+    print("reused", len(summary["skipped"]), "unchanged sims")
+    print("done \t processing missing for ", len(processing_missing)," sims")
+    print(processing_missing)
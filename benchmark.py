@@ -0,0 +1,138 @@
+# benchmark times the analysis routines on synthetic trajectories (see synthetic_trajectory.py), so the effect of a
+# change can be measured without cluster data. every combination of the settings below is written to work_dir once
+# and then each routine is timed on it, taking the best of repeats runs.
+#   calc_loading, get_brush_height_inflection - brush_analysis on a plain brush sim
+#   calc_2D_avg_RDP, build_density_voxels - gap_brush_analysis on a gap sim with the same parameters
+#   main.py - the post simulation script run end to end in its own process
+#   broadcast - loading, profile, voxels and RDP of the gap sim from one parse (see frame_broadcast.py)
+# the results are printed and written to work_dir/benchmark.dat.
+# usage: python benchmark.py [work_dir]
+import io
+import os
+import sys
+import time
+import tempfile
+import itertools
+import contextlib
+import subprocess
+import brush_analysis
+import gap_brush_analysis
+import frame_cache
+import frame_reader
+import frame_index
+import frame_broadcast
+import kernels
+import synthetic_trajectory
+
+# the sims to time. every combination is run
+NP_counts = [64, 256, 1024]
+chain_lengths = [96, 128] # brushes about 30 and 40 tall, above the z = 20 the brush height analysis ignores
+grafting_densities = [0.03]
+frame_counts = [100]
+gap = 16 # gap width of the gap sims
+radius = 2
+
+repeats = 3 # each routine is run this many times and the fastest run is kept
+build_sidecars = False # time the routines reading the binary sidecars (see frame_cache.py) instead of the ascii frames
+read_ahead = frame_reader.READ_AHEAD # depth of the background frame read queue, 0 reads on the analysis thread
+bin_length = 0.5
+equil_percent = .2
+
+benchmarks = ["calc_loading", "get_brush_height_inflection", "calc_2D_avg_RDP", "build_density_voxels", "main.py",
+              "broadcast"]
+
+
+def best_time(run, repeats):
+    """
+    fastest wall time of repeats calls of run. the routines print progress, which is dropped.
+    """
+    times = []
+    for i in range(repeats):
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            run()
+            times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def checked_inflection(frame_file, parts, total_bins):
+    """
+    get_brush_height_inflection, failing if the inflection check failed (a height of 0) so the benchmark never
+    times the failed check instead of the measurement.
+    """
+    top = brush_analysis.get_brush_height_inflection(frame_file, parts, total_bins, bin_length, equil_percent)
+    assert top > 0.0, "the inflection check failed on " + frame_file
+    return top
+
+
+def sim_runs(brush_sim, gap_sim, NPs, chain_len, density):
+    """
+    the benchmarks for one set of parameters as {name: function that runs it once}.
+    """
+    dir_base, name, frame_file, box = brush_sim
+    gap_dir, gap_name, gap_frame_file, gap_box = gap_sim
+    parts, _ = frame_reader.read_header(frame_file)
+    gap_parts, _ = frame_reader.read_header(gap_frame_file)
+    total_bins = int(1000.0 / bin_length)
+    top = synthetic_trajectory.brush_height(chain_len, density)
+    frames = frame_reader.count_frames(gap_frame_file, gap_parts)
+
+    return {
+        "calc_loading": lambda: brush_analysis.calc_loading(frame_file, parts, top, radius, total_bins, bin_length),
+        "get_brush_height_inflection": lambda: checked_inflection(frame_file, parts, total_bins),
+        "calc_2D_avg_RDP": lambda: gap_brush_analysis.calc_2D_avg_RDP(
+            gap_frame_file, gap_box, gap, NPs, chain_len),
+        # build_density_voxels skips a fixed 1000 * equil_percent frames, so it is scaled to skip the same share
+        # of the synthetic frames
+        "build_density_voxels": lambda: gap_brush_analysis.build_density_voxels(
+            gap_frame_file, gap_parts, equil_percent * frames / 1000.0, list(gap_box)),
+        # main.py reads the parameters from the directory path, which has to end with a /
+        "main.py": lambda: subprocess.run(
+            [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "main.py"),
+             dir_base + "/", name],
+            stdout=subprocess.DEVNULL, check=True),
+        "broadcast": lambda: frame_broadcast.broadcast(gap_frame_file, {
+            "loading": brush_analysis.LoadingAnalysis(top, radius, total_bins, bin_length),
+            "profile": brush_analysis.ProfileAnalysis(total_bins, bin_length,
+                                                      start=frame_index.fraction_start(frames, equil_percent),
+                                                      stop=frames),
+            "voxels": gap_brush_analysis.VoxelAnalysis(list(gap_box), start=int(equil_percent * frames)),
+            "rdp": gap_brush_analysis.RDPAnalysis(gap_box, gap, NPs, _start=max(frames - 200, 0))}, gap_parts),
+    }
+
+
+def run_benchmarks(work_dir):
+    rows = []
+    frame_reader.READ_AHEAD = read_ahead
+    os.environ["FRAME_READ_AHEAD"] = str(read_ahead)  # for main.py
+    print("kernels backend:", kernels.BACKEND, "\tsidecars:", build_sidecars, "\tread ahead:", read_ahead)
+    print("NPs\tchain_len\tdensity\tframes\tbenchmark\tseconds")
+    for NPs, chain_len, density, frames in itertools.product(NP_counts, chain_lengths, grafting_densities,
+                                                             frame_counts):
+        root = os.path.join(work_dir, "frames_{}".format(frames))
+        brush_sim = synthetic_trajectory.write_trajectory(root, NPs, chain_len, density, frames, radius)
+        gap_sim = synthetic_trajectory.write_trajectory(root, NPs, chain_len, density, frames, radius, gap=gap)
+        if build_sidecars:
+            frame_cache.ensure_sidecar(brush_sim[2])
+            frame_cache.ensure_sidecar(gap_sim[2])
+
+        for benchmark, run in sim_runs(brush_sim, gap_sim, NPs, chain_len, density).items():
+            if benchmark not in benchmarks:
+                continue
+            seconds = best_time(run, repeats)
+            rows.append((NPs, chain_len, density, frames, benchmark, seconds))
+            print("{}\t{}\t{}\t{}\t{}\t{:.4f}".format(*rows[-1]))
+            sys.stdout.flush()
+
+    with open(os.path.join(work_dir, "benchmark.dat"), 'w') as fp:
+        fp.write("# kernels {} sidecars {} read_ahead {}\n".format(kernels.BACKEND, build_sidecars, read_ahead))
+        fp.write("# NPs chain_len density frames benchmark seconds\n")
+        for row in rows:
+            fp.write("{} {} {} {} {} {:.6f}\n".format(*row))
+    return rows
+
+
+if __name__ == "__main__":
+    work_dir = sys.argv[1] if len(sys.argv) > 1 else tempfile.mkdtemp(prefix="brush_benchmark_")
+    print("writing synthetic sims to", work_dir)
+    run_benchmarks(work_dir)
@@ -1,6 +1,9 @@
 import os
 from ComputationalEquilibriums import ReferenceDistribution
 import numpy as np
+import frame_reader
+import frame_index
+from accumulators import ProfileAccumulator
 
 
 def get_brush_height(filename,
@@ -12,40 +15,26 @@ def get_brush_height(filename,
                      save_to_dir=False,
                      dir_base=""):
 
-# process the simulation file
-    poly_profile_lag = []
-    poly_profile_current = np.zeros(total_bins, dtype=int)
-
-
-    with open(filename, 'r') as fp:
-        for i, line in enumerate(fp):
-            split_line = line.strip().split("\t")  # split the file line into its components
-
-            # there is a line for each particle plus a line for the number of particles and name of experiment.
-            # that's why we have (parts+2) in each frame. that means each frame can be indexed by i % (parts + 2)
-            if i % (parts + 2) == 0:
-                if i > 0:  # skips the first time since no data to save yet.
-                    # grab the polymer profile for the time step
-                    poly_profile_lag.append(poly_profile_current)
-                    # reset the polymer profile
-                    poly_profile_current = np.zeros(total_bins)
+# process the simulation file. only the frames after equilibrium are read
+    frames = frame_reader.count_frames(filename, parts)
+    poly_profile = ProfileAccumulator(total_bins)
 
-            # grab and record the highest z value for a polymer. This is the brush max height.
-            if split_line[0] == '1':  # spilt_line[0] will always exist even on break lines with the number of particles and name of exp.
-                bin = int(float(split_line[3]) / bin_length)
-                poly_profile_current[bin] += 1
+    for types, coords in frame_reader.read_frames(filename, parts,
+                                                  start=frame_index.fraction_start(frames, equil_percent),
+                                                  stop=frames):
+        # grab the polymer profile for the time step. type 1 is a monomer
+        poly_profile.add(frame_reader.z_profile(coords[types == 1, 2], bin_length, total_bins))
 
-        profile_data = np.array(poly_profile_lag)
-        useful_data_avg = np.mean(profile_data[int(profile_data.shape[0] * equil_percent):, :], axis=0)
+    useful_data_avg = poly_profile.mean()
 
-        if (save_to_dir):
-            with open(dir_base + "/profile_brush.dat", 'w') as fp:
-                np.savetxt(fp, useful_data_avg, fmt='%.6e', delimiter=' ', newline='\n', header='', footer='',
-                           comments='# ',
-                           encoding=None)
+    if (save_to_dir):
+        with open(dir_base + "/profile_brush.dat", 'w') as fp:
+            np.savetxt(fp, useful_data_avg, fmt='%.6e', delimiter=' ', newline='\n', header='', footer='',
+                       comments='# ',
+                       encoding=None)
 
-        top_indexes = [i for i, x in enumerate(useful_data_avg) if x < brush_top_density and i > int(1.0/ bin_length)+1]
-        return top_indexes[0] * bin_length
+    top_indexes = [i for i, x in enumerate(useful_data_avg) if x < brush_top_density and i > int(1.0/ bin_length)+1]
+    return top_indexes[0] * bin_length
 
 def get_brush_height_inflection(filename,
                      parts,         # particles in the simulation
@@ -54,71 +43,184 @@ def get_brush_height_inflection(filename,
                      equil_percent,   # 1 minus what percentage of the simulation time to include in the calculation
                      save_to_dir=False,
                      dir_base=""):
+    # process the simulation file. only the frames after equilibrium are read
+    frames = frame_reader.count_frames(filename, parts)
+    profile = ProfileAnalysis(total_bins, bin_length, start=frame_index.fraction_start(frames, equil_percent),
+                              stop=frames, save_to_dir=save_to_dir, dir_base=dir_base)
+
+    for frame, (types, coords) in enumerate(frame_reader.read_frames(filename, parts, start=profile.Start,
+                                                                     stop=frames), profile.Start):
+        profile.add(frame, types, coords)
+    return profile.result()
+
+class ProfileAnalysis():
+    """
+    get_brush_height_inflection fed one frame at a time (see frame_broadcast.py). averages the polymer profile of
+    the frames in [start, stop) and returns the inflection height of the average.
+    """
+
+    def __init__(self, total_bins, bin_length, start=0, stop=None, save_to_dir=False, dir_base=""):
+        self.Start = start
+        self.Stop = stop
+        self.TotalBins = total_bins
+        self.BinLength = bin_length
+        self.SaveToDir = save_to_dir
+        self.DirBase = dir_base
+        self.Profile = ProfileAccumulator(total_bins)
+
+    def add(self, frame, types, coords):
+        if self.Stop is not None and frame >= self.Stop:
+            return
+        # 1 is the code for monomer. add the polymer profile for the time step to the average.
+        self.Profile.add(frame_reader.z_profile(coords[types == 1, 2], self.BinLength, self.TotalBins))
+
+    def result(self):
+        return profile_inflection_height(self.Profile.mean(),
+                                         self.TotalBins,
+                                         self.BinLength,
+                                         profile_sem=self.Profile.sem(),
+                                         save_to_dir=self.SaveToDir,
+                                         dir_base=self.DirBase)
+
+def inflection_height(profile_data,  # polymer z profiles, one row per frame
+                      total_bins,    # total number of bins
+                      bin_length,     # length of the bins
+                      equil_percent,   # 1 minus what percentage of the simulation time to include in the calculation
+                      save_to_dir=False,
+                      dir_base=""):
+    #takes the percentage of the polymers that happen after equilibrium and averages them together.
+    useful_data = profile_data[frame_index.fraction_start(profile_data.shape[0], equil_percent):, :]
+    useful_data_avg = np.mean(useful_data, axis=0)
+    profile_sem = np.zeros(total_bins)
+    if useful_data.shape[0] > 1:
+        profile_sem = np.std(useful_data, axis=0, ddof=1) / np.sqrt(useful_data.shape[0])
+
+    return profile_inflection_height(useful_data_avg,
+                                     total_bins,
+                                     bin_length,
+                                     profile_sem=profile_sem,
+                                     save_to_dir=save_to_dir,
+                                     dir_base=dir_base)
+
+def profile_inflection_height(useful_data_avg,  # time averaged polymer z profile
+                              total_bins,    # total number of bins
+                              bin_length,     # length of the bins
+                              profile_sem=None,  # standard error of the averaged profile, saved with the profile
+                              save_to_dir=False,
+                              dir_base=""):
+    #take 1st and section direivative of profile
+    grad_useful_data_avg = np.gradient(useful_data_avg)
+    grad_2 = np.gradient(grad_useful_data_avg)
+
+    z_values = np.asarray([x*bin_length  for x in range(total_bins)])
+
+    # the averaged profile is a one frame profile matrix
+    heights, passed, smoothed = frame_inflection_heights(np.reshape(useful_data_avg, (1, -1)), bin_length)
     rValue = 0.0
-    # process the simulation file
-    poly_profile_lag = []
-    poly_profile_current = np.zeros(total_bins, dtype=int)
-
-
-    with (open(filename, 'r') as fp):
-        for i, line in enumerate(fp):
-            split_line = line.strip().split("\t")  # split the file line into its components
-
-            # there is a line for each particle plus a line for the number of particles and name of experiment.
-            # that's why we have (parts+2) in each frame. that means each frame can be indexed by i % (parts + 2)
-            if i % (parts + 2) == 0:
-                if i > 0:  # skips the first time since no data to save yet.
-                    # add the polymer profile for the time step to the array holding the rest.
-                    poly_profile_lag.append(poly_profile_current)
-                    # reset the polymer profile
-                    poly_profile_current = np.zeros(total_bins)
-
-            if split_line[0] == '1':  # spilt_line[0] will always exist even on break lines with the number of particles and name of exp.
-                #1 is the code for monomer. add this monomer to the current polymer profile.
-                bin = int(float(split_line[3]) / bin_length)
-                poly_profile_current[bin] += 1
-
-        #with all polymer profiles available
-        profile_data = np.array(poly_profile_lag)
-        #takes the percentage of the polymers that happen after equilibrium and averages them together.
-        useful_data_avg = np.mean(profile_data[int(profile_data.shape[0] * equil_percent):, :], axis=0)
-        #take 1st and section direivative of profile
-        grad_useful_data_avg = np.gradient(useful_data_avg)
-        grad_2 = np.gradient(grad_useful_data_avg)
-
-        z_values = np.asarray([x*bin_length  for x in range(total_bins)])
-
-        inflection_point = np.zeros(len(z_values))
-        #look at the profile above 20 to get rid of any wonkiness in early polymer configurations
-        start = int(20.0//bin_length)
-        grad_1_min = np.argmin(grad_useful_data_avg[start:]) + start # gets index for minimum after z = 20.
-        inflection_point[grad_1_min] += 500
-
-        #data to save
-        profiles = np.column_stack((z_values,
-                                    useful_data_avg,
-                                    grad_useful_data_avg,
-                                    grad_2,
-                                    inflection_point
-                                    ))
-        if (save_to_dir):
-            with open(dir_base + "/brush_profile.dat", 'w') as fp:
-                np.savetxt(fp, profiles, fmt='%.6e', delimiter=' ', newline='\n', header='', footer='',
-                           comments='# ',
-                           encoding=None)
-
-
-        if (
-         grad_2[grad_1_min - 1] < 0.0 and
-         grad_2[grad_1_min + 1] > 0.0 and
-         grad_2[grad_1_min - 2] < 0.0 and
-         grad_2[grad_1_min + 2] > 0.0):
-            #checks to make sure the 2nd derivative is zero
-            rValue = grad_1_min * bin_length
-        else:
-            print("ASSERTION FAILED")
+    inflection_point = np.zeros(len(z_values))
+    if passed[0]:
+        rValue = heights[0]
+        inflection_point[int(round(rValue / bin_length))] += 500
+        if smoothed[0]:
+            print("inflection check failed on the profile, brush height taken from the smoothed profile")
+    else:
+        # 0 marks a failed brush height, as before
+        print("ASSERTION FAILED, the profile has no inflection point even after smoothing")
+
+    #data to save
+    profiles = np.column_stack((z_values,
+                                useful_data_avg,
+                                grad_useful_data_avg,
+                                grad_2,
+                                inflection_point
+                                ))
+    if profile_sem is not None:
+        profiles = np.column_stack((profiles, profile_sem))
+    if (save_to_dir):
+        with open(dir_base + "/brush_profile.dat", 'w') as fp:
+            np.savetxt(fp, profiles, fmt='%.6e', delimiter=' ', newline='\n', header='', footer='',
+                       comments='# ',
+                       encoding=None)
 
     return  rValue
+
+def _steepest_descent(profiles, start):
+    # bin of the most negative slope of every profile at or above bin start, and whether the second derivative
+    # changes sign from negative to positive around it (i.e. it is an inflection point)
+    grad_1 = np.gradient(profiles, axis=1)
+    grad_2 = np.gradient(grad_1, axis=1)
+    grad_1_min = np.argmin(grad_1[:, start:], axis=1) + start
+
+    passed = (grad_1_min >= 2) & (grad_1_min + 2 < profiles.shape[1])
+    around = np.clip(grad_1_min[:, None] + np.asarray([-2, -1, 1, 2]), 0, profiles.shape[1] - 1)
+    signs = np.take_along_axis(grad_2, around, axis=1)
+    passed &= (signs[:, 0] < 0.0) & (signs[:, 1] < 0.0) & (signs[:, 2] > 0.0) & (signs[:, 3] > 0.0)
+    return grad_1_min, passed
+
+def smooth_profiles(profiles, sigma):
+    """
+    gaussian smoothing (sigma in bins) along the z axis of every row of a profile matrix.
+    """
+    half = max(int(np.ceil(3 * sigma)), 1)
+    kernel = np.exp(-0.5 * (np.arange(-half, half + 1) / sigma) ** 2)
+    kernel /= np.sum(kernel)
+    # the ends are padded with their edge values so the profile doesn't drop off at the top of the box
+    padded = np.pad(profiles, ((0, 0), (half, half)), mode='edge')
+    smoothed = np.zeros(profiles.shape)
+    for k in range(kernel.shape[0]):
+        smoothed += kernel[k] * padded[:, k:k + profiles.shape[1]]
+    return smoothed
+
+def frame_inflection_heights(profiles,   # polymer z profiles, one row per frame
+                             bin_length,    # length of the bins
+                             min_z=20.0,    # the profile below this is ignored
+                             smooth=2.0):   # sigma (in bins) of the smoothing used by the fallback
+    """
+    inflection point brush height of every frame of a (frames x bins) profile matrix at once. the height is where
+    the profile above min_z drops fastest, as in profile_inflection_height. frames where the second derivative
+    doesn't change sign there (noisy single frame profiles) are checked again on a gaussian smoothed profile.
+    returns (heights, passed, smoothed): passed is False for the frames that failed the check on both profiles,
+    whose height is nan, and smoothed is True for the frames measured on the smoothed profile.
+    """
+    profiles = np.asarray(profiles, dtype=np.float64)
+    #look at the profile above 20 to get rid of any wonkiness in early polymer configurations
+    start = int(min_z//bin_length)
+    height_bin, passed = _steepest_descent(profiles, start)
+    smoothed = ~passed
+    if np.any(smoothed):
+        height_bin[smoothed], passed[smoothed] = _steepest_descent(smooth_profiles(profiles[smoothed], smooth), start)
+    heights = height_bin * bin_length
+    heights[~passed] = np.nan
+    return heights, passed, smoothed
+
+def windowed_heights(heights, window=20):
+    """
+    trailing average of the per frame heights over the last window frames (fewer for the first frames). nan
+    heights (frames without an inflection point) are left out, a window of only nan heights averages to nan.
+    """
+    heights = np.asarray(heights, dtype=np.float64)
+    found = np.isfinite(heights)
+    cum = np.concatenate(([0.0], np.cumsum(np.where(found, heights, 0.0))))
+    counts = np.concatenate(([0], np.cumsum(found)))
+    end = np.arange(1, heights.shape[0] + 1)
+    begin = np.maximum(end - window, 0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return (cum[end] - cum[begin]) / (counts[end] - counts[begin])
+
+def frame_brush_heights(profile_data,  # polymer z profiles, one row per frame
+                        bin_length,     # length of the bins
+                        window=20):     # frames in the trailing average
+    """
+    time resolved brush height. returns a dictionary of arrays with one value per frame:
+        "height" - inflection point height of the frame, nan where the check failed
+        "windowed" - trailing average of the heights over window frames
+        "passed" - False where the frame has no inflection point, even after smoothing
+        "smoothed" - True where the height came from the smoothed fallback
+    """
+    heights, passed, smoothed = frame_inflection_heights(profile_data, bin_length)
+    return {"height": heights, "windowed": windowed_heights(heights, window), "passed": passed,
+            "smoothed": smoothed}
+
 def calc_loading(filename,
                  parts,
                  top,
@@ -127,52 +229,100 @@ def calc_loading(filename,
                  bin_length,
                  avg_timesteps=20):
 
-    info_lag = []
-    dist = ReferenceDistribution(_type="Binary", _reference=top, _dist=[0, 0])
-    np_profile_current = np.zeros(total_bins)
-    poly_profile_current = np.zeros(total_bins)
-    np_profile_avg = np.zeros((avg_timesteps,total_bins))
-    poly_profile_avg = np.zeros((avg_timesteps, total_bins))
-    avg_count = 0
-    returndict = {}
+    loading = LoadingAnalysis(top, radius, total_bins, bin_length, avg_timesteps)
 # process the simulation file
-    with open(filename, 'r') as fp:
-        for i, line in enumerate(fp):
-            split_line = line.strip().split("\t")  # split the file line into its components
-
-            # there is a line for each particle plus a line for the number of particles and name of experiment.
-            # that's why we have (parts+2) in each frame. that means each frame can be indexed by i % (parts + 2)
-            if i % (parts + 2) == 0:
-                if i > 0:  # skips the first time since no ditribution to process yet.
-                    #storing distribution
-                    info_lag.append(dist.Distribution)
-                    # reset the distributions so that processing can continue.
-                    dist = ReferenceDistribution(_type="Binary", _reference=top, _dist=[0, 0])
-                    #reset histogram
-                    np_profile_avg[avg_count,:] = np_profile_current
-                    poly_profile_avg[avg_count, :] = poly_profile_current
-                    avg_count += 1
-                    if avg_count == avg_timesteps:
-                        avg_count = 0
-                    np_profile_current = np.zeros(total_bins)
-                    poly_profile_current = np.zeros(total_bins)
-
-                    # identify the NP inside and outside the brush
-            if split_line[0] == '1':  # Line starting with a 1 is a monomer
-                # update histogram
-                poly_profile_current[int(float(split_line[3]) / bin_length)] += 1
-
-            # identify the NP inside and outside the brush
-            if split_line[0] == '2':  # Line starting with a 2 is a np
-                # pass the z value for the NP to the distribution. It will update according to current z height
-                dist.update_distribution(float(split_line[3]), radius)
-                #update histogram
-                np_profile_current[int(float(split_line[3])/bin_length)] += 1
+    for frame, (types, coords) in enumerate(frame_reader.read_frames(filename, parts)):
+        loading.add(frame, types, coords)
+    return loading.result()
+
+class LoadingAnalysis():
+    """
+    calc_loading fed one frame at a time (see frame_broadcast.py).
+    """
+
+    def __init__(self, top, radius, total_bins, bin_length, avg_timesteps=20):
+        self.Start = 0
+        self.Top = top
+        self.Radius = radius
+        self.TotalBins = total_bins
+        self.BinLength = bin_length
+        self.Loading = []
+        self.NPProfiles = np.zeros((avg_timesteps, total_bins))
+        self.PolyProfiles = np.zeros((avg_timesteps, total_bins))
+        self.AvgCount = 0
+
+    def add(self, frame, types, coords):
+        poly_z = coords[types == 1, 2]  # type 1 is a monomer
+        np_z = coords[types == 2, 2]    # type 2 is a np
+
+        #storing distribution
+        self.Loading.append(frame_loading(np_z, self.Top, self.Radius))
+
+        # update histograms. only the last avg_timesteps frames are kept
+        self.NPProfiles[self.AvgCount, :] = frame_reader.z_profile(np_z, self.BinLength, self.TotalBins)
+        self.PolyProfiles[self.AvgCount, :] = frame_reader.z_profile(poly_z, self.BinLength, self.TotalBins)
+        self.AvgCount = (self.AvgCount + 1) % self.NPProfiles.shape[0]
+
+    def result(self):
+        #conver the profiles to density functions along the z axis
+        np_profile_result = np.mean(self.NPProfiles, axis=0)
+        np_profile_result = np_profile_result / np.sum(np_profile_result)
+        poly_profile_result = np.mean(self.PolyProfiles, axis=0)
+        poly_profile_result = poly_profile_result / np.sum(poly_profile_result)
+
+        return {"loading": self.Loading, "np_profile": np_profile_result, "poly_profile": poly_profile_result}
+
+def frame_loading(np_z, top, radius):
+    """
+    returns the distribution [# np in brush, # np in solvent] for the NP z values of a single frame.
+    """
+    # identify the NP inside and outside the brush
+    dist = ReferenceDistribution(_type="Binary", _reference=top, _dist=[0, 0])
+    # pass the z values for every NP to the distribution. It will update according to current z height
+    dist.update_distribution_batch(np_z, radius)
+    return dist.Distribution
+
+def read_frame_metrics(filename,
+                       parts,         # particles in the simulation
+                       total_bins,    # total number of bins
+                       bin_length):    # length of the bins
+    """
+    single pass over the simulation file that keeps everything get_brush_height_inflection and calc_loading need.
+    returns a dictionary of arrays with one row per frame:
+        "poly_profile" - polymer z profile
+        "np_profile" - NP z profile
+        "np_z" - z value of every NP
+    """
+    poly_profile_lag = []
+    np_profile_lag = []
+    np_z_lag = []
+
+    for types, coords in frame_reader.read_frames(filename, parts):
+        poly_z = coords[types == 1, 2]  # type 1 is a monomer
+        np_z = coords[types == 2, 2]    # type 2 is a np
+        poly_profile_lag.append(frame_reader.z_profile(poly_z, bin_length, total_bins))
+        np_profile_lag.append(frame_reader.z_profile(np_z, bin_length, total_bins))
+        np_z_lag.append(np_z)
+
+    return {"poly_profile": np.array(poly_profile_lag, dtype=np.int32),
+            "np_profile": np.array(np_profile_lag, dtype=np.int32),
+            "np_z": np.array(np_z_lag)}
+
+def calc_loading_from_metrics(metrics,
+                              top,
+                              radius,
+                              avg_timesteps=20):
+    """
+    calc_loading for the arrays returned by read_frame_metrics. the return dictionary is the same as calc_loading.
+    top is the brush height, or an array with the brush height of every frame (see frame_brush_heights).
+    """
+    tops = np.broadcast_to(np.asarray(top, dtype=np.float64), (len(metrics["np_z"]),))
+    info_lag = [frame_loading(np_z, frame_top, radius) for np_z, frame_top in zip(metrics["np_z"], tops)]
 
     #conver the profiles to density functions along the z axis
-    np_profile_result = np.mean(np_profile_avg, axis=0)
+    np_profile_result = np.mean(metrics["np_profile"][-avg_timesteps:], axis=0)
     np_profile_result = np_profile_result / np.sum(np_profile_result)
-    poly_profile_result = np.mean(poly_profile_avg, axis=0)
+    poly_profile_result = np.mean(metrics["poly_profile"][-avg_timesteps:], axis=0)
     poly_profile_result = poly_profile_result / np.sum(poly_profile_result)
 
     returndict = {"loading": info_lag, "np_profile": np_profile_result, "poly_profile": poly_profile_result}
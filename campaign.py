@@ -0,0 +1,193 @@
+# campaign holds the code shared by the scripts that post process a whole experiment (campaign) of simulations.
+# a campaign is the directory tree built by create_exp.sh, e.g. /scratch/chdavis/exp_5/NP_BRUSH/Umin_*/rad_*/...,
+# where every NP_* leaf directory holds one simulation.
+# the tree is walked once to find the leaf directories, then the per directory work is spread over a pool of
+# worker processes.
+# a manifest can be kept for a campaign so directories whose inputs and analysis parameters haven't changed since
+# the last run are skipped and their previous results reused.
+import os
+import json
+import hashlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import compressed_frames
+
+
+def default_workers():
+    """
+    number of worker processes to use. on the cluster this is the slurm allocation (see basesim.sh),
+    otherwise every core of the machine.
+    """
+    if "SLURM_CPUS_PER_TASK" in os.environ:
+        return int(os.environ["SLURM_CPUS_PER_TASK"])
+    return os.cpu_count() or 1
+
+
+def find_sim_dirs(base_dir):
+    """
+    walks base_dir once and returns a sorted list of (root, files) for every simulation directory.
+    """
+    sim_dirs = []
+    for root, dirs, files in os.walk(base_dir):
+        #check to make sure we aren't in a known bad directory
+        # this is used because by default data is in a directory that is at least 4 directies deep
+        if len(root.split("/")) < 4:
+            continue
+
+        if ("35" in root.split("/")[-4]) or ("BRUSH" in root.split("/")[-1]):
+            #ignore the -.35 Umins because of the PBC issue in the Z direction
+            #ignore Brush because of the NP_Brush directory
+            continue
+
+        #check to make sure you are in a directory with data.
+        if ("NP" in root.split("/")[-1]):
+            sim_dirs.append((root, sorted(files)))
+    return sorted(sim_dirs)
+
+
+def is_input_file(name):
+    """
+    True for the files a simulation directory's analysis depends on: the .mpd, the frames file (compressed or
+    not) and the slurm output (which only shows up once the simulation is done).
+    """
+    return (name.endswith(".mpd") or
+            compressed_frames.is_frames_name(name) or
+            name.startswith("slurm"))
+
+
+def file_hash(path):
+    """
+    sha1 of a file's contents, read in 1 MB blocks.
+    """
+    sha = hashlib.sha1()
+    with open(path, 'rb') as fp:
+        for block in iter(lambda: fp.read(1024*1024), b""):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def input_signature(root, files, use_hash=False):
+    """
+    {file name: [size, mtime]} (or {file name: sha1} when use_hash is True) for the input files of a directory.
+    """
+    signature = {}
+    for name in sorted(files):
+        if not is_input_file(name):
+            continue
+        path = os.path.join(root, name)
+        if use_hash:
+            signature[name] = file_hash(path)
+        else:
+            stat = os.stat(path)
+            signature[name] = [stat.st_size, stat.st_mtime]
+    return signature
+
+
+def load_manifest(manifest_path):
+    """
+    loads a campaign manifest. returns an empty manifest if the file doesn't exist.
+    """
+    if manifest_path is None or not os.path.exists(manifest_path):
+        return {}
+    with open(manifest_path, 'r') as fp:
+        return json.load(fp)
+
+
+def save_manifest(manifest_path, manifest):
+    """
+    writes the manifest through a temporary file so an interrupted write never corrupts it.
+    """
+    with open(manifest_path + ".tmp", 'w') as fp:
+        json.dump(manifest, fp, indent=1, sort_keys=True)
+        fp.flush()
+        os.fsync(fp.fileno())  # on disk before it replaces the old manifest, in case the node goes down
+    os.replace(manifest_path + ".tmp", manifest_path)
+
+
+def is_up_to_date(entry, signature, params, root, outputs):
+    """
+    True if a manifest entry was made from the same inputs and parameters and its outputs are still there.
+    """
+    if entry is None:
+        return False
+    if entry["inputs"] != signature or entry["params"] != params:
+        return False
+    return all(os.path.exists(os.path.join(root, output)) for output in outputs)
+
+
+def run_campaign(base_dir, process_sim, workers=None, sim_dirs=None,
+                 manifest_path=None, params=None, outputs=(), use_hash=False):
+    """
+    calls process_sim(root, files) for every simulation directory under base_dir using workers processes.
+    process_sim has to be a module level function so it can be sent to the workers.
+    if manifest_path is given, directories whose input files (see input_signature), analysis parameters (params)
+    and output files (outputs, relative to the directory) are unchanged since the last run are skipped and the
+    result recorded in the manifest is reused. results have to be json serializable in that case.
+    returns a summary dictionary:
+        "results" - {root: return value of process_sim}
+        "errors" - {root: error message} for the directories whose processing raised an exception
+        "skipped" - roots whose results came from the manifest
+    """
+    if sim_dirs is None:
+        sim_dirs = find_sim_dirs(base_dir)
+    if workers is None:
+        workers = default_workers()
+    if params is None:
+        params = {}
+
+    summary = {"results": {}, "errors": {}, "skipped": []}
+    manifest = load_manifest(manifest_path)
+    signatures = {}
+    if manifest_path is not None:
+        pending = []
+        for root, files in sim_dirs:
+            try:
+                signatures[root] = input_signature(root, files, use_hash)
+            except OSError as e:
+                # e.g. a file listed by a stale catalog (see catalog.py) is gone. only this sim is skipped
+                summary["errors"][root] = repr(e)
+                print("ERROR reading inputs of", root, repr(e))
+                continue
+            entry = manifest.get(root)
+            if is_up_to_date(entry, signatures[root], params, root, outputs):
+                summary["results"][root] = entry["result"]
+                summary["skipped"].append(root)
+            else:
+                pending.append((root, files))
+        print("skipping", len(summary["skipped"]), "unchanged simulation directories")
+        sim_dirs = pending
+    print("processing", len(sim_dirs), "simulation directories with", workers, "workers")
+
+    def record(root, result):
+        summary["results"][root] = result
+        if manifest_path is not None:
+            manifest[root] = {"inputs": signatures[root], "params": params, "result": result}
+            # saved after every sim, a job killed by its time limit keeps the record of everything that finished
+            save_manifest(manifest_path, manifest)
+
+    try:
+        if workers <= 1:
+            # run in this process. useful for debugging a single sim
+            for root, files in sim_dirs:
+                try:
+                    record(root, process_sim(root, files))
+                except Exception as e:
+                    summary["errors"][root] = repr(e)
+                    print("ERROR processing", root, repr(e))
+            return summary
+
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(process_sim, root, files): root for root, files in sim_dirs}
+            for future in as_completed(futures):
+                root = futures[future]
+                try:
+                    record(root, future.result())
+                except Exception as e:
+                    summary["errors"][root] = repr(e)
+                    print("ERROR processing", root, repr(e))
+        return summary
+    finally:
+        # save what finished even if the campaign was interrupted
+        if manifest_path is not None:
+            for root in summary["errors"]:
+                manifest.pop(root, None)
+            save_manifest(manifest_path, manifest)
@@ -0,0 +1,219 @@
+# catalog keeps a SQLite index of every simulation of a campaign (see campaign.py), so runs can be looked up by their
+# parameters without walking the directory tree and re-reading the .mpd files of thousands of simulations.
+# build_catalog walks the campaign once and records one row per simulation directory:
+#   root                        - the simulation directory, as found by campaign.find_sim_dirs
+#   Umin, rad, den, gap, len, NP - parameters parsed by name from the <name>_<value> directories of the path (see
+#                                 create_exp.sh). the ones missing from the path (e.g. gap and len of brush sims) are NULL
+#   name, parts, box_x/y/z      - the .mpd name (no extension), its particle count (line 6) and box size (line 9)
+#   frame_file, frame_bytes     - the frames file (compressed or not, see compressed_frames.py) and its size
+#   finished                    - 1 when there is a slurm output file, i.e. the simulation ran to the end
+#   files                       - json list of the files in the directory when it was scanned. sim_dirs lists the
+#                                 directories again instead, so files written since (e.g. the slurm output) are seen
+# rebuilding only re-reads the .mpd files that changed and drops the directories that are gone.
+# by default the catalog is <campaign>/sim_catalog.sqlite.
+# usage: python catalog.py <campaign dir> [catalog file]
+import os
+import sys
+import json
+import time
+import sqlite3
+import campaign
+import compressed_frames
+
+CATALOG_NAME = "sim_catalog.sqlite"
+
+# parameters in the directory names and how their values are read
+PATH_KEYS = {"Umin": float, "rad": float, "den": float, "gap": float, "len": float, "NP": int}
+
+COLUMNS = ["root", "name", *PATH_KEYS, "parts", "box_x", "box_y", "box_z", "mpd_mtime_ns",
+           "frame_file", "frame_bytes", "finished", "files", "scanned"]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sims (
+    root TEXT PRIMARY KEY,
+    name TEXT,
+    Umin REAL, rad REAL, den REAL, gap REAL, len REAL, NP INTEGER,
+    parts INTEGER,
+    box_x REAL, box_y REAL, box_z REAL,
+    mpd_mtime_ns INTEGER,
+    frame_file TEXT,
+    frame_bytes INTEGER,
+    finished INTEGER,
+    files TEXT,
+    scanned REAL
+);
+CREATE INDEX IF NOT EXISTS sims_params ON sims (rad, den, gap, len, NP);
+CREATE INDEX IF NOT EXISTS sims_NP ON sims (NP);
+CREATE INDEX IF NOT EXISTS sims_umin ON sims (Umin);
+"""
+
+
+def catalog_path(base_dir):
+    """
+    default location of the catalog of the campaign in base_dir.
+    """
+    return os.path.join(base_dir, CATALOG_NAME)
+
+
+def parse_path(path):
+    """
+    {parameter: value} for the <name>_<value> directories in path, e.g. .../rad_2/den_0.03/NP_128 gives
+    rad 2.0, den 0.03 and NP 128. parameters that aren't in the path are None.
+    """
+    params = {key: None for key in PATH_KEYS}
+    for part in os.path.normpath(path).split(os.sep):
+        key, _, value = part.partition("_")
+        if key in PATH_KEYS:
+            try:
+                params[key] = PATH_KEYS[key](value)
+            except ValueError:
+                continue  # e.g. the NP_BRUSH directory
+    return params
+
+
+def read_mpd(path):
+    """
+    returns (particles, [x, y, z] box size) from lines 6 and 9 of a .mpd file written by the MD code.
+    either is None when its line is missing (e.g. the NP = 0 runs don't save a full .mpd file).
+    """
+    particles = None
+    system_dimensions = None
+    with open(path, 'r') as fp:
+        for i, line in enumerate(fp):
+            split_line = line.strip().split()  # split the file line into its components
+            try:
+                if i == 6:
+                    particles = int(split_line[1])
+                if i == 9:  # this is the line with the sim dimensions when MD is used to create the file.
+                    system_dimensions = [float(split_line[1]), float(split_line[2]), float(split_line[3])]
+                    break
+            except (IndexError, ValueError):
+                continue
+    return particles, system_dimensions
+
+
+def sim_record(root, files, known=None):
+    """
+    catalog row of the simulation directory root as a dictionary. known is the directory's previous row, whose
+    .mpd values are reused when the .mpd didn't change.
+    """
+    record = {key: None for key in COLUMNS}
+    record.update(parse_path(root))
+    record["root"] = root
+    record["files"] = json.dumps(sorted(files))
+    record["finished"] = int(any(name.startswith("slurm") for name in files))
+    record["scanned"] = time.time()
+
+    mpd = [name for name in files if name.endswith(".mpd")]
+    if len(mpd) == 1:
+        record["name"] = mpd[0][:-4]
+        record["mpd_mtime_ns"] = os.stat(os.path.join(root, mpd[0])).st_mtime_ns
+        if known is not None and known["mpd_mtime_ns"] == record["mpd_mtime_ns"]:
+            for key in ["parts", "box_x", "box_y", "box_z"]:
+                record[key] = known[key]
+        else:
+            record["parts"], system_dimensions = read_mpd(os.path.join(root, mpd[0]))
+            if system_dimensions is not None:
+                record["box_x"], record["box_y"], record["box_z"] = system_dimensions
+
+        frame_file = compressed_frames.find_frames(os.path.join(root, "frames_" + record["name"] + ".xyz"))
+        if os.path.exists(frame_file):
+            record["frame_file"] = frame_file
+            record["frame_bytes"] = os.path.getsize(frame_file)
+    return record
+
+
+def connect(path):
+    """
+    opens (creating it if needed) the catalog at path. rows come back as sqlite3.Row.
+    """
+    db = sqlite3.connect(path)
+    db.row_factory = sqlite3.Row
+    db.executescript(SCHEMA)
+    return db
+
+
+def build_catalog(base_dir, path=None):
+    """
+    walks the campaign in base_dir once and records every simulation directory in the catalog at path
+    (catalog_path(base_dir) by default). directories under base_dir that are gone are dropped. returns path.
+    """
+    if path is None:
+        path = catalog_path(base_dir)
+    sim_dirs = campaign.find_sim_dirs(base_dir)
+
+    db = connect(path)
+    try:
+        with db:
+            known = {row["root"]: row for row in db.execute("SELECT * FROM sims")}
+            records = [sim_record(root, files, known.get(root)) for root, files in sim_dirs]
+            db.executemany("INSERT OR REPLACE INTO sims ({}) VALUES ({})".format(", ".join(COLUMNS),
+                                                                               ", ".join("?" * len(COLUMNS))),
+                           [[record[key] for key in COLUMNS] for record in records])
+
+            found = set(root for root, files in sim_dirs)
+            prefix = os.path.join(base_dir, "")
+            gone = [root for root in known if root.startswith(prefix) and root not in found]
+            db.executemany("DELETE FROM sims WHERE root = ?", [(root,) for root in gone])
+    finally:
+        db.close()
+    print("catalog", path, len(records), "sims,", len(gone), "removed")
+    return path
+
+
+def _where(base_dir, finished, params):
+    # WHERE clause and its arguments. only catalog columns can be matched, so params can't inject sql
+    clauses = []
+    args = []
+    for key, value in params.items():
+        if key not in COLUMNS:
+            raise ValueError("the catalog has no column " + key)
+        if value is None:
+            clauses.append("{} IS NULL".format(key))
+        else:
+            clauses.append("{} = ?".format(key))
+            args.append(value)
+    if base_dir is not None:
+        clauses.append("substr(root, 1, ?) = ?")
+        prefix = os.path.join(base_dir, "")
+        args += [len(prefix), prefix]
+    if finished is not None:
+        clauses.append("finished = ?")
+        args.append(int(finished))
+    return (" WHERE " + " AND ".join(clauses) if clauses else ""), args
+
+
+def find_sims(path, base_dir=None, finished=None, **params):
+    """
+    rows of the catalog at path, as dictionaries sorted by root, whose columns equal params, e.g.
+    find_sims(path, rad=2, den=0.03, NP=1024). a None value matches a missing parameter. base_dir limits the
+    rows to the sims under it and finished=True to the ones that ran to the end.
+    """
+    where, args = _where(base_dir, finished, params)
+    db = connect(path)
+    try:
+        rows = db.execute("SELECT * FROM sims" + where + " ORDER BY root", args).fetchall()
+    finally:
+        db.close()
+    return [dict(row) for row in rows]
+
+
+def sim_dirs(path, base_dir=None, finished=None, **params):
+    """
+    find_sims as the sorted (root, files) list that campaign.run_campaign takes instead of walking the tree.
+    the files are listed again rather than taken from the catalog, which only knows them as of the last
+    build_catalog. directories that are gone since are left out.
+    """
+    sims = []
+    for row in find_sims(path, base_dir, finished, **params):
+        try:
+            files = sorted(entry.name for entry in os.scandir(row["root"]) if not entry.is_dir())
+        except OSError as e:
+            print("skipping", row["root"], e)
+            continue
+        sims.append((row["root"], files))
+    return sims
+
+
+if __name__ == "__main__":
+    build_catalog(sys.argv[1], sys.argv[2] if len(sys.argv) > 2 else None)
@@ -0,0 +1,262 @@
+# compressed_frames lets the frame readers (see frame_reader.py) work on gzip, xz and zstd compressed frames files.
+# the compression is found from the extension (.gz, .xz, .zst) or, failing that, the magic bytes at the start of
+# the file. zstd needs the zstandard package, gzip and xz only need the standard library.
+# a compressed file can only be streamed from the top, so reading the last frames means decompressing all of it.
+# compress_frames avoids that: it writes every frames_per_block frames as an independent gzip member / xz stream /
+# zstd frame (the result is still a normal compressed file that gunzip, unxz and unzstd read) and saves a block
+# index next to it as <compressed file>.blocks.npy, an int64 array with one row per block:
+#   blocks[k] = (byte offset of block k in the compressed file, first frame of block k)
+#   blocks[-1] = (size of the compressed file, number of frames)
+# with the block index a frame is read by decompressing only the block it is in.
+# count_frames saves the block index of any other compressed file the first time it decompresses it to count its
+# frames: a single block holding the whole file, so the count is known after that but the file is still streamed.
+import io
+import os
+import sys
+import gzip
+import lzma
+import tempfile
+import itertools
+import numpy as np
+import frame_reader
+import frame_index
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+EXTENSIONS = {".gz": "gzip", ".xz": "xz", ".zst": "zstd"}
+MAGIC = {"gzip": b"\x1f\x8b", "xz": b"\xfd7zXZ\x00", "zstd": b"\x28\xb5\x2f\xfd"}
+
+
+def compression(filename):
+    """
+    "gzip", "xz" or "zstd" for a compressed file, None for a plain one.
+    """
+    for ext, method in EXTENSIONS.items():
+        if filename.endswith(ext):
+            return method
+    try:
+        with open(filename, 'rb') as fp:
+            head = fp.read(6)
+    except OSError:
+        return None
+    for method, magic in MAGIC.items():
+        if head.startswith(magic):
+            return method
+    return None
+
+
+def is_frames_name(name):
+    """
+    True for the name of a frames file, compressed or not.
+    """
+    return name.startswith("frames_") and any(name.endswith(".xyz" + ext) for ext in ["", *EXTENSIONS])
+
+
+def find_frames(path):
+    """
+    path of a frames file that may have been compressed: path itself if it exists, otherwise the first of
+    path.gz, path.xz and path.zst that does. returns path if none of them exist.
+    """
+    if os.path.exists(path):
+        return path
+    for ext in EXTENSIONS:
+        if os.path.exists(path + ext):
+            return path + ext
+    return path
+
+
+def _zstandard():
+    if zstandard is None:
+        raise ImportError("zstd compressed frames files need the zstandard package")
+    return zstandard
+
+
+def open_frames(filename, mode='rb'):
+    """
+    opens a frames file for reading ('rb' or 'rt'), decompressing it on the fly when it is compressed.
+    """
+    method = compression(filename)
+    if method is None:
+        return open(filename, mode)
+    if method == "gzip":
+        return gzip.open(filename, mode)
+    if method == "xz":
+        return lzma.open(filename, mode)
+    reader = io.BufferedReader(_zstandard().ZstdDecompressor().stream_reader(open(filename, 'rb'),
+                                                                            read_across_frames=True,
+                                                                            closefd=True))
+    return io.TextIOWrapper(reader) if 't' in mode else reader
+
+
+def _compress(method, data, level=None):
+    if method == "gzip":
+        return gzip.compress(data, compresslevel=6 if level is None else level, mtime=0)
+    if method == "xz":
+        return lzma.compress(data, preset=6 if level is None else level)
+    return _zstandard().ZstdCompressor(level=3 if level is None else level).compress(data)
+
+
+def _decompress(method, data):
+    if method == "gzip":
+        return gzip.decompress(data)
+    if method == "xz":
+        return lzma.decompress(data)
+    return _zstandard().ZstdDecompressor().decompress(data)
+
+
+def block_index_path(filename):
+    """
+    returns the path of the block index for a compressed frames file.
+    """
+    return filename + ".blocks.npy"
+
+
+def load_block_index(filename):
+    """
+    returns the block index of a compressed frames file, or None if it has none or the file changed since.
+    """
+    path = block_index_path(filename)
+    if not os.path.exists(path):
+        return None
+    try:
+        blocks = np.load(path)
+    except (OSError, ValueError):
+        return None  # e.g. cut short by a full disk, it is rebuilt
+    if blocks[-1, 0] != os.path.getsize(filename):
+        return None
+    return blocks
+
+
+def save_block_index(filename, blocks):
+    """
+    saves the block index of a compressed frames file. a failure to save is printed, the index just isn't kept.
+    """
+    path = block_index_path(filename)
+    try:
+        # write to a temporary file first so a reader (or a second writer) never sees half an index
+        fd, tmp = tempfile.mkstemp(suffix=".tmp.npy", dir=os.path.dirname(os.path.abspath(path)))
+        try:
+            with os.fdopen(fd, 'wb') as fp:
+                np.save(fp, np.asarray(blocks, dtype=np.int64))
+            os.chmod(tmp, 0o644)  # mkstemp makes the file private
+            os.replace(tmp, path)
+        except BaseException:
+            os.remove(tmp)
+            raise
+    except OSError as e:
+        print("could not save block index", path, e)
+
+
+def compress_frames(filename, out=None, method="gzip", frames_per_block=100, level=None):
+    """
+    writes a compressed copy of a plain frames file made of independent blocks of frames_per_block frames,
+    and its block index. returns the path of the compressed file (by default the frames file + .gz/.xz/.zst).
+    """
+    if out is None:
+        out = filename + {v: k for k, v in EXTENSIONS.items()}[method]
+    parts, _ = frame_reader.read_header(filename)
+    offsets = frame_index.frame_offsets(filename, parts)
+    frames = offsets.shape[0] - 1
+
+    blocks = []
+    # write to a temporary file first so a killed conversion never leaves a file that looks complete
+    with open(filename, 'rb') as src, open(out + ".tmp", 'wb') as dst:
+        for first in range(0, frames, frames_per_block):
+            last = min(first + frames_per_block, frames)
+            src.seek(offsets[first])
+            blocks.append((dst.tell(), first))
+            dst.write(_compress(method, src.read(offsets[last] - offsets[first]), level))
+        blocks.append((dst.tell(), frames))
+    os.replace(out + ".tmp", out)
+    save_block_index(out, blocks)
+    return out
+
+
+def _stream(filename, parts, stop=None):
+    # (frame number, lines of the frame) for every complete frame from the top of the file
+    frame_length = parts + 2
+    with open_frames(filename) as fp:
+        for i in itertools.count():
+            if stop is not None and i >= stop:
+                break
+            frame = list(itertools.islice(fp, frame_length))
+            if len(frame) < frame_length or not frame[-1].endswith(b"\n"):
+                break  # end of file or a partial frame
+            yield i, frame
+
+
+def _read_blocks(filename, parts, blocks, indices):
+    # reads the frames indices through the block index, decompressing each block once for a run of its frames
+    method = compression(filename)
+    frame_length = parts + 2
+    current = None
+    with open(filename, 'rb') as fp:
+        for i in indices:
+            b = int(np.searchsorted(blocks[:, 1], i, side='right')) - 1
+            if b != current:
+                fp.seek(blocks[b, 0])
+                data = _decompress(method, fp.read(blocks[b + 1, 0] - blocks[b, 0]))
+                newlines = np.flatnonzero(np.frombuffer(data, dtype=np.uint8) == ord("\n"))
+                current = b
+            # line numbers in the block of the first particle line and the last line of the frame
+            first_line = (i - blocks[b, 1]) * frame_length + 2
+            body = newlines[first_line - 1] + 1
+            frame_end = newlines[first_line + parts - 1] + 1
+            yield data[body:frame_end]
+
+
+def count_frames(filename, parts):
+    """
+    number of complete frames in a compressed frames file. without a block index the file is decompressed
+    and a single block index is saved, so it is only counted once.
+    """
+    blocks = load_block_index(filename)
+    if blocks is not None:
+        return int(blocks[-1, 1])
+    size = os.path.getsize(filename)
+    lines = 0
+    with open_frames(filename) as fp:
+        for block in iter(lambda: fp.read(1024*1024), b""):
+            lines += block.count(b"\n")
+    frames = lines // (parts + 2)
+    save_block_index(filename, [(0, 0), (size, frames)])
+    return frames
+
+
+def raw_frames(filename, parts, start=0, stop=None, step=1):
+    """
+    frame_reader.raw_frames for a compressed frames file. with a block index only the blocks holding the
+    frames are decompressed. without one the file is streamed from the top, and frames asked for in another
+    order (e.g. the last frames newest first) are kept in memory until they can be yielded.
+    """
+    blocks = load_block_index(filename)
+    if blocks is not None and blocks.shape[0] > 2:
+        # a single block is streamed, which needs the same decompression without holding the whole file
+        yield from _read_blocks(filename, parts, blocks, frame_index.resolve_range(int(blocks[-1, 1]), start, stop, step))
+        return
+
+    if start >= 0 and step > 0 and (stop is None or stop >= 0):
+        # the frames before start are decompressed but never parsed
+        for i, frame in _stream(filename, parts, stop):
+            if i >= start and (i - start) % step == 0:
+                yield b"".join(frame[2:])
+        return
+
+    wanted = list(frame_index.resolve_range(count_frames(filename, parts), start, stop, step))
+    position = {f: k for k, f in enumerate(wanted)}
+    kept = [None] * len(wanted)
+    for i, frame in _stream(filename, parts, max(wanted) + 1 if wanted else 0):
+        if i in position:
+            kept[position[i]] = b"".join(frame[2:])
+    yield from kept
+
+
+if __name__ == "__main__":
+    # python compressed_frames.py <gzip|xz|zstd> <frames files>
+    # writes a block compressed copy of every frames file passed on the command line
+    for frame_file in sys.argv[2:]:
+        out = compress_frames(frame_file, method=sys.argv[1])
+        print(frame_file, os.path.getsize(frame_file), "->", out, os.path.getsize(out), "bytes")
@@ -229,6 +229,7 @@ while IFS=' ' read -r line Uvalue radius aDen nanos gaps lens; do
 
 
 		    echo "module load python/3.12.1/gcc.8.5.0" >> ./basesim.sh #add python for analysis to submission file
+		    echo "export FRAME_READ_AHEAD=4" >> ./basesim.sh # main.py reads frames 4 ahead on a background thread (see frame_reader.py)
 		    echo "python3 $base_dir/main.py $sim_dir/ $file_name ">> ./basesim.sh # execute analyis on the file after simulation.
 
         echo 'slurm_file=$(find . -type f -name "slurm*" -print -quit)'>> ./basesim.sh # execute analyis on the file after simulation.
@@ -296,6 +297,7 @@ while IFS=' ' read -r line Uvalue radius aDen nanos gaps lens; do
 
         ## hold off on auto python analysis
 		    #echo "module load python/3.12.1/gcc.8.5.0" >> ./basesim.sh #add python for analysis to submission file
+		    #echo "export FRAME_READ_AHEAD=4" >> ./basesim.sh # main.py reads frames 4 ahead on a background thread (see frame_reader.py)
 		    #echo "python3 $base_dir/main.py $sim_dir/ $file_name ">> ./basesim.sh # execute analyis on the file after simulation.
 
         echo 'slurm_file=$(find . -type f -name "slurm*" -print -quit)'>> ./basesim.sh # execute analyis on the file after simulation.
@@ -353,6 +355,7 @@ while IFS=' ' read -r line Uvalue radius aDen nanos gaps lens; do
 
 
 		    echo "module load python/3.12.1/gcc.8.5.0" >> ./basesim.sh #add python for analysis to submission file
+		    echo "export FRAME_READ_AHEAD=4" >> ./basesim.sh # main.py reads frames 4 ahead on a background thread (see frame_reader.py)
 		    echo "python3 $base_dir/main.py $sim_dir/ $file_name ">> ./basesim.sh # execute analyis on the file after simulation.
 
         echo 'slurm_file=$(find . -type f -name "slurm*" -print -quit)'>> ./basesim.sh # execute analyis on the file after simulation.
@@ -0,0 +1,150 @@
+# frame_broadcast runs several analyses of one trajectory (e.g. loading, voxels, RDP and profiles) off a single parse
+# of its frames. the calling process reads and parses every frame once (see frame_reader.py) into a ring buffer of
+# slots frames in shared memory, and each analysis runs in its own process that reads the frames straight out of the
+# ring without copying them. parsing is most of the time an analysis takes, so the analyses together cost about one
+# read of the trajectory and the rest of their math runs on a core each.
+# an analysis is an object (see brush_analysis.LoadingAnalysis, ProfileAnalysis and gap_brush_analysis.VoxelAnalysis,
+# RDPAnalysis) with
+#   Start                      - the first frame it needs. the ring is filled from the smallest Start
+#   add(frame, types, coords)  - called for every frame from Start on, in order. types and coords are views of the
+#                                ring that are overwritten after add returns, anything kept has to be copied
+#   result()                   - called after the last frame. its return value is sent back to the calling process
+# the analyses are pickled into their processes, so they are classes at the top level of a module.
+# only benchmark.py calls broadcast for now: the analysis scripts run a single analysis per trajectory (the voxels in
+# analyze_gap_sims.py, one read_frame_metrics pass in analyze_data_batch.py, one loop over the frames in main.py), so
+# there is no second parse for it to save. it is for a script that runs several of the analyses above over the same
+# frames.
+# every analysis process has two semaphores: ready counts the frames it can read and done the frames it is finished
+# with. a slot is only refilled once every analysis is done with the frame in it.
+import queue
+import traceback
+import multiprocessing
+from multiprocessing import shared_memory
+import numpy as np
+import frame_reader
+
+SLOTS = 16
+
+
+def ring_arrays(buffer, slots, parts):
+    """
+    (types, coords) arrays of the ring buffer, shape (slots, parts) and (slots, parts, 3), on the shared memory buffer.
+    """
+    types = np.ndarray((slots, parts), dtype=np.int64, buffer=buffer)
+    coords = np.ndarray((slots, parts, 3), dtype=np.float64, buffer=buffer, offset=types.nbytes)
+    return types, coords
+
+
+def _consume(name, analysis, memory_name, slots, parts, first, count, ready, done, results):
+    # runs in the analysis process. an analysis that fails keeps releasing its frames so the parser never waits on it
+    memory = shared_memory.SharedMemory(name=memory_name)
+    types, coords = ring_arrays(memory.buf, slots, parts)
+    error = None
+    result = None
+    frame = first
+    try:
+        while True:
+            ready.acquire()
+            if count.value == frame - first:
+                break  # every frame was read
+            if error is None and frame >= analysis.Start:
+                slot = (frame - first) % slots
+                try:
+                    analysis.add(frame, types[slot], coords[slot])
+                except Exception:
+                    error = traceback.format_exc()
+            done.release()
+            frame += 1
+        if error is None:
+            try:
+                result = analysis.result()
+            except Exception:
+                error = traceback.format_exc()
+    finally:
+        del types, coords
+        memory.close()
+    results.put((name, error, result))
+
+
+def _wait(semaphore, process):
+    # acquires semaphore, failing if the process that releases it died
+    while not semaphore.acquire(timeout=1.0):
+        if not process.is_alive():
+            raise RuntimeError("analysis process {} exited with code {}".format(process.name, process.exitcode))
+
+
+def _collect(results, processes):
+    collected = {}
+    while len(collected) < len(processes):
+        try:
+            name, error, result = results.get(timeout=1.0)
+        except queue.Empty:
+            for process in processes:
+                if process.exitcode not in (None, 0):
+                    raise RuntimeError("analysis process {} exited with code {}".format(process.name,
+                                                                                       process.exitcode))
+            continue
+        collected[name] = (error, result)
+    return collected
+
+
+def broadcast(filename,
+              analyses,     # {name: analysis}
+              parts=None,
+              stop=None,    # frames from stop on are not read
+              slots=SLOTS): # frames in the ring buffer
+    """
+    runs every analysis over the frames of filename, each in its own process, parsing every frame once.
+    returns {name: result of the analysis}. an analysis that raised is reported as a RuntimeError once all of
+    them finished.
+    """
+    if parts is None:
+        parts, _ = frame_reader.read_header(filename)
+    names = list(analyses)
+    first = min(analyses[name].Start for name in names)
+
+    memory = shared_memory.SharedMemory(create=True, size=slots * parts * (8 + 3 * 8))
+    types, coords = ring_arrays(memory.buf, slots, parts)
+    count = multiprocessing.RawValue('q', -1)  # number of frames read, -1 until the parser is done
+    ready = [multiprocessing.Semaphore(0) for name in names]
+    done = [multiprocessing.Semaphore(0) for name in names]
+    results = multiprocessing.Queue()
+    processes = [multiprocessing.Process(target=_consume, name=name, daemon=True,
+                                         args=(name, analyses[name], memory.name, slots, parts, first, count,
+                                               ready[i], done[i], results))
+                 for i, name in enumerate(names)]
+    try:
+        for process in processes:
+            process.start()
+        written = 0
+        for frame_types, frame_coords in frame_reader.read_frames(filename, parts, start=first, stop=stop):
+            if written >= slots:
+                # the slot still holds frame written - slots
+                for semaphore, process in zip(done, processes):
+                    _wait(semaphore, process)
+            slot = written % slots
+            types[slot] = frame_types
+            coords[slot] = frame_coords
+            written += 1
+            for semaphore in ready:
+                semaphore.release()
+        count.value = written
+        for semaphore in ready:
+            semaphore.release()
+
+        collected = _collect(results, processes)
+        for process in processes:
+            process.join()
+    finally:
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+        del types, coords
+        memory.close()
+        memory.unlink()
+
+    for name in names:
+        error, result = collected[name]
+        if error is not None:
+            raise RuntimeError("analysis {} failed\n{}".format(name, error))
+    return {name: collected[name][1] for name in names}
@@ -0,0 +1,87 @@
+# frame_cache converts a frames_*.xyz file into a binary sidecar that can be memory mapped.
+# the sidecar is two .npy files written next to the frame file:
+#   frames_<name>.xyz.coords.npy - float32 array of shape (frames, parts, 3) holding x, y, z
+#   frames_<name>.xyz.types.npy  - uint8 array of shape (frames, parts) holding the particle types
+# frame_reader uses the sidecar instead of the ascii file whenever it exists and is newer than the frame file.
+# building a sidecar costs a full parse and a float32 copy about the size of the frame file, so the analysis scripts
+# only build them when asked to (build_sidecars), i.e. when the frames will be read again by later analyses.
+import os
+import sys
+import numpy as np
+import frame_reader
+
+
+def sidecar_paths(filename):
+    """
+    returns the (types, coords) paths of the sidecar for a frame file.
+    """
+    return filename + ".types.npy", filename + ".coords.npy"
+
+
+def open_sidecar(filename):
+    """
+    returns (types, coords) memory mapped from the sidecar of a frame file.
+    returns None if there is no sidecar or the frame file changed after the sidecar was written.
+    """
+    types_path, coords_path = sidecar_paths(filename)
+    if not (os.path.exists(types_path) and os.path.exists(coords_path)):
+        return None
+    if os.path.exists(filename):
+        frame_time = os.path.getmtime(filename)
+        if os.path.getmtime(types_path) < frame_time or os.path.getmtime(coords_path) < frame_time:
+            return None  # the simulation wrote more frames after the sidecar was built
+    return np.load(types_path, mmap_mode='r'), np.load(coords_path, mmap_mode='r')
+
+
+def build_sidecar(filename):
+    """
+    parses the frame file once and writes its sidecar. returns the number of frames written.
+    """
+    parts, _ = frame_reader.read_header(filename)
+    frames = frame_reader.count_frames(filename, parts)
+
+    types_path, coords_path = sidecar_paths(filename)
+    # write to temporary files first so a killed conversion never leaves a sidecar that looks complete
+    types_tmp = types_path + ".tmp"
+    coords_tmp = coords_path + ".tmp"
+    types = np.lib.format.open_memmap(types_tmp, mode='w+', dtype=np.uint8, shape=(frames, parts))
+    coords = np.lib.format.open_memmap(coords_tmp, mode='w+', dtype=np.float32, shape=(frames, parts, 3))
+
+    for i, (frame_types, frame_coords) in enumerate(frame_reader.read_frames(filename, parts, stop=frames)):
+        types[i] = frame_types
+        coords[i] = frame_coords
+
+    types.flush()
+    coords.flush()
+    del types, coords
+    os.replace(types_tmp, types_path)
+    os.replace(coords_tmp, coords_path)
+    return frames
+
+
+def ensure_sidecar(filename):
+    """
+    builds the sidecar for a frame file unless an up to date one already exists. returns True when the frame file
+    has an up to date sidecar afterwards. a sidecar that can't be written (read only or full disk) isn't an error,
+    the frames are then parsed from the ascii file.
+    """
+    if open_sidecar(filename) is not None:
+        return True
+    print("building sidecar for", filename)
+    try:
+        build_sidecar(filename)
+    except OSError as e:
+        print("could not build sidecar for", filename, e)
+        for path in sidecar_paths(filename):
+            try:
+                os.remove(path + ".tmp")
+            except OSError:
+                pass
+        return False
+    return True
+
+
+if __name__ == "__main__":
+    # convert every frame file passed on the command line
+    for frame_file in sys.argv[1:]:
+        print(frame_file, build_sidecar(frame_file), "frames")
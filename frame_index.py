@@ -0,0 +1,136 @@
+# frame_index keeps a byte offset index for a frames_*.xyz file so any frame can be seeked to directly.
+# the index is saved next to the frame file as frames_<name>.xyz.idx.npz and holds
+#   offsets - one int64 per frame. offsets[k] is the byte offset of the first line of frame k and offsets[-1] the
+#             byte offset just past the last complete frame
+#   size, mtime_ns - the size and modification time of the frame file when the index was saved
+#   last_frame - sha1 of the bytes of the last indexed frame
+# frames are only ever appended to the file by the MD code, so an index built while a simulation is running stays
+# valid and is extended from offsets[-1] the next time it is loaded. a file whose size or mtime changed is only
+# extended if its last indexed frame is still byte for byte the same, otherwise (e.g. the simulation was re-run)
+# the index is rebuilt.
+import os
+import hashlib
+import tempfile
+import zipfile
+import numpy as np
+
+
+def index_path(filename):
+    """
+    returns the path of the offset index for a frame file.
+    """
+    return filename + ".idx.npz"
+
+
+def scan_offsets(filename, parts, start_offset=0):
+    """
+    scans the file from start_offset (which has to be the start of a frame) and returns the byte offsets of the
+    frame starts it finds. the last entry is the offset just past the last complete frame.
+    """
+    frame_length = parts + 2
+    offsets = [start_offset]
+    lines = 0
+    position = start_offset
+    with open(filename, 'rb') as fp:
+        fp.seek(start_offset)
+        for block in iter(lambda: fp.read(1024*1024), b""):
+            # positions of the newlines in this block
+            newlines = np.flatnonzero(np.frombuffer(block, dtype=np.uint8) == ord("\n"))
+            # line numbers (counted from start_offset) that each newline ends
+            line_numbers = lines + np.arange(1, newlines.shape[0] + 1)
+            frame_ends = newlines[line_numbers % frame_length == 0]
+            offsets.extend((position + frame_ends + 1).tolist())
+            lines += newlines.shape[0]
+            position += len(block)
+    return np.asarray(offsets, dtype=np.int64)
+
+
+def _frame_hash(filename, offsets):
+    # sha1 of the last frame in offsets, used to check the file still starts with the indexed frames
+    if offsets.shape[0] < 2:
+        return ""
+    with open(filename, 'rb') as fp:
+        fp.seek(offsets[-2])
+        return hashlib.sha1(fp.read(offsets[-1] - offsets[-2])).hexdigest()
+
+
+def load_index(filename):
+    """
+    returns (offsets, size, mtime_ns, last frame hash) of the saved index of a frame file, or None when there is
+    none or it can't be read (e.g. it was written by an older version).
+    """
+    try:
+        with np.load(index_path(filename), allow_pickle=False) as saved:
+            return saved["offsets"], int(saved["size"]), int(saved["mtime_ns"]), str(saved["last_frame"])
+    except (OSError, KeyError, ValueError, zipfile.BadZipFile):
+        return None
+
+
+def frame_offsets(filename, parts=None, save=True):
+    """
+    returns the offset index for a frame file. the index is loaded from disk when possible, extended if frames
+    were appended since it was written and rebuilt if the indexed part of the file changed.
+    """
+    if parts is None:
+        with open(filename, 'rb') as fp:
+            parts = int(fp.readline().strip())  # the first line has the number of particles in the simulation
+
+    st = os.stat(filename)
+    saved = load_index(filename)
+    if saved is not None:
+        offsets, size, mtime_ns, last_frame = saved
+        if size == st.st_size and mtime_ns == st.st_mtime_ns:
+            return offsets  # the file didn't change since the index was saved
+        if offsets[-1] > st.st_size or _frame_hash(filename, offsets) != last_frame:
+            saved = None  # the file was rewritten, e.g. the simulation was re-run
+
+    if saved is None:
+        offsets = scan_offsets(filename, parts)
+    else:
+        # frames may have been written after the index was saved. only the new part of the file is scanned
+        new_offsets = scan_offsets(filename, parts, int(offsets[-1]))
+        if new_offsets.shape[0] == 1:
+            return offsets  # no new complete frame yet, the saved index is still right
+        offsets = np.concatenate((offsets[:-1], new_offsets))
+
+    if save:
+        path = index_path(filename)
+        try:
+            # write to a temporary file first so a reader (or a second writer) never sees half an index
+            fd, tmp = tempfile.mkstemp(suffix=".tmp.npz", dir=os.path.dirname(os.path.abspath(path)))
+            try:
+                with os.fdopen(fd, 'wb') as fp:
+                    np.savez(fp, offsets=offsets, size=st.st_size, mtime_ns=st.st_mtime_ns,
+                             last_frame=_frame_hash(filename, offsets))
+                os.chmod(tmp, 0o644)  # mkstemp makes the file private
+                os.replace(tmp, path)
+            except BaseException:
+                os.remove(tmp)
+                raise
+        except OSError as e:
+            # read only data directories still get an index, it just isn't kept
+            print("could not save frame index", path, e)
+    return offsets
+
+
+def has_index(filename):
+    """
+    True if an offset index was already saved for the frame file.
+    """
+    return os.path.exists(index_path(filename))
+
+
+def resolve_range(frames, start=0, stop=None, step=1):
+    """
+    converts start, stop and step into frame numbers for a file with frames frames.
+    start and stop follow python slicing so start=-200 gives the last 200 frames.
+    """
+    return range(*slice(start, stop, step).indices(frames))
+
+
+def fraction_start(frames, equil_percent):
+    """
+    first frame after skipping equil_percent of the simulation. fraction_start(frames, .8) is the start of the
+    last 20% of the frames.
+    """
+    return int(frames * equil_percent)
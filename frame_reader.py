@@ -0,0 +1,176 @@
+# frame_reader holds the shared code for reading the frames_*.xyz files written out by the MD code.
+# every frame in the file is (parts + 2) lines long:
+#   line 0 - the number of particles in the simulation
+#   line 1 - the name of the experiment
+#   lines 2 .. parts+1 - one line per particle "type\tx\ty\tz"
+# instead of splitting and casting each line on its own, a whole frame is handed to numpy at once.
+# if the frame file has an up to date binary sidecar (see frame_cache.py) the frames come from the sidecar instead.
+# the byte offset index (see frame_index.py) lets a read start at any frame without going through the ones before it.
+# gzip, xz and zstd compressed frames files are read through compressed_frames.py.
+# reading and parsing can overlap: with read_ahead > 0 a background thread reads the raw frames into a queue that many
+# frames deep while the caller parses and analyzes the frames it already has. the default depth is taken from the
+# FRAME_READ_AHEAD environment variable (0, reading on the calling thread, when it isn't set).
+import os
+import queue
+import threading
+import itertools
+import numpy as np
+import frame_cache
+import frame_index
+import kernels
+import compressed_frames
+
+READ_AHEAD = int(os.environ.get("FRAME_READ_AHEAD", 0))
+
+
+def read_header(filename):
+    """
+    returns (parts, name) from the first two lines of a frames file.
+    """
+    with compressed_frames.open_frames(filename) as fp:
+        parts = int(fp.readline().strip())  # the first line has the number of particles in the simulation
+        name = fp.readline().strip().decode("utf-8", errors="replace")  # name of the experiment
+    return parts, name
+
+
+def parse_block(block, parts):
+    """
+    converts the raw bytes of the particle lines of a single frame (header lines already removed) into numpy arrays.
+    returns types (int array of length parts) and coords (float array of shape (parts, 3)).
+    """
+    values = np.array(block.split(), dtype=np.float64)
+    # the MD code writes 4 columns per particle (type, x, y, z)
+    values = values.reshape(parts, -1)
+    types = values[:, 0].astype(np.int64)
+    coords = values[:, 1:4]
+    return types, coords
+
+
+def read_frames(filename, parts=None, start=0, stop=None, step=1, read_ahead=None):
+    """
+    Generator that yields (types, coords) for each complete frame in the file.
+    start, stop and step are frame numbers, not line numbers, and follow python slicing (start=-200 is the
+    last 200 frames). frames before start are seeked past with the offset index (see frame_index.py) and
+    are never parsed. a frame that was only partially written (e.g. the simulation was killed) is ignored.
+    read_ahead is the depth of the background read queue (see read_ahead_frames), READ_AHEAD when None.
+    """
+    sidecar = frame_cache.open_sidecar(filename)
+    if sidecar is not None:
+        types, coords = sidecar
+        for i in frame_index.resolve_range(types.shape[0], start, stop, step):
+            yield types[i].astype(np.int64), coords[i].astype(np.float64)
+        return
+
+    if parts is None:
+        parts, _ = read_header(filename)
+    if read_ahead is None:
+        read_ahead = READ_AHEAD
+
+    blocks = raw_frames(filename, parts, start, stop, step)
+    if read_ahead > 0:
+        blocks = read_ahead_frames(blocks, read_ahead)
+    for block in blocks:
+        yield parse_block(block, parts)
+
+
+def raw_frames(filename, parts, start=0, stop=None, step=1):
+    """
+    Generator that yields the raw bytes of the particle lines of the frames read_frames would yield, for
+    parse_block.
+    """
+    if compressed_frames.compression(filename) is not None:
+        yield from compressed_frames.raw_frames(filename, parts, start, stop, step)
+        return
+
+    if start == 0 and step == 1 and (stop is None or stop >= 0) and not frame_index.has_index(filename):
+        # reading from the top of the file doesn't need the index
+        yield from _read_sequential(filename, parts, stop)
+        return
+
+    offsets = frame_index.frame_offsets(filename, parts)
+    with open(filename, 'rb') as fp:
+        for i in frame_index.resolve_range(offsets.shape[0] - 1, start, stop, step):
+            fp.seek(offsets[i])
+            block = fp.read(offsets[i + 1] - offsets[i])
+            yield block.split(b"\n", 2)[2] # the first two lines are the frame header
+
+
+def read_ahead_frames(blocks, depth):
+    """
+    Generator that yields the items of blocks, which are read by a background thread into a queue of at most
+    depth items. the reads (and decompression) overlap with whatever the caller does between items.
+    stopping early (break, close) stops the thread before its next read.
+    """
+    frames = queue.Queue(maxsize=depth)
+    stopped = threading.Event()
+
+    def put(item):
+        # waits for room in the queue unless the reader is stopped. returns False when it was stopped
+        while not stopped.is_set():
+            try:
+                frames.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for block in blocks:
+                if not put((True, block)):
+                    return
+            put((False, None))
+        except Exception as e:
+            put((False, e))  # handed to the caller
+
+    reader = threading.Thread(target=produce, daemon=True)
+    reader.start()
+    try:
+        while True:
+            is_block, item = frames.get()
+            if not is_block:
+                if item is not None:
+                    raise item
+                break
+            yield item
+    finally:
+        stopped.set()
+        reader.join()
+
+
+def _read_sequential(filename, parts, stop=None):
+    """
+    reads frames from the top of the file one block of (parts + 2) lines at a time.
+    """
+    frame_length = parts + 2
+
+    with open(filename, 'rb') as fp:
+        for i in itertools.count():
+            if stop is not None and i >= stop:
+                break
+            frame = list(itertools.islice(fp, frame_length))
+            if len(frame) < frame_length or not frame[-1].endswith(b"\n"):
+                break  # end of file or a partial frame, possibly with its last line still being written
+            yield b"".join(frame[2:])
+
+
+def count_frames(filename, parts=None):
+    """
+    returns the number of complete frames in the file. builds the offset index if there isn't one yet.
+    """
+    sidecar = frame_cache.open_sidecar(filename)
+    if sidecar is not None:
+        return sidecar[0].shape[0]
+    if compressed_frames.compression(filename) is not None:
+        if parts is None:
+            parts, _ = read_header(filename)
+        return compressed_frames.count_frames(filename, parts)
+    return frame_index.frame_offsets(filename, parts).shape[0] - 1
+
+
+def z_profile(z_values, bin_length, total_bins):
+    """
+    histograms z values into total_bins bins of length bin_length. bin 0 starts at z = 0. raises ValueError for
+    a z value past the last bin (see kernels.z_histogram).
+    """
+    return kernels.z_histogram(z_values, bin_length, total_bins)
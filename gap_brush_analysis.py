@@ -1,7 +1,43 @@
+import itertools
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
 import matplotlib
 import matplotlib.pyplot as plt
 import reverseread
+import frame_reader
+import frame_cache
+import frame_index
+import pair_distances
+import voxel_io
+import result_cache
+import kernels
+
+# periodic axes of the two regions. the brush wraps around the box in x and y. the gap is a slab at the edge of the
+# box in x, so only y wraps around
+BRUSH_PERIODIC = (True, True, False)
+GAP_PERIODIC = (False, True, False)
+
+
+def RDP_bins(_system_dims):
+    """
+    1 unit wide RDP bin edges from 0 up to the half box minimum image cutoff of the brush (see
+    pair_distances.half_box_cutoff). the gap RDPs use the same bins so the two can be compared.
+    """
+    return np.arange(0, int(pair_distances.half_box_cutoff(_system_dims, BRUSH_PERIODIC)) + 1)
+
+
+def split_NPs(types, coords, border, _NPs):
+    """
+    splits the NPs of a frame into the ones over the brush (x < border) and the ones over the gap.
+    each array has _NPs rows. rows past the last NP stay zero so they never pass the z filters.
+    """
+    NP_coords = coords[types == 2]
+    in_brush = NP_coords[:, 0] < border
+    part_data_brush = np.zeros((_NPs, 3))
+    part_data_gap = np.zeros((_NPs, 3))
+    part_data_brush[:np.sum(in_brush)] = NP_coords[in_brush]
+    part_data_gap[:np.sum(~in_brush)] = NP_coords[~in_brush]
+    return part_data_brush, part_data_gap
 
 def calc_RDP(_filename,
              _system_dims,
@@ -10,43 +46,23 @@ def calc_RDP(_filename,
              _NPs,
              _poly_len):
 
-    part_data_brush = np.zeros((_NPs,3))
-    part_data_gap = np.zeros((_NPs, 3))
-
-    NPs_brush = 0
-    NPs_gap = 0
     border = _system_dims[0] - _gap
     height_array = np.zeros((2, int(_system_dims[2])+1 ))
     height_cum_array = np.zeros((2, int(_system_dims[2]) + 1))
 
     height_top_percentage = 1.0 - (1./float(_poly_len)*0.5) # this should give us half the end points of the polymers
 
-    # retrieve NP locations
-    with open(_filename, 'r') as fp:
-        for i, line in enumerate(fp):
-
-            if i < 2:
-                continue
-            split_line = line.strip().split("\t")  # split the file line into its components
-            if split_line[0] == '2':
-
-                if float(split_line[1]) < border :
-                    part_data_brush[NPs_brush,0] = float(split_line[1])
-                    part_data_brush[NPs_brush,1] = float(split_line[2])
-                    part_data_brush[NPs_brush,2] = float(split_line[3])
-                    NPs_brush += 1
-                else:
-                    part_data_gap[NPs_gap, 0] = float(split_line[1])
-                    part_data_gap[NPs_gap, 1] = float(split_line[2])
-                    part_data_gap[NPs_gap, 2] = float(split_line[3])
-                    NPs_gap += 1
-
-            if split_line[0] == '1':
-
-                if float(split_line[1]) < border:
-                    height_array[0, int(float(split_line[3]))] += 1
-                else:
-                    height_array[1, int(float(split_line[3]))] += 1
+    # retrieve NP locations. the file holds a single frame (e.g. last_frame.xyz)
+    types, coords = next(frame_reader.read_frames(_filename))
+
+    part_data_brush, part_data_gap = split_NPs(types, coords, border, _NPs)
+
+    poly_coords = coords[types == 1]
+    poly_in_brush = poly_coords[:, 0] < border
+    height_array[0, :] += np.bincount(poly_coords[poly_in_brush, 2].astype(np.int64),
+                                      minlength=height_array.shape[1])[:height_array.shape[1]]
+    height_array[1, :] += np.bincount(poly_coords[~poly_in_brush, 2].astype(np.int64),
+                                      minlength=height_array.shape[1])[:height_array.shape[1]]
 
     height_array[0, :] /= np.sum(height_array[0, :])
     height_array[1, :] /= np.sum(height_array[1, :])
@@ -64,67 +80,17 @@ def calc_RDP(_filename,
     filtered_brush = part_data_brush[((part_data_brush[:, 2] < index_brush) & (part_data_brush[:, 2] > 1))]
     filtered_gap = part_data_gap[((part_data_gap[:, 2] < index_gap) & (part_data_gap[:, 2] > 1))]
 
-    # now compute pairwise differences on this reduced array
-    ### section need to be redone to take into account PBCs
-    pairwise_brush_diff = filtered_brush[:, None, :] - filtered_brush[None, :, :]
-    pairwise_gap_diff = filtered_gap[:, None, :] - filtered_gap[None, :, :]
-
-    #adjust for PBC
-    threshold_x = _system_dims[0] / 2.0
-    threshold_y = _system_dims[1] / 2.0
-
-    #in the brush
-    # Work only on the x entry along the last axis
-    mask_x = pairwise_brush_diff[:, :, 0] > threshold_x  # shape (N, N)
-    # Apply subtraction where condition is met
-    pairwise_brush_diff[:, :, 0] = np.where(
-        mask_x,
-        _system_dims[0] - pairwise_brush_diff[:, :, 0],
-        pairwise_brush_diff[:, :, 0]
-    )
-
-    #in the brush
-    # Work only on the x entry along the last axis
-    mask_x = pairwise_brush_diff[:, :, 0] < -1.0*threshold_x  # shape (N, N)
-    # Apply subtraction where condition is met
-    pairwise_brush_diff[:, :, 0] = np.where(
-        mask_x,
-        _system_dims[0] + pairwise_brush_diff[:, :, 0],
-        pairwise_brush_diff[:, :, 0]
-    )
-
-    #in the brush
-    # Work only on the y entry along the last axis
-    mask_y = pairwise_brush_diff[:, :, 1] > threshold_y  # shape (N, N)
-    # Apply subtraction where condition is met
-    pairwise_brush_diff[:, :, 1] = np.where(
-        mask_y,
-        _system_dims[1] - pairwise_brush_diff[:, :, 1],
-        pairwise_brush_diff[:, :, 1]
-    )
-
-    #in the brush
-    # Work only on the y entry along the last axis
-    mask_y = pairwise_brush_diff[:, :, 1] < -1.0*threshold_y  # shape (N, N)
-    # Apply subtraction where condition is met
-    pairwise_brush_diff[:, :, 1] = np.where(
-        mask_y,
-        _system_dims[1] + pairwise_brush_diff[:, :, 1],
-        pairwise_brush_diff[:, :, 1]
-    )
-
-    brush_distances = np.linalg.norm(pairwise_brush_diff, axis=-1)
-    gap_distances = np.linalg.norm(pairwise_gap_diff, axis=-1)
-    ### end of section needing redo
-
-    brush_hist = np.histogram(brush_distances, bins=np.arange(0,int(_system_dims[0]+1)) )
-    gap_hist =  np.histogram(gap_distances, bins=np.arange(0,int(_system_dims[0]+1)) )
-
-    brush_hist_normalizer = [ 1.0/ ((x+1)**3 - x**3) for x in np.arange(0,int(_system_dims[0]))]
-    plt.plot(brush_hist[0][1:]*brush_hist_normalizer[1:])
-    plt.plot(brush_hist[0][1:] )
+    # histogram the NP pair distances without building the pairwise distance arrays (see pair_distances.py).
+    # each pair is counted from both sides like the pairwise arrays did
+    bins = RDP_bins(_system_dims)
+    brush_hist = 2 * pair_distances.pair_histogram(filtered_brush, bins, _system_dims, periodic=BRUSH_PERIODIC)
+    gap_hist = 2 * pair_distances.pair_histogram(filtered_gap, bins, _system_dims, periodic=GAP_PERIODIC)
+
+    brush_hist_normalizer = [ 1.0/ ((x+1)**3 - x**3) for x in np.arange(0,bins.shape[0] - 1)]
+    plt.plot(brush_hist[1:]*brush_hist_normalizer[1:])
+    plt.plot(brush_hist[1:] )
     plt.show()
-    plt.plot(gap_hist[0])
+    plt.plot(gap_hist)
     plt.show()
 
     return
@@ -135,119 +101,31 @@ def calc_2D_RDP(_filename,
              _NPs,
              _poly_len):
 
-    part_data_brush = np.zeros((_NPs,3))
-    part_data_gap = np.zeros((_NPs, 3))
-
-    NPs_brush = 0
-    NPs_gap = 0
     border = _system_dims[0] - _gap
     #height_array = np.zeros((2, int(_system_dims[2])+1 ))
     #height_cum_array = np.zeros((2, int(_system_dims[2]) + 1))
 
     #height_top_percentage = 1.0 - (1./float(_poly_len)*0.5) # this should give us half the end points of the polymers
 
-    # retrieve NP locations
-    with open(_filename, 'r') as fp:
-        for i, line in enumerate(fp):
+    # retrieve NP locations. the file holds a single frame (e.g. last_frame.xyz)
+    types, coords = next(frame_reader.read_frames(_filename))
 
-            if i < 2:
-                continue
-            split_line = line.strip().split("\t")  # split the file line into its components
-            if split_line[0] == '2':
+    part_data_brush, part_data_gap = split_NPs(types, coords, border, _NPs)
 
-                if float(split_line[1]) < border :
-                    part_data_brush[NPs_brush,0] = float(split_line[1])
-                    part_data_brush[NPs_brush,1] = float(split_line[2])
-                    part_data_brush[NPs_brush,2] = float(split_line[3])
-                    NPs_brush += 1
-                else:
-                    part_data_gap[NPs_gap, 0] = float(split_line[1])
-                    part_data_gap[NPs_gap, 1] = float(split_line[2])
-                    part_data_gap[NPs_gap, 2] = float(split_line[3])
-                    NPs_gap += 1
+    # histogram the NP pair distances in every z layer without building the pairwise distance arrays
+    bins = RDP_bins(_system_dims)
+    NPC_brush, brush_hists = layer_pair_histograms(part_data_brush[None], int(_system_dims[2]), bins, _system_dims,
+                                                   BRUSH_PERIODIC)
+    NPC_gap, gap_hists = layer_pair_histograms(part_data_gap[None], int(_system_dims[2]), bins, _system_dims,
+                                               GAP_PERIODIC)
 
-    # cycle through the z axis
-
-    # filter rows where the Z component < threshold "particles in the brush"
-    #filtered_brush = part_data_brush[((part_data_brush[:, 2] < index_brush) & (part_data_brush[:, 2] > 1))]
-    filtered_brush = [part_data_brush[((part_data_brush[:, 2] > z) & (part_data_brush[:, 2] < (z+1) ) )]
-                      for z in range(_system_dims[2])]
-#good to right here
-    #filtered_gap = part_data_gap[((part_data_gap[:, 2] < index_gap) & (part_data_gap[:, 2] > 1))]
-    filtered_gap =   [part_data_gap[((part_data_gap[:, 2] > z) & (part_data_gap[:, 2] < (z+1) ) )]
-                    for z in range(_system_dims[2])]
-
-    # now compute pairwise differences on this reduced array
-    ### section need to be redone to take into account PBCs
-    #pairwise_brush_diff = filtered_brush[:, None, :] - filtered_brush[None, :, :]
-    pairwise_brush_diff = [ filtered_brush_layer[:, None, :] - filtered_brush_layer[None, :, :]
-        for filtered_brush_layer in filtered_brush]
-    pairwise_gap_diff   = [filtered_gap_layer[:, None, :] - filtered_gap_layer[None, :, :]
-        for filtered_gap_layer in filtered_gap]
-
-    #adjust for PBC
-    threshold_x = _system_dims[0] / 2.0
-    threshold_y = _system_dims[1] / 2.0
-
-    for i in range(len(pairwise_brush_diff)):
-        #in the brush
-        # Work only on the x entry along the last axis
-        mask_x = pairwise_brush_diff[i][:, :, 0] > threshold_x  # shape (N, N)
-        # Apply subtraction where condition is met
-        pairwise_brush_diff[i][:, :, 0] = np.where(
-            mask_x,
-            _system_dims[0] - pairwise_brush_diff[i][:, :, 0],
-            pairwise_brush_diff[i][:, :, 0]
-        )
-
-        #in the brush
-        # Work only on the x entry along the last axis
-        mask_x = pairwise_brush_diff[i][:, :, 0] < -1.0*threshold_x  # shape (N, N)
-        # Apply subtraction where condition is met
-        pairwise_brush_diff[i][:, :, 0] = np.where(
-            mask_x,
-            _system_dims[0] + pairwise_brush_diff[i][:, :, 0],
-            pairwise_brush_diff[i][:, :, 0]
-        )
-
-        #in the brush
-        # Work only on the y entry along the last axis
-        mask_y = pairwise_brush_diff[i][:, :, 1] > threshold_y  # shape (N, N)
-        # Apply subtraction where condition is met
-        pairwise_brush_diff[i][:, :, 1] = np.where(
-            mask_y,
-            _system_dims[1] - pairwise_brush_diff[i][:, :, 1],
-            pairwise_brush_diff[i][:, :, 1]
-        )
-
-        #in the brush
-        # Work only on the y entry along the last axis
-        mask_y = pairwise_brush_diff[i][:, :, 1] < -1.0*threshold_y  # shape (N, N)
-        # Apply subtraction where condition is met
-        pairwise_brush_diff[i][:, :, 1] = np.where(
-            mask_y,
-            _system_dims[1] + pairwise_brush_diff[i][:, :, 1],
-            pairwise_brush_diff[i][:, :, 1]
-        )
-
-    brush_distances = [np.linalg.norm(pairwise_brush_diff_layer, axis=-1)
-                       for pairwise_brush_diff_layer in pairwise_brush_diff]
-    gap_distances = [np.linalg.norm(pairwise_gap_diff_layer, axis=-1)
-                     for pairwise_gap_diff_layer in pairwise_gap_diff]
-    ### end of section needing redo
-
-    brush_hists = [np.histogram(brush_distances_layer, bins=np.arange(0,int(_system_dims[0]+1)) )
-                  for brush_distances_layer in brush_distances]
-    gap_hists =  [np.histogram(gap_distances_layer, bins=np.arange(0,int(_system_dims[0]+1)) )
-                 for gap_distances_layer in gap_distances]
-
-    brush_hist_normalizer = [ 1.0/ ((x+1)**2 - x**2) for x in np.arange(0,int(_system_dims[0]))]
+    brush_hist_normalizer = [ 1.0/ ((x+1)**2 - x**2) for x in np.arange(0,bins.shape[0] - 1)]
 
     #note that gap hist normalization needs to account for the fact that the circles aren't completely in the gap
-    gap_hist_normalizer = [1.0 / ((x + 1) ** 2 - x ** 2) for x in np.arange(0, int(_system_dims[0]))]
+    gap_hist_normalizer = [1.0 / ((x + 1) ** 2 - x ** 2) for x in np.arange(0, bins.shape[0] - 1)]
 
-    normed_brush = [brush_hist[0][1:]*brush_hist_normalizer[1:] for brush_hist in brush_hists]
-    normed_gap = [gap_hist[0][1:] * gap_hist_normalizer[1:] for gap_hist in gap_hists]
+    normed_brush = [brush_hist[1:]*brush_hist_normalizer[1:] for brush_hist in brush_hists]
+    normed_gap = [gap_hist[1:] * gap_hist_normalizer[1:] for gap_hist in gap_hists]
 
     # plt.plot(normed_brush[5])
     # plt.show()
@@ -255,164 +133,170 @@ def calc_2D_RDP(_filename,
     return normed_brush, normed_gap
 
 
+def last_NP_frames(_filename, _frames, border, _NPs):
+    """
+    Generator that yields (part_data_brush, part_data_gap) for the last _frames frames of the file, newest first.
+    the frames come from the binary sidecar or the offset index when there is one, otherwise the file is read backward.
+    """
+    sidecar = frame_cache.open_sidecar(_filename)
+    if sidecar is not None:
+        types, coords = sidecar
+        for i in range(types.shape[0] - 1, max(types.shape[0] - _frames, 0) - 1, -1):
+            yield split_NPs(types[i], coords[i], border, _NPs)
+        return
+
+    if frame_index.has_index(_filename):
+        # seek straight to the last frames, newest first
+        for types, coords in frame_reader.read_frames(_filename, start=-1, stop=-_frames - 1, step=-1):
+            yield split_NPs(types, coords, border, _NPs)
+        return
+
+    # otherwise the file is memory mapped and read backward from the end
+    for types, coords in reverseread.read_frames_from_end(_filename, frames=_frames):
+        yield split_NPs(types, coords, border, _NPs)
+
+
+def layer_pair_histograms(part_frames, _layers, bins, _system_dims, periodic):
+    """
+    sorts the NPs of a stack of frames (shape (frames, NPs, 3)) into 1 unit thick z layers in a single pass and
+    histograms the pair distances within each layer of each frame (see pair_distances.grouped_pair_histogram).
+    returns the NP count and the pair histogram of every layer, both summed over the frames. pairs are counted
+    from both sides like the full pairwise difference arrays did.
+    an NP exactly on a layer boundary (or a zero padding row) isn't in any layer.
+    """
+    z = part_frames[..., 2]
+    layer = np.floor(z).astype(np.int64)
+    keep = (z > layer) & (layer >= 0) & (layer < _layers)
+    frame = np.nonzero(keep)[0]
+    layer = layer[keep]
+
+    NPC = np.bincount(layer, minlength=_layers)
+    # pairs are only made inside a layer of a single frame
+    hists = pair_distances.grouped_pair_histogram(part_frames[keep], frame * _layers + layer, bins, _system_dims,
+                                                  periodic, n_groups=part_frames.shape[0] * _layers)
+    hists = hists.reshape(part_frames.shape[0], _layers, -1).sum(axis=0)
+    return NPC, 2 * hists
+
+
 def calc_2D_avg_RDP(_filename,
              _system_dims,
              #_parts,
              _gap,
              _NPs,
-             _poly_len):
-
-    processed = 0
-    part_data_brush = np.zeros((_NPs,3))
-    part_data_gap = np.zeros((_NPs, 3))
+             _poly_len,
+             _chunk_frames=20,
+             _progress=None,     # called with (frames done, total frames) after every chunk
+             _cancelled=None):   # returns True to stop early, calc_2D_avg_RDP then returns None
 
-    NPs_brush = 0
-    NPs_gap = 0
-    border = _system_dims[0] - _gap
+    total_frames = 200
     #height_array = np.zeros((2, int(_system_dims[2])+1 ))
     #height_cum_array = np.zeros((2, int(_system_dims[2]) + 1))
 
     #height_top_percentage = 1.0 - (1./float(_poly_len)*0.5) # this should give us half the end points of the polymers
 
-    frame_lines = 0
-    with open(_filename, 'r') as fp:
-        frame_lines = int(fp.readline()) + 2
-    avg_RDP_brush = None
-    avg_RDP_gap = None
-    concentration = None
-
-    # retrieve NP locations
-    for chunk in reverseread.read_from_end(_filename, frame_lines):
-
-        if processed == 200: # hard coded to 20% of the sim
-            break
-        part_data_brush = np.zeros((_NPs, 3))
-        part_data_gap = np.zeros((_NPs, 3))
-        NPs_brush = 0
-        NPs_gap = 0
-
-
-        for i, line in enumerate(chunk):
-
-            if i < 2:
-                continue
-            split_line = line.strip().split("\t")  # split the file line into its components
-            if split_line[0] == '2':
-
-                if float(split_line[1]) < border :
-                    part_data_brush[NPs_brush,0] = float(split_line[1])
-                    part_data_brush[NPs_brush,1] = float(split_line[2])
-                    part_data_brush[NPs_brush,2] = float(split_line[3])
-                    NPs_brush += 1
-                else:
-                    part_data_gap[NPs_gap, 0] = float(split_line[1])
-                    part_data_gap[NPs_gap, 1] = float(split_line[2])
-                    part_data_gap[NPs_gap, 2] = float(split_line[3])
-                    NPs_gap += 1
-
-        # cycle through the z axis
-
-        # filter rows where the Z component < threshold "particles in the brush"
-        #filtered_brush = part_data_brush[((part_data_brush[:, 2] < index_brush) & (part_data_brush[:, 2] > 1))]
-        filtered_brush = [part_data_brush[((part_data_brush[:, 2] > z) & (part_data_brush[:, 2] < (z+1) ) )]
-                          for z in range(_system_dims[2])]
-        NPC_brush = np.asarray([ a.shape[0] for a in filtered_brush])
-
-        #good to right here
-        #filtered_gap = part_data_gap[((part_data_gap[:, 2] < index_gap) & (part_data_gap[:, 2] > 1))]
-        filtered_gap =   [part_data_gap[((part_data_gap[:, 2] > z) & (part_data_gap[:, 2] < (z+1) ) )]
-                        for z in range(_system_dims[2])]
-        NPC_gap = np.asarray([a.shape[0] for a in filtered_gap])
-        # now compute pairwise differences on this reduced array
-
-        #pairwise_brush_diff = filtered_brush[:, None, :] - filtered_brush[None, :, :]
-        pairwise_brush_diff = [ filtered_brush_layer[:, None, :] - filtered_brush_layer[None, :, :]
-            for filtered_brush_layer in filtered_brush]
-        pairwise_gap_diff   = [filtered_gap_layer[:, None, :] - filtered_gap_layer[None, :, :]
-            for filtered_gap_layer in filtered_gap]
-
-        #adjust for PBC
-        threshold_x = _system_dims[0] / 2.0
-        threshold_y = _system_dims[1] / 2.0
-
-        for i in range(len(pairwise_brush_diff)):
-            #in the brush
-            # Work only on the x entry along the last axis
-            mask_x = pairwise_brush_diff[i][:, :, 0] > threshold_x  # shape (N, N)
-            # Apply subtraction where condition is met
-            pairwise_brush_diff[i][:, :, 0] = np.where(
-                mask_x,
-                _system_dims[0] - pairwise_brush_diff[i][:, :, 0],
-                pairwise_brush_diff[i][:, :, 0]
-            )
-
-            #in the brush
-            # Work only on the x entry along the last axis
-            mask_x = pairwise_brush_diff[i][:, :, 0] < -1.0*threshold_x  # shape (N, N)
-            # Apply subtraction where condition is met
-            pairwise_brush_diff[i][:, :, 0] = np.where(
-                mask_x,
-                _system_dims[0] + pairwise_brush_diff[i][:, :, 0],
-                pairwise_brush_diff[i][:, :, 0]
-            )
-
-            #in the brush
-            # Work only on the y entry along the last axis
-            mask_y = pairwise_brush_diff[i][:, :, 1] > threshold_y  # shape (N, N)
-            # Apply subtraction where condition is met
-            pairwise_brush_diff[i][:, :, 1] = np.where(
-                mask_y,
-                _system_dims[1] - pairwise_brush_diff[i][:, :, 1],
-                pairwise_brush_diff[i][:, :, 1]
-            )
-
-            #in the brush
-            # Work only on the y entry along the last axis
-            mask_y = pairwise_brush_diff[i][:, :, 1] < -1.0*threshold_y  # shape (N, N)
-            # Apply subtraction where condition is met
-            pairwise_brush_diff[i][:, :, 1] = np.where(
-                mask_y,
-                _system_dims[1] + pairwise_brush_diff[i][:, :, 1],
-                pairwise_brush_diff[i][:, :, 1]
-            )
-
-        brush_distances = [np.linalg.norm(pairwise_brush_diff_layer, axis=-1)
-                           for pairwise_brush_diff_layer in pairwise_brush_diff]
-        gap_distances = [np.linalg.norm(pairwise_gap_diff_layer, axis=-1)
-                         for pairwise_gap_diff_layer in pairwise_gap_diff]
-        ### end of section needing redo
-
-        brush_hists = [np.histogram(brush_distances_layer, bins=np.arange(0,int(_system_dims[0]+1)) )
-                      for brush_distances_layer in brush_distances]
-        gap_hists =  [np.histogram(gap_distances_layer, bins=np.arange(0,int(_system_dims[0]+1)) )
-                     for gap_distances_layer in gap_distances]
-
-        brush_hist_normalizer = [ 1.0/ ((x+1)**2 - x**2) for x in np.arange(0,int(_system_dims[0]))]
+    rdp = RDPAnalysis(_system_dims, _gap, _NPs, _total_frames=total_frames, _chunk_frames=_chunk_frames)
+
+    # retrieve NP locations. frames are handled _chunk_frames at a time so the numpy calls are shared by the chunk
+    frames = last_NP_frames(_filename, total_frames, rdp.Border, _NPs) # hard coded to 20% of the sim
+    for chunk in iter(lambda: list(itertools.islice(frames, _chunk_frames)), []):
+        if _cancelled is not None and _cancelled():
+            return None
+        rdp.add_chunk(chunk)
+        if _progress is not None:
+            _progress(rdp.Processed, total_frames)
+
+    return rdp.result()
+
+
+class RDPAnalysis():
+    """
+    calc_2D_avg_RDP fed one frame at a time (see frame_broadcast.py). the _total_frames frames from _start on are
+    split into brush and gap NPs and histogrammed _chunk_frames at a time. calc_2D_avg_RDP averages the last 200
+    frames, i.e. _start is the number of frames minus 200.
+    """
+
+    def __init__(self, _system_dims, _gap, _NPs, _start=0, _total_frames=200, _chunk_frames=20):
+        self.Start = _start
+        self.SystemDims = _system_dims
+        self.NPs = _NPs
+        self.Border = _system_dims[0] - _gap
+        self.TotalFrames = _total_frames
+        self.ChunkFrames = _chunk_frames
+        self.Layers = int(_system_dims[2])
+        self.Bins = RDP_bins(_system_dims)
+        self.HistBrush = np.zeros((self.Layers, self.Bins.shape[0] - 1))
+        self.HistGap = np.zeros((self.Layers, self.Bins.shape[0] - 1))
+        self.Concentration = np.zeros(self.Layers)
+        self.Processed = 0
+        self.Chunk = []  # split frames waiting for a full chunk
+
+    def add(self, frame, types, coords):
+        if frame >= self.Start + self.TotalFrames:
+            return
+        self.Chunk.append(split_NPs(types, coords, self.Border, self.NPs))
+        if len(self.Chunk) == self.ChunkFrames:
+            self.add_chunk(self.Chunk)
+            self.Chunk = []
+
+    def add_chunk(self, chunk):
+        """
+        histograms a list of (part_data_brush, part_data_gap) frames (see split_NPs).
+        """
+        brush_frames = np.stack([part_data_brush for part_data_brush, part_data_gap in chunk])
+        gap_frames = np.stack([part_data_gap for part_data_brush, part_data_gap in chunk])
+
+        # histogram the NP pair distances in every z layer without building the pairwise distance arrays
+        NPC_brush, brush_hists = layer_pair_histograms(brush_frames, self.Layers, self.Bins, self.SystemDims,
+                                                       BRUSH_PERIODIC)
+        NPC_gap, gap_hists = layer_pair_histograms(gap_frames, self.Layers, self.Bins, self.SystemDims,
+                                                   GAP_PERIODIC)
+
+        self.HistBrush += brush_hists
+        self.HistGap += gap_hists
+        self.Concentration += NPC_gap + NPC_brush
+        self.Processed += len(chunk)
+
+    def result(self):
+        if self.Chunk:
+            self.add_chunk(self.Chunk)
+            self.Chunk = []
+        if self.Processed == 0:
+            raise ValueError("no frames were added to average the RDPs over")
+        _system_dims = self.SystemDims
+        brush_hist_normalizer = np.asarray([ 1.0/ ((x+1)**2 - x**2) for x in np.arange(0,self.Bins.shape[0] - 1)])
 
         #note that gap hist normalization needs to account for the fact that the circles aren't completely in the gap
-        gap_hist_normalizer = [1.0 / ((x + 1) ** 2 - x ** 2) for x in np.arange(0, int(_system_dims[0]))]
-
-        normed_brush = [brush_hist[0][1:]*brush_hist_normalizer[1:] for brush_hist in brush_hists]
-        normed_gap = [gap_hist[0][1:] * gap_hist_normalizer[1:] for gap_hist in gap_hists]
+        gap_hist_normalizer = np.asarray([1.0 / ((x + 1) ** 2 - x ** 2) for x in np.arange(0, self.Bins.shape[0] - 1)])
 
-        if avg_RDP_gap is None:
-            avg_RDP_gap = np.zeros(np.asarray(normed_gap).shape)
-        if avg_RDP_brush is None:
-            avg_RDP_brush = np.zeros(np.asarray(normed_brush).shape)
+        avg_RDP_brush = self.HistBrush[:, 1:] * brush_hist_normalizer[1:]
+        avg_RDP_gap = self.HistGap[:, 1:] * gap_hist_normalizer[1:]
 
-        if concentration is None:
-            concentration = np.zeros(NPC_brush.shape)
+        # plt.plot(normed_brush[5])
+        # plt.show()
 
-        avg_RDP_brush += np.asarray(normed_brush)
-        avg_RDP_gap += np.asarray(normed_gap)
-        concentration += NPC_gap + NPC_brush
-        processed += 1
+        #return normed_brush, normed_gap
+        return (avg_RDP_brush/float(self.Processed), avg_RDP_gap/float(self.Processed),
+                self.Concentration/_system_dims[0]/_system_dims[1]/float(self.TotalFrames))
 
-    # plt.plot(normed_brush[5])
-    # plt.show()
 
-    #return normed_brush, normed_gap
-    return avg_RDP_brush/float(processed), avg_RDP_gap/float(processed), concentration/_system_dims[0]/_system_dims[1]/200.0
+def cached_2D_avg_RDP(_filename,
+             _system_dims,
+             _gap,
+             _NPs,
+             _poly_len,
+             _progress=None,
+             _cancelled=None,
+             _cache_dir=None):   # see result_cache.py, by default the shared result cache
+    """
+    calc_2D_avg_RDP, reusing the result of an earlier call on the same trajectory with the same arguments.
+    """
+    args = [float(x) for x in _system_dims[:3]] + [float(_gap), int(_NPs), float(_poly_len)]
+    # the RDPs stop at the half box cutoff, so results cached when they ran to the full box length are not reused
+    return result_cache.memoize(
+        _filename, "calc_2D_avg_RDP_half_box", args, ("avg_RDP_brush", "avg_RDP_gap", "concentration"),
+        lambda: calc_2D_avg_RDP(_filename, _system_dims, _gap, _NPs, _poly_len,
+                                _progress=_progress, _cancelled=_cancelled),
+        cache_dir=_cache_dir)
 
 
 def build_density_voxels(filename,
@@ -421,78 +305,119 @@ def build_density_voxels(filename,
                      system_dimensions,
                      unit_voxel = [1.0, 1.0, 1.0],
                      save_to_dir=False,
-                     dir_base=""):
+                     dir_base="",
+                     workers=1,     # worker processes, each bins a chunk of the post warmup frames
+                     save_format="dat"):  # "dat" for the dense voxel_data.dat, "npz" for voxel_data.npz (see voxel_io.py)
     eps = 0.0001
-    unit_voxel[0] = system_dimensions[0] / float(int(system_dimensions[0]))
-    unit_voxel[1] = system_dimensions[1] / float(int(system_dimensions[1]))
-    unit_voxel[2] = system_dimensions[2] / float(int(system_dimensions[2]))
+    grid_unit, voxel_array_dims = voxel_grid(system_dimensions)
+    unit_voxel[0], unit_voxel[1], unit_voxel[2] = grid_unit
 
     print("particles\t", parts)
-    # a note about the np.round: since we are dividing the array into an integer number in each direction.
-    # the floating point division can go either a little above or a little below the correct
-    # value 120.0000000001 or 199.999999999 so the rounding helps make sure we have the right number.
-    voxel_array_dims = (int( np.round( system_dimensions[0]/unit_voxel[0])) ,
-                        int( np.round( system_dimensions[1]/unit_voxel[1])) ,
-                        int( np.round( system_dimensions[2]/unit_voxel[2])),
-                        2)
     error = True
 
     voxel_array = np.zeros(voxel_array_dims)
 
     #warmup is effectively the number of frames to skip in the simulation waiting for equilibrium
-    warmup = int((100000/100*(parts+2)) * equil_percent)
+    warmup = int(100000/100 * equil_percent)
     print("Warmup \t", warmup)
-    postwarmup = 0
 
+    if workers > 1:
+        # split the post warmup frames into chunks. the chunks seek to their first frame with the offset index and
+        # the partial voxel arrays are summed
+        frames = frame_reader.count_frames(filename, parts)
+        bounds = np.linspace(warmup, max(frames, warmup), workers * 4 + 1).astype(np.int64)
+        chunks = [(start, stop) for start, stop in zip(bounds[:-1], bounds[1:]) if stop > start]
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = [pool.submit(voxel_chunk, filename, parts, int(start), int(stop), system_dimensions, unit_voxel,
+                                   voxel_array_dims, eps) for start, stop in chunks]
+            results = [result.result() for result in results]
+    else:
+        # the warmup frames are skipped by seeking with the frame offset index, they are never read
+        results = [voxel_chunk(filename, parts, warmup, None, system_dimensions, unit_voxel, voxel_array_dims, eps)]
+
+    postwarmup = 0 # counts number of postwarmup frames
     oob = 0
-
-    last_line = 0
-    with open(filename, 'r') as fp:
-        for i, line in enumerate(fp):
-            last_line = i
-            if i < warmup:
-                continue
-            split_line = line.strip().split("\t")  # split the file line into its components
-
-            # there is a line for each particle plus a line for the number of particles and name of experiment.
-            # that's why we have (parts+2) in each frame. that means each frame can be indexed by i % (parts + 2)
-            if i % (parts + 2) == 0:
-                postwarmup += 1 # counts number of postwarmup frames
-                if i == 0: # first line is header info
-                    continue
-
-            # process record
-            if  split_line[0] == '1' or \
-                split_line[0] == '2' :  # spilt_line[0] will always exist even on break lines with the number of particles and name of exp.
-                x = int(float(split_line[1])/unit_voxel[0])
-                y = int(float(split_line[2])/unit_voxel[1])
-                z = int(float(split_line[3])/unit_voxel[2])
-                p = int(split_line[0]) - 1 # indexing particle type 0 = monomer, 1 = NP
-                if float(split_line[1]) > system_dimensions[0]:
-                    x  = int( ( float(split_line[1]) - system_dimensions[0])/unit_voxel[0])
-                    oob += 1
-                if float(split_line[2]) > system_dimensions[1]:
-                    y  = int( ( float(split_line[2]) - system_dimensions[1])/unit_voxel[1])
-                    oob += 1
-                if float(split_line[3]) > system_dimensions[2]:
-                    z = int( ( float(split_line[3]) - eps)/unit_voxel[2])
-                    oob += 1
-                try:
-                    voxel_array[x][y][z][p] += 1
-                except Exception as e:
-                    print (e)
-                    print ("x ",x,"\ty ",y,"\tz ",z)
-                    print (system_dimensions)
-                    print(voxel_array.shape)
-
-        print("last line: {}".format(last_line))
-        print("oob: {}".format(oob))
-
-        if (save_to_dir):
-            with open(dir_base + "/voxel_data.dat", 'wb') as fp:
-                np.save(fp, 1.0 / np.float32(postwarmup) * voxel_array) # division gives the postwarmup per frame average
-
-        if postwarmup >= (100000/100 - warmup):
-            error = False
-        print("processed data", postwarmup)
-        return voxel_array, error
+    dropped = 0
+    for chunk_voxels, chunk_frames, chunk_oob, chunk_dropped in results:
+        voxel_array += chunk_voxels
+        postwarmup += chunk_frames
+        oob += chunk_oob
+        dropped += chunk_dropped
+
+    print("last frame: {}".format(warmup + postwarmup))
+    print("oob: {}".format(oob))
+    if dropped > 0:
+        print("particles outside of the voxel array: {}".format(dropped))
+
+    if (save_to_dir and save_format == "npz"):
+        voxel_io.save_voxels(dir_base + "/voxel_data.npz", 1.0 / np.float32(postwarmup) * voxel_array)
+    elif (save_to_dir):
+        with open(dir_base + "/voxel_data.dat", 'wb') as fp:
+            np.save(fp, 1.0 / np.float32(postwarmup) * voxel_array) # division gives the postwarmup per frame average
+
+    if postwarmup >= (100000/100 - warmup):
+        error = False
+    print("processed data", postwarmup)
+    return voxel_array, error
+
+
+def voxel_chunk(filename, parts, start, stop, system_dimensions, unit_voxel, voxel_array_dims, eps=0.0001):
+    """
+    bins the frames [start, stop) of a frame file into one voxel array. runs in a worker process for
+    build_density_voxels. returns the voxel counts, the number of frames and the oob and dropped particle counts.
+    """
+    voxels = VoxelAnalysis(system_dimensions, unit_voxel, voxel_array_dims, start, stop, eps)
+    for frame, (types, coords) in enumerate(frame_reader.read_frames(filename, parts, start=start, stop=stop), start):
+        voxels.add(frame, types, coords)
+    return voxels.result()
+
+
+def voxel_grid(system_dimensions):
+    """
+    returns the unit voxel, as close to 1 x 1 x 1 as fits a whole number of voxels in the box, and the shape of the
+    voxel array (one monomer and one NP count per voxel).
+    """
+    unit_voxel = [system_dimensions[0] / float(int(system_dimensions[0])),
+                  system_dimensions[1] / float(int(system_dimensions[1])),
+                  system_dimensions[2] / float(int(system_dimensions[2]))]
+    # a note about the np.round: since we are dividing the array into an integer number in each direction.
+    # the floating point division can go either a little above or a little below the correct
+    # value 120.0000000001 or 199.999999999 so the rounding helps make sure we have the right number.
+    voxel_array_dims = (int( np.round( system_dimensions[0]/unit_voxel[0])) ,
+                        int( np.round( system_dimensions[1]/unit_voxel[1])) ,
+                        int( np.round( system_dimensions[2]/unit_voxel[2])),
+                        2)
+    return unit_voxel, voxel_array_dims
+
+
+class VoxelAnalysis():
+    """
+    voxel_chunk fed one frame at a time (see frame_broadcast.py). bins the frames in [start, stop) and returns the
+    same (voxel counts, frames, oob, dropped). the grid defaults to voxel_grid(system_dimensions).
+    """
+
+    def __init__(self, system_dimensions, unit_voxel=None, voxel_array_dims=None, start=0, stop=None, eps=0.0001):
+        if unit_voxel is None or voxel_array_dims is None:
+            unit_voxel, voxel_array_dims = voxel_grid(system_dimensions)
+        self.Start = start
+        self.Stop = stop
+        self.SystemDimensions = system_dimensions
+        self.UnitVoxel = unit_voxel
+        self.Eps = eps
+        self.Voxels = np.zeros(voxel_array_dims, dtype=np.int64)
+        self.Frames = 0
+        self.OOB = 0
+        self.Dropped = 0
+
+    def add(self, frame, types, coords):
+        if self.Stop is not None and frame >= self.Stop:
+            return
+        # the frame is added straight into the voxels
+        frame_oob, frame_dropped = kernels.add_voxels(self.Voxels, types, coords, self.SystemDimensions,
+                                                      self.UnitVoxel, self.Eps)
+        self.Frames += 1
+        self.OOB += frame_oob
+        self.Dropped += frame_dropped
+
+    def result(self):
+        return self.Voxels, self.Frames, self.OOB, self.Dropped
@@ -4,6 +4,8 @@ import os
 import sys
 from ComputationalEquilibriums import ReferenceDistribution
 import numpy as np
+import campaign
+import catalog
 
 from matplotlib import pyplot as plt
 
@@ -18,98 +20,99 @@ base_dir = "/scratch/chdavis/exp_2_e/NP_BRUSH"
 #base_dir = "/scratch/chdavis/exp_2_f/NP_BRUSH"
 #base_dir = "/scratch/chdavis"
 #comment that can be undone
+workers = None # worker processes, None uses the whole allocation (see campaign.default_workers)
 
 dataset = {}
 bad_repos = []
 def read_dataset(bad_repos):
 # walk the data path to access the data sets. this is the main part of the code
-# for root, dirs, files in os.walk(base_dir):
+# the directories are found once and read in parallel, then the results are merged here
     dataset = {}
-    for root, dirs, files in os.walk(base_dir):
-        print(root, dirs)
-        error_list = {"no_files":[], "no_data":[]}
-        path = root.split(os.sep)
-        # check to make sure we aren't in a known bad directory
-        if len(root.split("/")) < 4:
+    summary = campaign.run_campaign(base_dir, read_sim, workers)
+    for root in sorted(summary["results"]):
+        keys, sim_data = summary["results"][root]
+        if sim_data is None:
+            #if the data was bad
+            bad_repos.append(root)
             continue
+        Umin, radius, sigma, num_NPs = keys
 
-        #check to make sure we aren't in a known bad directory
-        if ("35" in root.split("/")[-4]) or ("BRUSH" in root.split("/")[-1]):
-            #ignore the -.35 Umins because of the PBC issue in the Z direction
-            #ignore Brush because of the NP_Brush directory
-            continue
+        #add and dictionary componenets not already there
+        if str(Umin) not in dataset.keys():
+            dataset[str(Umin)] = {}
+        if str(radius) not in dataset[str(Umin)].keys():
+            dataset[str(Umin)][str(radius)] = {}
+        if str(sigma) not in dataset[str(Umin)][str(radius)].keys():
+            dataset[str(Umin)][str(radius)][str(sigma)] = {}
+        dataset[str(Umin)][str(radius)][str(sigma)][str(num_NPs)] = sim_data
 
-        #check to make sure you are in a directory with data.
-        if ("NP" in root.split("/")[-1]):
-            print("root " + root)
-            num_NPs = int(root.split("/")[-1].split("_")[-1])
-            print("num NPs", num_NPs)
+    for root, error in summary["errors"].items():
+        print("ERROR reading", root, error)
+        bad_repos.append(root)
 
-            dir_base = root
+    return dataset
 
+def read_sim(root, files):
+    """
+    reads the post processed data of one simulation directory.
+    returns ((Umin, radius, sigma, num_NPs), data) where data is None if the run was bad.
+    """
+    print("root " + root)
+    # the path values are read by name. relies on naming conventions from create_exp.sh
+    params = catalog.parse_path(root)
+    num_NPs = params["NP"]
+    print("num NPs", num_NPs)
 
-            # bins for z axis profiling
-            bin_length = 0.5  # this bin length is used to cut the system height into intervals for binning
-            total_bins = int(1000.0 / bin_length)  # 1000 is used because it is a sim max. i.e. the system can only have a height of 1000
-            #bin_values = np.asarray([x*bin_length  for x in range(total_bins)]) # z values for the bins
+    dir_base = root
 
-            system_dimensions = [0.0, 0.0, 0.0]  # default values that will be overwritten by file data
 
-            #retreive the path values we use as keys
-            Umin = float(dir_base.split("/")[-4].split("_")[-1])
-            sigma =  float(dir_base.split("/")[-2].split("_")[-1])
-            radius = float(dir_base.split("/")[-3].split("_")[-1])
+    # bins for z axis profiling
+    bin_length = 0.5  # this bin length is used to cut the system height into intervals for binning
+    total_bins = int(1000.0 / bin_length)  # 1000 is used because it is a sim max. i.e. the system can only have a height of 1000
+    #bin_values = np.asarray([x*bin_length  for x in range(total_bins)]) # z values for the bins
 
+    system_dimensions = [0.0, 0.0, 0.0]  # default values that will be overwritten by file data
 
-            #add and dictionary componenets not already there
-            if str(Umin) not in dataset.keys():
-                dataset[str(Umin)] = {}
-            if str(radius) not in dataset[str(Umin)].keys():
-                dataset[str(Umin)][str(radius)] = {}
-            if str(sigma) not in dataset[str(Umin)][str(radius)].keys():
-                dataset[str(Umin)][str(radius)][str(sigma)] = {}
-            if str(num_NPs) not in dataset[str(Umin)][str(radius)][str(sigma)].keys():
-                dataset[str(Umin)][str(radius)][str(sigma)][str(num_NPs)] = {}
+    #retreive the path values we use as keys
+    Umin = params["Umin"]
+    sigma = params["den"]
+    radius = params["rad"]
+    keys = (Umin, radius, sigma, num_NPs)
+    sim_data = {}
 
-            #read in the loading data
-            with open(dir_base + "/post/loading_brush.dat", 'r') as fp:
-                dataset[str(Umin)][str(radius)][str(sigma)][str(num_NPs)]["brush_height"] = float(fp.readline().replace("#", ""))
-                dataset[str(Umin)][str(radius)][str(sigma)][str(num_NPs)]["loading_brush"] = [x for i,x in enumerate(fp.readlines())]
+    #read in the loading data
+    with open(dir_base + "/post/loading_brush.dat", 'r') as fp:
+        sim_data["brush_height"] = float(fp.readline().replace("#", ""))
+        sim_data["loading_brush"] = [x for i,x in enumerate(fp.readlines())]
 
-            #if the data was bad
-            if dataset[str(Umin)][str(radius)][str(sigma)][str(num_NPs)]["brush_height"] < 1.0:
-                del dataset[str(Umin)][str(radius)][str(sigma)][str(num_NPs)]
-                bad_repos.append(root)
-                continue
+    #if the data was bad
+    if sim_data["brush_height"] < 1.0:
+        return keys, None
 
-            with open(dir_base + "/post/loading_solv.dat", 'r') as fp:
-                dataset[str(Umin)][str(radius)][str(sigma)][str(num_NPs)]["loading_solv"] = [x for i,x in enumerate(fp.readlines()) if i > 0]
+    with open(dir_base + "/post/loading_solv.dat", 'r') as fp:
+        sim_data["loading_solv"] = [x for i,x in enumerate(fp.readlines()) if i > 0]
 
-            # get information about the simulation
-            filecheck = [s for s in files if ".mpd" in s]
+    # get information about the simulation
+    filecheck = [s for s in files if ".mpd" in s]
 
-            filename = ""
-            if len(filecheck) == 1:
-                filename = filecheck[0]
-            else:
-                pass  # why is this else clause here?
-
-            system_dimensions = []
-            with open(dir_base + "/" + filename, 'r') as fp:
-                split_line = fp.readlines()[9].strip().split()
-                system_dimensions = [float(split_line[1]), float(split_line[2]), float(split_line[3])]
+    filename = ""
+    if len(filecheck) == 1:
+        filename = filecheck[0]
+    else:
+        pass  # why is this else clause here?
 
-            dataset[str(Umin)][str(radius)][str(sigma)][str(num_NPs)]["system_dimensions"] = system_dimensions
+    system_dimensions = catalog.read_mpd(dir_base + "/" + filename)[1]
 
-            # 1 NP movement changes for phi
-            dataset[str(Umin)][str(radius)][str(sigma)][str(num_NPs)]["brush_phi_unit"] =  4.0 / 3.0 * np.pi * radius * radius * radius / (
-                    system_dimensions[0]*system_dimensions[1]*(dataset[str(Umin)][str(radius)][str(sigma)][str(num_NPs)]["brush_height"] ))
-            dataset[str(Umin)][str(radius)][str(sigma)][str(num_NPs)]["solv_phi_unit"] = 4.0 / 3.0 * np.pi * radius * radius * radius / (
-                system_dimensions[0] * system_dimensions[1] * (system_dimensions[2] -
-                dataset[str(Umin)][str(radius)][str(sigma)][str(num_NPs)]["brush_height"]))
+    sim_data["system_dimensions"] = system_dimensions
 
+    # 1 NP movement changes for phi
+    sim_data["brush_phi_unit"] =  4.0 / 3.0 * np.pi * radius * radius * radius / (
+            system_dimensions[0]*system_dimensions[1]*(sim_data["brush_height"] ))
+    sim_data["solv_phi_unit"] = 4.0 / 3.0 * np.pi * radius * radius * radius / (
+        system_dimensions[0] * system_dimensions[1] * (system_dimensions[2] -
+        sim_data["brush_height"]))
 
-    return dataset
+    return keys, sim_data
 
 def build_concentration_graphs(_dataset):
         graphs = {}
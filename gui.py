@@ -1,5 +1,4 @@
 import sys
-import numpy as np
 import matplotlib.pyplot as plt
 import matplotlib.cm as cm
 from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
@@ -9,6 +8,7 @@ from PyQt5.QtWidgets import (
     QPushButton, QFileDialog, QSlider
 )
 from PyQt5.QtCore import Qt
+import voxel_io
 
 class DensityExplorer(QWidget):
     def __init__(self):
@@ -66,9 +66,9 @@ class DensityExplorer(QWidget):
         self.setLayout(layout)
 
     def load_file(self):
-        file_path, _ = QFileDialog.getOpenFileName(self, "Open .dat File", "", "dat files (*.dat)")
+        file_path, _ = QFileDialog.getOpenFileName(self, "Open .dat File", "", "voxel files (*.dat *.npz)")
         if file_path:
-            self.data = np.load(file_path)
+            self.data = voxel_io.load_voxels(file_path)
             if self.data.ndim != 4:
                 print("Invalid data shape. Must be 4D.")
                 return
@@ -16,6 +16,8 @@ from PyQt5.QtWidgets import (
 from PyQt5.QtCore import Qt
 
 import gap_brush_analysis
+import compressed_frames
+import voxel_io
 
 # ---------------- Constants ----------------
 VARS = ["Umin", "rad", "den", "gap", "len", "NP", "system x", "system y", "system z", "concentration at z"]
@@ -217,12 +219,12 @@ class DensityExplorer(QMainWindow):
     # ----------------------------- Load & Parse -----------------------------
     def _load_file(self, file_id: int):
         path, _ = QFileDialog.getOpenFileName(
-            self, "Open NumPy Array", "", "NumPy Arrays (*.npy *.dat);;All Files (*)"
+            self, "Open NumPy Array", "", "NumPy Arrays (*.npy *.dat *.npz);;All Files (*)"
         )
         if not path:
             return
         try:
-            arr = np.load(path, allow_pickle=False)
+            arr = voxel_io.load_voxels(path)
         except Exception as e:
             QMessageBox.critical(self, "Load Error", f"Could not load file:\n{e}")
             return
@@ -242,7 +244,9 @@ class DensityExplorer(QMainWindow):
         file_xyz_path_parent = Path(file_xyz_path.parent)
         ext = ".xyz"
 
-        files = list(file_xyz_path_parent.glob(f"frames_exp*{ext}"))
+        # the frames file may be compressed (see compressed_frames.py)
+        files = [f for f in sorted(file_xyz_path_parent.glob(f"frames_exp*{ext}*"))
+                 if compressed_frames.is_frames_name(f.name)]
         self.file_xyz_path[file_id] = str(files[0])
 
         vals = {v: 'missing' for v in VARS}
@@ -258,7 +262,7 @@ class DensityExplorer(QMainWindow):
         vals["system y"] = arr.shape[1]
         vals["system z"] = arr.shape[2]
 
-        self.RDPs[file_id]['brush'],self.RDPs[file_id]['gap'], self.concentrations[file_id]['brush'] = gap_brush_analysis.calc_2D_avg_RDP(self.file_xyz_path[file_id],
+        self.RDPs[file_id]['brush'],self.RDPs[file_id]['gap'], self.concentrations[file_id]['brush'] = gap_brush_analysis.cached_2D_avg_RDP(self.file_xyz_path[file_id],
                                                            arr.shape[:3],
                                                            int(vals['gap']),
                                                            int(vals['NP']),
@@ -352,7 +356,7 @@ class DensityExplorer(QMainWindow):
             return
 
         # Compute diff: File 2 − File 1
-        self.data['diff'] = d2 - d1
+        self.data['diff'] = np.asarray(d2) - np.asarray(d1)
 
         # Reset slice artists for diff (so we create once with cbar)
         self._reset_slice_artists('diff')
@@ -16,6 +16,8 @@ from PyQt5.QtWidgets import (
 from PyQt5.QtCore import Qt
 
 import gap_brush_analysis
+import compressed_frames
+import voxel_io
 
 # ---------------- Constants ----------------
 VARS = ["Umin", "rad", "den", "gap", "len", "NP", "system x", "system y", "system z", "concentration at z"]
@@ -200,12 +202,12 @@ class DensityExplorer(QMainWindow):
     # ---------------- load file ----------------
     def _load_file(self, file_id: int):
         path, _ = QFileDialog.getOpenFileName(
-            self, "Open NumPy Array", "", "NumPy Arrays (*.npy *.dat);;All Files (*)"
+            self, "Open NumPy Array", "", "NumPy Arrays (*.npy *.dat *.npz);;All Files (*)"
         )
         if not path:
             return
         try:
-            arr = np.load(path, allow_pickle=False)
+            arr = voxel_io.load_voxels(path)
         except Exception as e:
             QMessageBox.critical(self, "Load Error", f"Could not load file:\n{e}")
             return
@@ -224,7 +226,9 @@ class DensityExplorer(QMainWindow):
 
         file_xyz_path = Path(path)
         file_xyz_path_parent = Path(file_xyz_path.parent)
-        files = list(file_xyz_path_parent.glob("frames_exp*.xyz"))
+        # the frames file may be compressed (see compressed_frames.py)
+        files = [f for f in sorted(file_xyz_path_parent.glob("frames_exp*.xyz*"))
+                 if compressed_frames.is_frames_name(f.name)]
         self.file_xyz_path[file_id] = str(files[0])
 
         # parse variables
@@ -241,7 +245,7 @@ class DensityExplorer(QMainWindow):
 
         # compute RDP + concentration
         self.RDPs[file_id]['brush'], self.RDPs[file_id]['gap'], \
-        self.concentrations[file_id]['brush'] = gap_brush_analysis.calc_2D_avg_RDP(
+        self.concentrations[file_id]['brush'] = gap_brush_analysis.cached_2D_avg_RDP(
             self.file_xyz_path[file_id],
             arr.shape[:3],
             int(vals['gap']),
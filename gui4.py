@@ -13,17 +13,50 @@ from PyQt5.QtGui import QCursor
 from PyQt5.QtWidgets import (
     QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
     QPushButton, QFileDialog, QComboBox, QSlider, QLabel, QCheckBox,
-    QMessageBox, QSizePolicy, QStatusBar, QToolTip
+    QMessageBox, QSizePolicy, QStatusBar, QToolTip, QProgressBar
 )
-from PyQt5.QtCore import Qt
+from PyQt5.QtCore import Qt, QThread, pyqtSignal
 
 import gap_brush_analysis
+import compressed_frames
+import voxel_io
 
 # ---------------- Constants ----------------
 VARS = ["Umin", "rad", "den", "gap", "len", "NP", "system x", "system y", "system z", "concentration at z"]
 AXIS_MAP = {"X": 0, "Y": 1, "Z": 2}
 
 
+class RDPWorker(QThread):
+    """Computes the RDPs + concentration of a trajectory off the GUI thread.
+    Results of an earlier run on the same trajectory are reused (see result_cache.py).
+    """
+    progress = pyqtSignal(int, int)   # frames done, total frames
+    result = pyqtSignal(object)       # (avg RDP brush, avg RDP gap, concentration)
+    failed = pyqtSignal(str)
+
+    def __init__(self, xyz_path, dims, gap, NPs, poly_len, parent=None):
+        super().__init__(parent)
+        self.args = (xyz_path, dims, gap, NPs, poly_len)
+        self._cancel = False
+
+    def cancel(self):
+        # checked between chunks of frames, the thread stops at the next one
+        self._cancel = True
+
+    def run(self):
+        try:
+            res = gap_brush_analysis.cached_2D_avg_RDP(
+                *self.args,
+                _progress=self.progress.emit,
+                _cancelled=lambda: self._cancel
+            )
+        except Exception as e:
+            self.failed.emit(str(e))
+            return
+        if res is not None:
+            self.result.emit(res)
+
+
 class DensityExplorer(QMainWindow):
     """4D (X,Y,Z,T) density explorer for File 1 + File 2.
     Row 1: File 1 data
@@ -38,8 +71,12 @@ class DensityExplorer(QMainWindow):
         # status bar
         self.setStatusBar(QStatusBar(self))
 
-        # Data storage
+        # Data storage. the voxel grids are memory mapped (or lazily decompressed, see voxel_io.py)
         self.data = {1: None, 2: None}
+        # per type (x, y, z) axis projections of each grid, computed once when the file is loaded
+        self.projections = {1: None, 2: None}
+        # FFT magnitude of every z slice of each grid, cached on disk next to the voxel file
+        self.spectra = {1: None, 2: None}
         self.paths = {1: None, 2: None}
         self.last_frame_path = {1: None, 2: None}
         self.file_xyz_path = {1: None, 2: None}
@@ -54,6 +91,9 @@ class DensityExplorer(QMainWindow):
         self.colorbars    = {1: None, 2: None}
         self.RDPs = {1: {'brush': None, 'gap': None}, 2: {'brush': None, 'gap': None}}
         self.concentrations = {1: {'brush': None, 'gap': None}, 2: {'brush': None, 'gap': None}}
+        # background RDP computation per file, plus cancelled workers that haven't stopped yet
+        self.rdp_workers = {1: None, 2: None}
+        self.retired_workers = []
 
         self._build_ui()
 
@@ -271,6 +311,16 @@ class DensityExplorer(QMainWindow):
             sync_cb.stateChanged.connect(lambda state, fid=file_id: self._toggle_sync(fid, state))
             top.addWidget(sync_cb)
 
+        # RDP progress + cancel
+        rdp_progress = QProgressBar()
+        rdp_progress.setFormat("RDP %v/%m frames")
+        rdp_progress.setVisible(False)
+        top.addWidget(rdp_progress)
+        rdp_cancel = QPushButton("Cancel RDP")
+        rdp_cancel.clicked.connect(lambda: self._cancel_rdp(file_id))
+        rdp_cancel.setVisible(False)
+        top.addWidget(rdp_cancel)
+
         layout.addLayout(top)
 
         row['layout'] = layout
@@ -279,6 +329,8 @@ class DensityExplorer(QMainWindow):
         row['slider'] = slider
         row['sync_cb'] = sync_cb
         row['var_labels'] = var_labels
+        row['rdp_progress'] = rdp_progress
+        row['rdp_cancel'] = rdp_cancel
         return row
 
     # ---------------- blank plots ----------------
@@ -309,12 +361,12 @@ class DensityExplorer(QMainWindow):
     # ---------------- load file ----------------
     def _load_file(self, file_id: int):
         path, _ = QFileDialog.getOpenFileName(
-            self, "Open NumPy Array", "", "NumPy Arrays (*.npy *.dat);;All Files (*)"
+            self, "Open NumPy Array", "", "NumPy Arrays (*.npy *.dat *.npz);;All Files (*)"
         )
         if not path:
             return
         try:
-            arr = np.load(path, allow_pickle=False)
+            arr = voxel_io.load_voxels(path, mmap=True)
         except Exception as e:
             QMessageBox.critical(self, "Load Error", f"Could not load file:\n{e}")
             return
@@ -325,6 +377,9 @@ class DensityExplorer(QMainWindow):
 
         self.data[file_id] = arr
         self.paths[file_id] = path
+        # the summary plots only need these sums, so the volume is summed once here instead of on every redraw
+        self.projections[file_id] = voxel_io.axis_projections(arr)
+        self.spectra[file_id] = voxel_io.load_slice_spectra(path, arr)
 
         last_frame_path = Path(path)
         parent_path = str(last_frame_path.parent)
@@ -333,7 +388,9 @@ class DensityExplorer(QMainWindow):
 
         file_xyz_path = Path(path)
         file_xyz_path_parent = Path(file_xyz_path.parent)
-        files = list(file_xyz_path_parent.glob("frames_exp*.xyz"))
+        # the frames file may be compressed (see compressed_frames.py)
+        files = [f for f in sorted(file_xyz_path_parent.glob("frames_exp*.xyz*"))
+                 if compressed_frames.is_frames_name(f.name)]
         self.file_xyz_path[file_id] = str(files[0])
 
         # parse variables
@@ -351,9 +408,9 @@ class DensityExplorer(QMainWindow):
         self.system_dims[1] = arr.shape[1]
         self.system_dims[2] = arr.shape[2]
 
-        # compute RDP + concentration
-        self.RDPs[file_id]['brush'], self.RDPs[file_id]['gap'], \
-        self.concentrations[file_id]['brush'] = gap_brush_analysis.calc_2D_avg_RDP(
+        # compute RDP + concentration in the background, the plots fill in when they arrive
+        self._start_rdp(
+            file_id,
             self.file_xyz_path[file_id],
             arr.shape[:3],
             int(vals['gap']),
@@ -361,7 +418,7 @@ class DensityExplorer(QMainWindow):
             int(vals['len'])
         )
 
-        vals["concentration at z"] = self.concentrations[file_id]['brush'][0]
+        vals["concentration at z"] = "computing"
 
         self._reset_slice_artists(file_id)
 
@@ -387,6 +444,94 @@ class DensityExplorer(QMainWindow):
             self._apply_sync_to_dataset(2)
             self._update_all_plots(2)
 
+    # ---------------- background RDP ----------------
+    def _start_rdp(self, file_id, xyz_path, dims, gap, NPs, poly_len):
+        self._cancel_rdp(file_id)
+        self.RDPs[file_id]['brush'] = None
+        self.RDPs[file_id]['gap'] = None
+        self.concentrations[file_id]['brush'] = None
+
+        worker = RDPWorker(xyz_path, dims, gap, NPs, poly_len, self)
+        # results of a worker that has been replaced are dropped
+        worker.progress.connect(lambda done, total, w=worker: self._on_rdp_progress(file_id, w, done, total))
+        worker.result.connect(lambda res, w=worker: self._on_rdp_result(file_id, w, res))
+        worker.failed.connect(lambda msg, w=worker: self._on_rdp_failed(file_id, w, msg))
+        worker.finished.connect(lambda w=worker: self._on_rdp_finished(file_id, w))
+        self.rdp_workers[file_id] = worker
+
+        ctrl = self._ctrl_for(file_id)
+        ctrl['rdp_progress'].setRange(0, 0)  # busy until the first chunk is done
+        ctrl['rdp_progress'].setVisible(True)
+        ctrl['rdp_cancel'].setVisible(True)
+        worker.start()
+
+    def _cancel_rdp(self, file_id):
+        worker = self.rdp_workers[file_id]
+        if worker is None:
+            return
+        worker.cancel()
+        # keep a reference until the thread has stopped
+        self.retired_workers.append(worker)
+        self.rdp_workers[file_id] = None
+        self._hide_rdp_progress(file_id)
+        self.statusBar().showMessage(f"File {file_id}: RDP cancelled", 5000)
+
+    def _hide_rdp_progress(self, file_id):
+        ctrl = self._ctrl_for(file_id)
+        ctrl['rdp_progress'].setVisible(False)
+        ctrl['rdp_cancel'].setVisible(False)
+
+    def _on_rdp_progress(self, file_id, worker, done, total):
+        if worker is not self.rdp_workers[file_id]:
+            return
+        bar = self._ctrl_for(file_id)['rdp_progress']
+        bar.setRange(0, total)
+        bar.setValue(done)
+
+    def _on_rdp_result(self, file_id, worker, res):
+        if worker is not self.rdp_workers[file_id]:
+            return
+        self.RDPs[file_id]['brush'], self.RDPs[file_id]['gap'], \
+        self.concentrations[file_id]['brush'] = res
+
+        if file_id == 1:
+            self._update_concentration_label()
+            if self.data[1] is not None:
+                self._update_slice_plot(1)
+                self.canvas.draw_idle()
+        else:
+            self._ctrl_for(file_id)['var_labels']["concentration at z"].setText(
+                f"concentration at z = {self.concentrations[file_id]['brush'][0]}"
+            )
+
+    def _on_rdp_failed(self, file_id, worker, msg):
+        if worker is not self.rdp_workers[file_id]:
+            return
+        QMessageBox.warning(self, "RDP Error", f"Could not compute the RDP of File {file_id}:\n{msg}")
+
+    def _on_rdp_finished(self, file_id, worker):
+        if worker is self.rdp_workers[file_id]:
+            self.rdp_workers[file_id] = None
+            self._hide_rdp_progress(file_id)
+        elif worker in self.retired_workers:
+            self.retired_workers.remove(worker)
+
+    def _update_concentration_label(self):
+        labels = self._ctrl_for(1)['var_labels']
+        if self.concentrations[1]['brush'] is None:
+            labels["concentration at z"].setText("concentration at z = computing")
+            return
+        labels["concentration at z"].setText(
+            f"concentration at z = {self.concentrations[1]['brush'][self.slice_index[1]]}"
+        )
+
+    def closeEvent(self, event):
+        for file_id in (1, 2):
+            self._cancel_rdp(file_id)
+        for worker in list(self.retired_workers):
+            worker.wait()
+        super().closeEvent(event)
+
     # ---------------- var labels ----------------
     def _update_var_labels(self, file_id, vals):
         labels = self._ctrl_for(file_id)['var_labels']
@@ -433,10 +578,7 @@ class DensityExplorer(QMainWindow):
 
         # update concentration label
         if key == 1:
-            labels = self._ctrl_for(key)['var_labels']
-            labels["concentration at z"].setText(
-                f"concentration at z = {self.concentrations[1]['brush'][self.slice_index[1]]}"
-            )
+            self._update_concentration_label()
 
     def _toggle_sync(self, key, state):
         self.sync_to_file1[key] = (state == Qt.Checked)
@@ -505,10 +647,7 @@ class DensityExplorer(QMainWindow):
 
         sel_t = self.selected_type[key]
         for t in range(num_types):
-            vol = data[:, :, :, t]
-            x_vals = vol.sum(axis=(1, 2))
-            y_vals = vol.sum(axis=(0, 2))
-            z_vals = vol.sum(axis=(0, 1))
+            x_vals, y_vals, z_vals = self.projections[key][t]
 
             def norm(v):
                 vmax = float(np.max(np.abs(v))) if v.size else 0.0
@@ -538,23 +677,22 @@ class DensityExplorer(QMainWindow):
         data = self.data[key]
         ax = self.axes[key][3]
 
-        # compute slice
+        # read only the slice that is shown
         t = self.selected_type[key]
-        vol = data[:, :, :, t]
         axis_txt = self.slice_axis[key]
         idx = self.slice_index[key]
 
         if axis_txt == 'X':
-            slice_2d = vol[idx, :, :]
+            slice_2d = data[idx, :, :, t]
             xlab, ylab = 'Y', 'Z'
         elif axis_txt == 'Y':
-            slice_2d = vol[:, idx, :]
+            slice_2d = data[:, idx, :, t]
             xlab, ylab = 'X', 'Z'
         else:
-            slice_2d = vol[:, :, idx]
+            slice_2d = data[:, :, idx, t]
             xlab, ylab = 'X', 'Y'
 
-        slice_2d = np.squeeze(slice_2d)
+        slice_2d = np.squeeze(np.asarray(slice_2d))
 
         # build formatter
         def mk_formatter(slice_2d_local):
@@ -609,28 +747,35 @@ class DensityExplorer(QMainWindow):
             for i in range(3):
                 axes_row[i].clear()
 
-            # RDP
-            axes_row[2].set_title("Z Plane RDP")
-            axes_row[2].plot(
-                self.RDPs[1]['brush'][self.slice_index[1]][:self.system_dims[0]//2-1],
-                linewidth=1,
-                alpha=1.0,
-            )
+            # RDP + NP concentration, drawn once the background worker has them
+            if self.RDPs[1]['brush'] is None:
+                axes_row[2].set_title("Z Plane RDP (computing)")
+                axes_row[1].set_title("Z Plane NP Concentration (computing)")
+            else:
+                axes_row[2].set_title("Z Plane RDP")
+                axes_row[2].plot(
+                    self.RDPs[1]['brush'][self.slice_index[1]][:self.system_dims[0]//2-1],
+                    linewidth=1,
+                    alpha=1.0,
+                )
 
-            # NP concentration
-            axes_row[1].set_title("Z Plane NP Concentration")
-            axes_row[1].plot(
-                self.concentrations[1]['brush'],
-                linewidth=1,
-                alpha=1.0,
-            )
-            axes_row[1].axvline(self.slice_index[1], color='orange', linestyle='--')
+                axes_row[1].set_title("Z Plane NP Concentration")
+                axes_row[1].plot(
+                    self.concentrations[1]['brush'],
+                    linewidth=1,
+                    alpha=1.0,
+                )
+                axes_row[1].axvline(self.slice_index[1], color='orange', linestyle='--')
 
             # FFT
             ax2 = axes_row[3]
-            slice_xy = slice_2d - np.mean(slice_2d)
-            fft2d = np.fft.fftshift(np.fft.fft2(slice_xy))
-            fft_abs = np.abs(fft2d)
+            if axis_txt == 'Z':
+                # z slices were transformed when the file was loaded
+                fft_abs = np.asarray(self.spectra[key][:, :, idx, t])
+            else:
+                slice_xy = slice_2d - np.mean(slice_2d)
+                fft2d = np.fft.fftshift(np.fft.fft2(slice_xy))
+                fft_abs = np.abs(fft2d)
 
             # FFT display
             if self.slice_images[key2] is None:
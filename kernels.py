@@ -0,0 +1,139 @@
+# kernels holds the per particle inner loops of the analysis: binning z values into a profile and binning particles
+# into voxels. every kernel has a numpy version and a loop version that numba compiles when it is installed. the
+# compiled loops go over the particles once without the temporary arrays the numpy versions make, and both versions
+# add the voxels straight into the caller's array.
+# the backend is picked once, when kernels is imported, by the ANALYSIS_KERNELS environment variable:
+#   numpy - always use numpy
+#   numba - use numba, fail if it can't be imported
+#   auto  - numba when it can be imported, otherwise numpy (the default)
+import os
+import numpy as np
+
+BACKEND = os.environ.get("ANALYSIS_KERNELS", "auto").lower()
+if BACKEND not in ("numpy", "numba", "auto"):
+    raise ValueError("ANALYSIS_KERNELS must be numpy, numba or auto, not " + BACKEND)
+
+if BACKEND != "numpy":
+    try:
+        import numba
+        BACKEND = "numba"
+    except ImportError:
+        if BACKEND == "numba":
+            raise
+        BACKEND = "numpy"
+
+
+# ---------------- numpy versions ----------------
+def _z_histogram_numpy(z_values, bin_length, total_bins):
+    bins = (z_values / bin_length).astype(np.int64)
+    if bins.shape[0] > 0 and (bins.min() < 0 or bins.max() >= total_bins):
+        raise ValueError("z value outside of the profile bins")
+    return np.bincount(bins, minlength=total_bins)
+
+
+def _add_voxels_numpy(voxels, types, coords, system_dimensions, unit_voxel, eps):
+    voxel_array_dims = voxels.shape
+    keep = (types == 1) | (types == 2)
+    coords = coords[keep]
+    p = types[keep] - 1 # indexing particle type 0 = monomer, 1 = NP
+
+    x = (coords[:, 0] / unit_voxel[0]).astype(np.int64)
+    y = (coords[:, 1] / unit_voxel[1]).astype(np.int64)
+    z = (coords[:, 2] / unit_voxel[2]).astype(np.int64)
+
+    # coordinates past the box edge are wrapped back into the box
+    x_out = coords[:, 0] > system_dimensions[0]
+    y_out = coords[:, 1] > system_dimensions[1]
+    z_out = coords[:, 2] > system_dimensions[2]
+    x[x_out] = ((coords[x_out, 0] - system_dimensions[0]) / unit_voxel[0]).astype(np.int64)
+    y[y_out] = ((coords[y_out, 1] - system_dimensions[1]) / unit_voxel[1]).astype(np.int64)
+    z[z_out] = ((coords[z_out, 2] - eps) / unit_voxel[2]).astype(np.int64)
+    oob = int(np.sum(x_out) + np.sum(y_out) + np.sum(z_out))
+
+    inside = ((x >= 0) & (x < voxel_array_dims[0]) &
+              (y >= 0) & (y < voxel_array_dims[1]) &
+              (z >= 0) & (z < voxel_array_dims[2]))
+    # added in place, a bincount over the whole grid costs more per frame than parsing it
+    np.add.at(voxels, (x[inside], y[inside], z[inside], p[inside]), 1)
+    return oob, int(np.sum(~inside))
+
+
+# ---------------- loop versions, compiled by numba ----------------
+def _z_histogram_loop(z_values, bin_length, total_bins):
+    hist = np.zeros(total_bins, dtype=np.int64)
+    for i in range(z_values.shape[0]):
+        b = int(z_values[i] / bin_length)
+        if b < 0 or b >= total_bins:
+            raise ValueError("z value outside of the profile bins")
+        hist[b] += 1
+    return hist
+
+
+def _add_voxels_loop(voxels, types, coords, system_dimensions, unit_voxel, eps):
+    oob = 0
+    dropped = 0
+    for i in range(types.shape[0]):
+        if types[i] != 1 and types[i] != 2:
+            continue
+        # coordinates past the box edge are wrapped back into the box
+        if coords[i, 0] > system_dimensions[0]:
+            x = int((coords[i, 0] - system_dimensions[0]) / unit_voxel[0])
+            oob += 1
+        else:
+            x = int(coords[i, 0] / unit_voxel[0])
+        if coords[i, 1] > system_dimensions[1]:
+            y = int((coords[i, 1] - system_dimensions[1]) / unit_voxel[1])
+            oob += 1
+        else:
+            y = int(coords[i, 1] / unit_voxel[1])
+        if coords[i, 2] > system_dimensions[2]:
+            z = int((coords[i, 2] - eps) / unit_voxel[2])
+            oob += 1
+        else:
+            z = int(coords[i, 2] / unit_voxel[2])
+
+        if (x >= 0 and x < voxels.shape[0] and
+                y >= 0 and y < voxels.shape[1] and
+                z >= 0 and z < voxels.shape[2]):
+            voxels[x, y, z, types[i] - 1] += 1
+        else:
+            dropped += 1
+    return oob, dropped
+
+
+if BACKEND == "numba":
+    _z_histogram = numba.njit(cache=True)(_z_histogram_loop)
+    _add_voxels = numba.njit(cache=True)(_add_voxels_loop)
+else:
+    _z_histogram = _z_histogram_numpy
+    _add_voxels = _add_voxels_numpy
+
+
+# ---------------- kernels ----------------
+def z_histogram(z_values, bin_length, total_bins):
+    """
+    histograms z values into total_bins bins of length bin_length. bin 0 starts at z = 0 and a value is binned
+    by truncating z / bin_length, so values just below 0 go in bin 0. raises ValueError for a value that falls
+    outside of the bins.
+    """
+    return _z_histogram(np.asarray(z_values, dtype=np.float64), float(bin_length), int(total_bins))
+
+
+def add_voxels(voxels,       # (Nx, Ny, Nz, 2) int64 array the particles are added to
+               types,
+               coords,
+               system_dimensions,
+               unit_voxel,
+               eps=0.0001):
+    """
+    bins the monomers (type 1) and NPs (type 2) of one frame into voxels. coordinates past the box edge are
+    wrapped back in. returns the number of wrapped coordinates and the number of particles that could not be
+    placed in the array.
+    """
+    oob, dropped = _add_voxels(voxels,
+                               np.asarray(types, dtype=np.int64),
+                               np.asarray(coords, dtype=np.float64),
+                               np.asarray(system_dimensions, dtype=np.float64),
+                               np.asarray(unit_voxel, dtype=np.float64),
+                               float(eps))
+    return int(oob), int(dropped)
@@ -37,6 +37,10 @@ is of interest for np saturation of the polymer brush. current data files that a
 
 from ComputationalEquilibriums import ReferenceDistribution
 import numpy as np
+import frame_reader
+import compressed_frames
+import catalog
+from accumulators import WindowAccumulator
 import sys
 
 if __name__ == "__main__":
@@ -47,8 +51,6 @@ if __name__ == "__main__":
     filename = sys.argv[2] if len(sys.argv)>2 else "exp_1_Umin-0-175_rad2_den0-03_NP128" #"exp_test_6.Umin2.rad2.den10.NP10"
     print(dir_base, filename)
 
-    #dist holds number of particles loaded in brush and floating in solvent at each time step
-    dist = ReferenceDistribution(_type="Binary", _reference=0.0, _dist=[0, 0])
     significance_level = 0.05
     sim_track = 0
 
@@ -59,17 +61,14 @@ if __name__ == "__main__":
     #bins for z axis profiling
     bin_length = 10.0 # this bin length is used to cut the system height into intervals for binning
     total_bins = int(1000.0/bin_length) # 1000 is used because it is a sim max. i.e. the system can only have a height of 1000
-    # poly_profile holds the number of polymers at sectional slice
-    poly_profile_lag = []
-    poly_profile_current = np.zeros(total_bins, dtype = int)
-    np_profile_lag = []
-    np_profile_current = np.zeros(total_bins, dtype = int)
+    # the z axis profiles are averaged over the last num_frames frames of the simulation
+    num_frames = 20
 
 
     system_dimensions = [0.0,0.0,0.0] # default values that will be overwritten by file data
 
-    #retrieve radius from filename and calculate NP Volume. relies on naming conventions from create_exp.sh
-    radius = float(dir_base.split("/")[-4].split("_")[-1])
+    #retrieve radius from the path by name and calculate NP Volume. relies on naming conventions from create_exp.sh
+    radius = catalog.parse_path(dir_base)["rad"]
     print("radius ", radius)
     NP_Volume = 4.0 / 3.0 * np.pi * radius * radius * radius
     print("NP_Volume ", NP_Volume)
@@ -78,85 +77,50 @@ if __name__ == "__main__":
     print("Reading Simulation Global Values")
 
     # get information about the simulation
-    with open(dir_base  + filename + ".mpd", 'r') as fp:
-        for i, line in enumerate(fp):
-            if i == 9:# this is the line with the sim dimensions when MD is used to create the file.
-                split_line = line.strip().split(" ") # split the file line into its components
-                system_dimensions = [float(split_line[1]),float(split_line[2]), float(split_line[3])]
+    mpd_dimensions = catalog.read_mpd(dir_base + filename + ".mpd")[1]
+    if mpd_dimensions is not None:
+        system_dimensions = mpd_dimensions
 
 
     # grab the number of particles and the name of the experiment from the save file
-    parts = None
-    name = None
     print("Opening Simulation Data File")
+    # the frames file may have been compressed (see compressed_frames.py)
+    frame_file = compressed_frames.find_frames(dir_base + "frames_" + filename + ".xyz")
+    parts, name = frame_reader.read_header(frame_file)
+    frames = frame_reader.count_frames(frame_file, parts)
+    if num_frames > frames:
+        num_frames = frames
+
+    # poly_profile holds the average number of polymers at sectional slice
+    poly_profile = WindowAccumulator(total_bins, start=frames - num_frames)
+    np_profile = WindowAccumulator(total_bins, start=frames - num_frames)
 
-    with open(dir_base + "frames_" + filename + ".xyz", 'r') as fp:
-        for i, line in enumerate(fp):
-            if i == 0:
-                parts = int(line.strip()) # the first line has the number of particles in the simulation
-            if i == 1:
-                name = line.strip() # I don't think we use this anymore it can probably go
-            if i > 1:
-                break
-                
     print("processing densities")
-    
-    # process the simulation file
-    with open(dir_base + "frames_"+filename+".xyz", 'r') as fp:
-        for i, line in enumerate(fp):
-            split_line = line.strip().split("\t") # split the file line into its components
-
-            # if we have a distributions save it
-            # there is a line for each particle plus a line for the number of particles and name of experiment.
-            # that's why we have (parts+2) in each frame. that means each frame can be indexed by i % (parts + 2)
-            if i % (parts + 2) == 0:
-                if i > 0: # skips the first time since no ditribution to process yet.
-                    # process distributions for Chi squared metric
-                    # run this for the first and last info sets.
-                    # iterative sets just show that the density growth is not exceptional.
-                    # probably need to handle it in 2^N steps.
-                    # code below needs refactor to handle multiple lag deltas.
-                    info_lag.append(dist.Distribution)
-                    # already processed one distribution so save it's max height
-                    brushz_lag.append(dist.ReferenceValue)
-                    #grab the polymer profile for the time step
-                    poly_profile_lag.append(poly_profile_current)
-                    #grab the np profile for the time step
-                    np_profile_lag.append(np_profile_current)
-
-                    # reset the distributions so that processing can continue.
-                    dist = ReferenceDistribution(_type="Binary", _reference=0.0, _dist=[0, 0])
-                    # reset the polymer profile
-                    poly_profile_current = np.zeros(total_bins)
-                    # reset the NP profile
-                    np_profile_current = np.zeros(total_bins)
-
-
-            #grab and record the highest z value for a polymer. This is the brush height.
-            if split_line[0] == '1': # spilt_line[0] will always exist even on break lines with the number of particles and name of exp.
-                # line starting with 1 is a monomer on a polymer chain
-                #update polymer z profiles
-                bin = int(float(split_line[3])/bin_length)
-                poly_profile_current[bin] += 1
-                if float(split_line[3]) > dist.ReferenceValue: # check to see if z value is higher than current max
-                    #update brush height in distribution class
-                    dist.update_reference(float(split_line[3]))
-
-            #identify the NP inside and outside the brush
-            if split_line[0] == '2': # Line starting with a 2 is a np
-                #update the z profile for NPs and
-                bin = int(float(split_line[3])/bin_length)
-                np_profile_current[bin] += 1
-                #pass the z value for the NP to the distribution. It will update according to current z height
-                dist.update_distribution(float(split_line[3]))
-
-            # technicaly it is possible that this CODE could be counting some NPs as outside the brush that are below
-            # the highet of the brush IF the NP is encountered before a polymer with a height greater than the z value
-            # of the NP is encountered after the NP; however, the brushes start in an entropiclly disadvantaged configuration
-            # of total elongation so this scenario is impossible in the first frame. Consequent frames are unlikely to
-            # suffer as the polymers' heights should all contract at roughly the same miniscule rate for each timestep.
-            # the real concern is in nonequilibrium situations when there is a great difference in the delta between
-            # brush heights between t(i) and t(i+1). talk to Laradji about this.
+
+    # process the simulation file one frame at a time
+    for types, coords in frame_reader.read_frames(frame_file, parts, stop=frames):
+        poly_z = coords[types == 1, 2]  # type 1 is a monomer on a polymer chain
+        np_z = coords[types == 2, 2]    # type 2 is a np
+
+        dist = ReferenceDistribution(_type="Binary", _reference=0.0, _dist=[0, 0])
+        #grab and record the highest z value for a polymer. This is the brush height.
+        if poly_z.size > 0 and np.max(poly_z) > dist.ReferenceValue:
+            dist.update_reference(np.max(poly_z))
+
+        #identify the NP inside and outside the brush
+        # the whole frame is read before the NPs are classified so every NP is compared against the final
+        # brush height of the frame and not the highest monomer seen so far in the frame.
+        #pass the z values for the NPs to the distribution. It will update according to current z height
+        dist.update_distribution_batch(np_z, radius)
+
+        # process distributions for Chi squared metric
+        info_lag.append(dist.Distribution)
+        # save the frame's max height
+        brushz_lag.append(dist.ReferenceValue)
+        #grab the polymer profile for the time step
+        poly_profile.add(frame_reader.z_profile(poly_z, bin_length, total_bins))
+        #grab the np profile for the time step
+        np_profile.add(frame_reader.z_profile(np_z, bin_length, total_bins))
 
     print("processing equilibriums")
     print(str(len(info_lag)) + " frames in file")
@@ -270,17 +234,13 @@ if __name__ == "__main__":
     # these z axis profiles are only written out for the last frame of the simulation.
     # float x is a cast of the number of polymers or NPs in the z slice. the divisor represents the area of the slice
     # making these values densities.
-    num_frames = 20
-    if num_frames > len(poly_profile_lag):
-        num_frames = len(poly_profile_lag)
-
     with open(dir_base + "polymer_profile.dat", 'w') as fp:
-        averaged_profile = np.average(poly_profile_lag[-num_frames:], axis=0)
+        averaged_profile = poly_profile.mean()
         for i, x in enumerate(averaged_profile):
             fp.write( str( bin_length * i ) + " " +str(float(x) / (system_dimensions[0] * system_dimensions[1] * bin_length) )+"\n")
 
     with open(dir_base + "np_profile.dat", 'w') as fp:
-        averaged_np_profile = np.average(np_profile_lag[-num_frames:], axis=0)
+        averaged_np_profile = np_profile.mean()
         for i, x in enumerate(averaged_np_profile):
             fp.write( str( bin_length * i ) + " " +str(float(x) / (system_dimensions[0] * system_dimensions[1] * bin_length) )+"\n")
 
@@ -0,0 +1,173 @@
+# pair_distances histograms the distances between pairs of particles. the pairs are enumerated as index arrays and
+# binned straight into the histogram. periodic axes use the minimum image distance, so distances are only meaningful
+# up to half the shortest periodic box length (see half_box_cutoff), which is where the RDP histograms stop.
+# grouped_pair_histogram looks at every pair of every group, O(N^2) in work and memory for a group of N points. it is
+# for the RDP z layers, which hold only a few NPs each.
+# pair_histogram, for one large set of points, first sorts the points into a grid of cells CELLS_PER_CUTOFF to a
+# cutoff wide and only pairs the points of cells whose closest corners are within the cutoff of each other. at a half
+# box cutoff the periodic axes only lose the far corners, most of the pruning is along the open z axis.
+import numpy as np
+
+CELLS_PER_CUTOFF = 4
+
+
+def minimum_image(diff, box, periodic=(True, True, False)):
+    """
+    wraps the difference vectors diff (shape (..., 3), e.g. frames x pairs x 3) back into [-box/2, box/2] on
+    the periodic axes in one pass over the array. box is the 3 box lengths, or anything that broadcasts
+    against diff (e.g. shape (frames, 1, 3) for a box per frame).
+    a difference is wrapped once, so the particles have to be inside (or within a box length of) the box.
+    """
+    diff = np.array(diff, dtype=np.float64)
+    # box lengths on the periodic axes, 0 on the others so they are never wrapped
+    wrap = np.asarray(box, dtype=np.float64) * np.asarray(periodic, dtype=bool)
+    diff -= wrap * (diff > wrap / 2.0)
+    diff += wrap * (diff < -wrap / 2.0)
+    return diff
+
+
+def grouped_pair_histogram(points,
+                           groups,    # group number of every point, only points in the same group are paired
+                           bins,     # histogram bin edges, the last edge is the cutoff
+                           box=None,   # box lengths, only used on the periodic axes
+                           periodic=(False, False, False),
+                           n_groups=None):
+    """
+    pair_histogram for many small sets of points at once (e.g. the z layers of a stack of frames).
+    returns an array of shape (n_groups, bins - 1) with the histogram of the unordered pairs in each group.
+    every pair in a group is looked at (index and difference arrays as long as the number of pairs), so the groups
+    should be small.
+    """
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+    groups = np.asarray(groups, dtype=np.int64)
+    bins = np.asarray(bins, dtype=np.float64)
+    if n_groups is None:
+        n_groups = int(groups.max()) + 1 if groups.shape[0] > 0 else 0
+    if box is None:
+        box = np.zeros(3)
+
+    # sort the points by group so each group is a contiguous slice
+    order = np.argsort(groups, kind='stable')
+    points = points[order]
+    groups = groups[order]
+    group_count = np.bincount(groups, minlength=n_groups)
+    group_end = np.cumsum(group_count)
+
+    i, j = _group_pairs(groups, group_end)
+    return _histogram_pairs(points, i, j, groups[i], n_groups, bins, box, periodic)
+
+
+def _group_pairs(groups, group_end):
+    # (i, j) index arrays of every unordered pair of points in the same group, for points sorted by group.
+    # every point is paired with the points after it in its group
+    partners = group_end[groups] - np.arange(groups.shape[0]) - 1
+    i = np.repeat(np.arange(groups.shape[0]), partners)
+    j = i + 1 + np.arange(i.shape[0]) - np.repeat(np.cumsum(partners) - partners, partners)
+    return i, j
+
+
+def _histogram_pairs(points, i, j, pair_groups, n_groups, bins, box, periodic):
+    # per group histogram of the distances of the pairs (points[i], points[j])
+    diff = minimum_image(points[i] - points[j], box, periodic)
+    distances = np.sqrt(np.sum(diff * diff, axis=-1))
+    keep = distances <= bins[-1]
+    # histogram bin of every pair, np.histogram puts the last edge in the last bin
+    pair_bin = np.searchsorted(bins, distances[keep], side='right') - 1
+    pair_bin[pair_bin == bins.shape[0] - 1] = bins.shape[0] - 2
+    valid = pair_bin >= 0
+    flat = pair_groups[keep][valid] * (bins.shape[0] - 1) + pair_bin[valid]
+    return np.bincount(flat, minlength=n_groups * (bins.shape[0] - 1)).reshape(n_groups, bins.shape[0] - 1)
+
+
+def _cell_offsets(cells, width, cutoff, periodic):
+    # (offsets, 3) array of the cell offsets whose cells can hold points within cutoff of each other. periodic
+    # offsets are wrapped into [0, cells), so no neighbor cell is listed twice
+    axes = []
+    for axis in range(3):
+        reach = int(np.ceil(cutoff / width[axis])) if width[axis] > 0 else 0
+        offsets = np.arange(-reach, reach + 1)
+        if periodic[axis]:
+            offsets = np.unique(offsets % cells[axis])
+            gap = np.minimum(offsets, cells[axis] - offsets)
+        else:
+            offsets = offsets[np.abs(offsets) < cells[axis]]
+            gap = np.abs(offsets)
+        # shortest distance between points of the two cells along the axis
+        axes.append((offsets, np.maximum(gap - 1, 0) * width[axis]))
+    grid = [np.stack(np.meshgrid(*values, indexing='ij'), axis=-1).reshape(-1, 3) for values in zip(*axes)]
+    offsets, gaps = grid
+    return offsets[np.sum(gaps * gaps, axis=1) <= cutoff * cutoff]
+
+
+def _cell_pairs(points, cutoff, box, periodic):
+    # points sorted by cell and the (i, j) index arrays into them of the unordered pairs in the same or in
+    # neighboring cells
+    periodic = np.asarray(periodic, dtype=bool)
+    low = np.where(periodic, 0.0, points.min(axis=0))
+    extent = np.where(periodic, np.asarray(box, dtype=np.float64), points.max(axis=0) - low)
+    cells = np.maximum((extent * CELLS_PER_CUTOFF / cutoff).astype(np.int64), 1)
+    width = extent / cells
+    cell = np.floor((points - low) / np.where(width > 0, width, 1.0)).astype(np.int64)
+    # points just outside a periodic box are in the cell of their image, the open axes end in the last cell
+    cell = np.where(periodic, cell % cells, np.clip(cell, 0, cells - 1))
+
+    flat_cell = np.ravel_multi_index(cell.T, cells)
+    order = np.argsort(flat_cell, kind='stable')
+    points = points[order]
+    flat_cell = flat_cell[order]
+    occupied, start, count = np.unique(flat_cell, return_index=True, return_counts=True)
+
+    # pairs inside a cell
+    cell_number = np.repeat(np.arange(occupied.shape[0]), count)
+    i_same, j_same = _group_pairs(cell_number, np.cumsum(count))
+
+    # pairs of every occupied cell with the occupied neighbor cells after it
+    offsets = _cell_offsets(cells, width, cutoff, periodic)
+    neighbor = np.unravel_index(occupied, cells)
+    neighbor = np.stack(neighbor, axis=-1)[:, None, :] + offsets[None, :, :]
+    inside = np.all(periodic | ((neighbor >= 0) & (neighbor < cells)), axis=-1)
+    neighbor = np.where(periodic, neighbor % cells, np.clip(neighbor, 0, cells - 1))
+    neighbor_flat = np.ravel_multi_index(tuple(np.moveaxis(neighbor, -1, 0)), cells)
+    a, o = np.nonzero(inside & (neighbor_flat > occupied[:, None]))
+    target = neighbor_flat[a, o]
+    b = np.minimum(np.searchsorted(occupied, target), occupied.shape[0] - 1)
+    found = occupied[b] == target  # empty neighbor cells have no points to pair
+    a = a[found]
+    b = b[found]
+
+    # every point of cell a with every point of cell b
+    total = count[a] * count[b]
+    pair = np.repeat(np.arange(a.shape[0]), total)
+    k = np.arange(pair.shape[0]) - np.repeat(np.cumsum(total) - total, total)
+    i_cross = start[a][pair] + k // count[b][pair]
+    j_cross = start[b][pair] + k % count[b][pair]
+    return points, np.concatenate((i_same, i_cross)), np.concatenate((j_same, j_cross))
+
+
+def half_box_cutoff(box, periodic=(True, True, False)):
+    """
+    the longest distance the minimum image convention measures correctly, half the shortest periodic box length.
+    """
+    lengths = [float(box[axis]) for axis in range(3) if periodic[axis]]
+    if not lengths:
+        raise ValueError("half_box_cutoff needs at least one periodic axis")
+    return min(lengths) / 2.0
+
+
+def pair_histogram(points,
+                   bins,     # histogram bin edges, the last edge is the cutoff
+                   box=None,   # box lengths, only used on the periodic axes
+                   periodic=(False, False, False)):
+    """
+    histogram of the distances between every unordered pair of points (no self pairs) using np.histogram bin
+    edges. pairs further apart than the last edge are not counted, and only the pairs of cells within the last
+    edge of each other are looked at.
+    """
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+    bins = np.asarray(bins, dtype=np.float64)
+    if box is None:
+        box = np.zeros(3)
+    if points.shape[0] < 2 or bins[-1] <= 0:
+        return np.zeros(bins.shape[0] - 1, dtype=np.int64)
+    points, i, j = _cell_pairs(points, bins[-1], box, periodic)
+    return _histogram_pairs(points, i, j, np.zeros(i.shape[0], dtype=np.int64), 1, bins, box, periodic)[0]
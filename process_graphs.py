@@ -1,5 +1,6 @@
 import os
 import numpy as np
+import catalog
 from scipy import stats
 
 import matplotlib.pyplot as plt
@@ -190,11 +191,9 @@ def plot_profiles(root, files):
 
 
 
-    with open(root +"/" + mpd_file[0], 'r') as fp:
-        for i, line in enumerate(fp):
-            if i == 9:# this is the line with the sim dimensions when MD is used to create the file.
-                split_line = line.strip().split(" ") # split the file line into its components
-                system_dimensions = [float(split_line[1]),float(split_line[2]), float(split_line[3])]
+    mpd_dimensions = catalog.read_mpd(root + "/" + mpd_file[0])[1]
+    if mpd_dimensions is not None:
+        system_dimensions = mpd_dimensions
 
     max_height_index = int(system_dimensions[2] / 10) + 1 # each bin is 10 units high
 
@@ -0,0 +1,123 @@
+# result_cache memoizes analysis results that are computed from a trajectory, e.g. gap_brush_analysis.calc_2D_avg_RDP.
+# a result is keyed on the identity of the trajectory (absolute path, size and modification time) plus the name
+# and arguments of the computation, and its arrays are stored as <key>.npz in a cache directory. rewriting the
+# trajectory changes its size or mtime, so stale results are never found.
+# every result goes in one shared cache directory, ~/.cache/brush_result_cache by default or RESULT_CACHE_DIR when
+# it is set (e.g. a scratch disk), so the results of a whole campaign share one size limit.
+# the cache directory is kept under RESULT_CACHE_MAX_MB (default 512) by deleting the least recently used results,
+# a result counts as used when it is saved or loaded.
+import os
+import json
+import tempfile
+import hashlib
+import numpy as np
+
+DEFAULT_MAX_BYTES = int(float(os.environ.get("RESULT_CACHE_MAX_MB", 512)) * 1024 * 1024)
+
+
+def default_cache_dir():
+    """
+    cache directory used when memoize isn't given one.
+    """
+    if "RESULT_CACHE_DIR" in os.environ:
+        return os.environ["RESULT_CACHE_DIR"]
+    return os.path.join(os.path.expanduser("~"), ".cache", "brush_result_cache")
+
+
+def _plain(value):
+    # numpy scalars and arrays in the arguments are keyed like the python values they hold
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError("can't key an argument of type {}".format(type(value).__name__))
+
+
+def cache_key(path, name, args):
+    """
+    sha1 hex key of the computation name applied with args to the file at path as it is on disk now.
+    """
+    st = os.stat(path)
+    identity = [os.path.abspath(path), st.st_size, st.st_mtime_ns, name, args]
+    return hashlib.sha1(json.dumps(identity, default=_plain).encode()).hexdigest()
+
+
+def load(key, names, cache_dir):
+    """
+    tuple of the arrays names saved under key, or None when there is no such result.
+    """
+    entry = os.path.join(cache_dir, key + ".npz")
+    try:
+        with np.load(entry, allow_pickle=False) as saved:
+            result = tuple(saved[n] for n in names)
+        os.utime(entry)  # mark it as recently used
+    except (OSError, KeyError, ValueError):
+        return None
+    return result
+
+
+def evict(cache_dir, max_bytes=DEFAULT_MAX_BYTES):
+    """
+    deletes the least recently used results until the .npz files in cache_dir take at most max_bytes.
+    """
+    entries = []
+    for name in os.listdir(cache_dir):
+        if name.endswith(".npz") and not name.endswith(".tmp.npz"):
+            try:
+                st = os.stat(os.path.join(cache_dir, name))
+            except OSError:
+                continue  # evicted by another process since it was listed
+            entries.append((st.st_mtime, st.st_size, name))
+    total = sum(size for _, size, _ in entries)
+    for _, size, name in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(os.path.join(cache_dir, name))
+        except OSError:
+            continue  # already evicted by another process
+        total -= size
+
+
+def save(key, names, result, cache_dir, max_bytes=DEFAULT_MAX_BYTES):
+    """
+    saves the arrays of result under key as names, then evicts old results to keep cache_dir under max_bytes.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    entry = os.path.join(cache_dir, key + ".npz")
+    # write to a temporary file of its own first so a reader never sees half a result, even when two processes
+    # compute the same result at once
+    fd, tmp = tempfile.mkstemp(prefix=key + ".", suffix=".tmp.npz", dir=cache_dir)
+    try:
+        with os.fdopen(fd, 'wb') as fp:
+            np.savez(fp, **dict(zip(names, result)))
+        os.chmod(tmp, 0o644)  # mkstemp makes the file private
+        os.replace(tmp, entry)
+    except BaseException:
+        os.remove(tmp)
+        raise
+    evict(cache_dir, max_bytes)
+
+
+def memoize(path, name, args, names, compute, cache_dir=None, max_bytes=DEFAULT_MAX_BYTES):
+    """
+    returns the cached result of the computation name with args on the file at path, or runs compute(), which
+    returns a tuple of arrays (saved as names), and caches its result. a compute() that returns None (e.g. it
+    was cancelled) is not cached.
+    """
+    if cache_dir is None:
+        cache_dir = default_cache_dir()
+    key = cache_key(path, name, args)
+    result = load(key, names, cache_dir)
+    if result is not None:
+        return result
+
+    result = compute()
+    if result is None:
+        return None
+    try:
+        save(key, names, result, cache_dir, max_bytes)
+    except OSError as e:
+        # read only data directories still get the result, it just isn't kept
+        print("could not cache", name, "for", path, e)
+    return result
@@ -1,73 +1,90 @@
 
+import os
+import mmap
+import numpy as np
+import frame_reader
+import compressed_frames
+
 base_dir = "/scratch/chdavis/exp_4/NP_BRUSH/Umin_-0.175/rad_2/den_0.1/gap_0/len_32/NP_1024"
 
 file ="/frames_exp_4_Umin-0-175_rad2_den0-1_gap0_len32_NP1024.xyz"
 
-def read_from_end(filepath, n):
+def _header_start(mm, digits, end):
+    # offset of the last line before end that holds only the particle count (surrounding whitespace and a \r
+    # are allowed, like read_header's strip()), or -1 when there is none. particle lines start with their type,
+    # so a line starting with the count is a header
+    position = end
+    while position > 0:
+        found = mm.rfind(b"\n" + digits, 0, position)
+        start = found + 1
+        if found < 0:
+            # the first line of the file has no newline before it
+            start = 0
+            if not mm[:len(digits)] == digits:
+                return -1
+        line_end = mm.find(b"\n", start, end)
+        if line_end < 0:
+            line_end = end
+        if mm[start + len(digits):line_end].strip() == b"":
+            return start
+        if start == 0:
+            return -1
+        position = found
+    return -1
+
+
+def read_frames_from_end(filepath, parts=None, frames=None):
     """
-    Generator that yields chunks of N lines at a time,
-    starting from the end of the file and moving backward.
+    Generator that yields (types, coords) arrays for the complete frames of a frames file, newest first,
+    stopping after frames frames (all of them when None).
+    the file is memory mapped and only the frames that are yielded are looked at. each frame is found by
+    searching backward for its header line (the particle count) and its end by counting its newlines, so a
+    partially written frame is skipped. the particle lines are parsed straight from the mapped bytes.
+    raises ValueError when a file that isn't empty has no complete frame.
     """
-    yields = 0
-
-    with open(filepath, "rb") as f:  # open in binary to handle seeking precisely
-        f.seek(0, 2)  # move to end of file
-        file_size = f.tell()
-
-        buffer = b""
-        block_size = 1024*1024
-        pos = file_size
-
-        lines = []
-
-        while pos > 0:
-
-            # read next block from the end
-            read_size = min(block_size, pos)
-            pos -= read_size
-            f.seek(pos)
-            data = f.read(read_size)
-            buffer = data + buffer  # prepend chunk
-
-            # split into lines
-            parts = buffer.split(b"\n")
-
-            # keep the first partial line for next iteration
-            buffer = parts[0]
-            full_lines = parts[1:]
-
-            # process complete lines in reverse order
-            for line in reversed(full_lines):
-                lines.append(line.decode("utf-8", errors="replace"))
-                if len(lines) == n:
-                    yield lines
-                    lines = []
-
-        # handle leftover buffer at start of file
-        if buffer:
-            lines.append(buffer.decode("utf-8", errors="replace"))
-
-
-        if lines:
-            yield list(reversed(lines))  # oldest lines first
-
+    if parts is None:
+        parts, _ = frame_reader.read_header(filepath)
+    if compressed_frames.compression(filepath) is not None:
+        # compressed files are read through their block index when they have one
+        yield from frame_reader.read_frames(filepath, parts, start=-1,
+                                            stop=None if frames is None else -frames - 1, step=-1)
+        return
+    digits = b"%d" % parts
+
+    with open(filepath, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            view = np.frombuffer(mm, dtype=np.uint8)
+            try:
+                end = len(mm)
+                yielded = 0
+                while end > 0 and (frames is None or yielded < frames):
+                    start = _header_start(mm, digits, end)
+                    if start < 0:
+                        break
+
+                    # a complete frame is parts + 2 lines, each ending in a newline. anything after them is a
+                    # partially written frame
+                    newlines = np.flatnonzero(view[start:end] == 10)
+                    if newlines.shape[0] >= parts + 2:
+                        # skip the particle count and experiment name lines
+                        body = start + int(newlines[1]) + 1
+                        frame_end = start + int(newlines[parts + 1]) + 1
+                        yield frame_reader.parse_block(mm[body:frame_end], parts)
+                        yielded += 1
+                    end = start
+            finally:
+                del view  # the map can't be closed while an array still points into it
+    if yielded == 0 and (frames is None or frames > 0):
+        raise ValueError("no complete frame of {} particles found in {}".format(parts, filepath))
 
 
 # Example usage:
 if __name__ == "__main__":
     filename = base_dir + file #"example.txt"
 
-    # get last frame from frame file and save it
-    frame_lines = 0
-    with open(filename, 'r') as fp:
-        frame_lines = int(fp.readline()) + 2
-
-    n = 5  # number of lines per chunk
-    yields = 0
-    for chunk in read_from_end(filename, frame_lines):
-        print("---- Chunk ----")
-        for line in chunk:
-            print(line)
-        yields += 1
-        if yields > 200:
-            break
\ No newline at end of file
+    # print the NPs (type 2) of the last 200 frames, newest first
+    for frame, (types, coords) in enumerate(read_frames_from_end(filename, frames=200)):
+        print("---- Frame", -1 - frame, "----")
+        print(coords[types == 2])
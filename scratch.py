@@ -1,11 +1,13 @@
 import numpy as np
 import matplotlib.pyplot as plt
 import matplotlib
+import voxel_io
 matplotlib.use("Qt5Agg")
 
 base_dir = "/scratch/chdavis/exp_4/NP_BRUSH/Umin_-0.175/rad_2/den_0.1/gap_0/len_64/NP_32"
 
-voxels = np.load(base_dir + "/voxel_data.dat", allow_pickle=False)
+# a .npz grid only decompresses the z layers that are looked at
+voxels = voxel_io.load_voxels(voxel_io.voxel_path(base_dir))
 # Check shape
 print("Array shape:", voxels.shape)  # should be (Nx, Ny, Nz, 2)
 
@@ -13,13 +15,13 @@ print("Array shape:", voxels.shape)  # should be (Nx, Ny, Nz, 2)
 z_index = 0
 particle_type = 0
 
+# the FFT of every z slice is computed once and cached next to the voxel file
+spectra = voxel_io.load_slice_spectra(voxel_io.voxel_path(base_dir), voxels)
+
 # FFT function
 def compute_fft(z, t):
-    """Compute abs FFT over x,y for fixed z and type"""
-    slice_xy = voxels[:, :, z, t]
-    slice_xy = slice_xy - np.mean(slice_xy)
-    fft2d = np.fft.fftshift(np.fft.fft2(slice_xy))
-    return np.abs(fft2d)
+    """abs FFT over x,y for fixed z and type"""
+    return np.asarray(spectra[:, :, z, t])
 
 # Initial data
 fft_abs = compute_fft(z_index, particle_type)
@@ -0,0 +1,122 @@
+# synthetic_trajectory writes made up brush + NP simulations in the same layout and formats as the MD code, so the
+# analysis can be run (and timed, see benchmark.py) without cluster data.
+#   <root>/NP_BRUSH/Umin_<Umin>/rad_<radius>/den_<density>/[gap_<gap>/len_<chain length>/]NP_<NPs>/
+#       <name>.mpd          - line 6 holds the particle count, line 9 the box size "size x y z", the rest are comments
+#       frames_<name>.xyz   - (parts + 2) lines per frame: parts, the name, then "type\tx\ty\tz" per particle
+#       slurm-synthetic.out - marks the simulation as finished (see campaign.is_input_file)
+# chains are grafted at z = 0 on the brush part of the xy plane (x < box x - gap) and stretched to the brush height of
+# a chain of that length and grafting density. NPs are spread uniformly over the box. every frame moves the monomers
+# and NPs around their mean positions, so profiles and RDPs are noisy like the real ones.
+import os
+import sys
+import numpy as np
+
+
+def brush_height(chain_len, grafting_density):
+    """
+    height of the synthetic brush, the scaling of a brush in good solvent (h ~ N sigma^(1/3)). the brush height
+    analysis ignores the profile below z = 20 (see brush_analysis.frame_inflection_heights), so a brush that is
+    measured has to be taller than that, e.g. chain_len 96 at grafting_density 0.03 (about 30).
+    """
+    return chain_len * grafting_density ** (1.0 / 3.0)
+
+
+def sim_name(radius, grafting_density, chain_len, NPs, gap=None):
+    """
+    experiment name in the style of create_exp.sh, e.g. synthetic_rad2_den0-03_len96_NP64.
+    """
+    name = "synthetic_rad{}_den{}".format(radius, grafting_density)
+    if gap is not None:
+        name += "_gap{}".format(gap)
+    return (name + "_len{}_NP{}".format(chain_len, NPs)).replace(".", "-")
+
+
+def sim_dir(root, radius, grafting_density, chain_len, NPs, gap=None, Umin=-0.175):
+    """
+    directory of a synthetic simulation. gap sims (gap not None) have the extra gap_*/len_* levels that
+    analyze_gap_sims.py expects.
+    """
+    path = os.path.join(root, "NP_BRUSH", "Umin_{}".format(Umin), "rad_{}".format(radius),
+                        "den_{}".format(grafting_density))
+    if gap is not None:
+        path = os.path.join(path, "gap_{}".format(gap), "len_{}".format(chain_len))
+    return os.path.join(path, "NP_{}".format(NPs))
+
+
+def write_mpd(path, name, box, parts):
+    with open(path, 'w') as fp:
+        fp.write("# {} written by synthetic_trajectory.py\n".format(name))
+        for i in range(5):
+            fp.write("#\n")
+        fp.write("particles {}\n".format(parts))
+        for i in range(2):
+            fp.write("#\n")
+        fp.write("size {} {} {}\n".format(box[0], box[1], box[2]))
+
+
+def write_trajectory(root,
+                     NPs=64,
+                     chain_len=96,      # brush height about 30 at the default grafting density (see brush_height)
+                     grafting_density=0.03,
+                     frames=100,
+                     radius=2,
+                     gap=None,     # width of the ungrafted slab at the x edge of the box, None for a plain brush sim
+                     box_xy=(40, 40),
+                     seed=0):
+    """
+    writes one synthetic simulation under root and returns (sim directory, name, frames file, box size).
+    """
+    rng = np.random.default_rng(seed)
+    height = brush_height(chain_len, grafting_density)
+    box = (float(box_xy[0]), float(box_xy[1]), float(np.ceil(max(3.0 * height, height + 40.0))))
+    border = box[0] - (gap or 0)
+
+    # graft points over the brush part of the plane
+    chains = max(int(round(grafting_density * border * box[1])), 1)
+    graft = np.column_stack((rng.uniform(0, border, chains), rng.uniform(0, box[1], chains)))
+    # mean monomer positions: a lateral random walk from the graft point, stretched evenly up to the brush height
+    steps = np.cumsum(rng.normal(0, 0.5, (chains, chain_len, 2)), axis=1)
+    mean_xy = (graft[:, None, :] + steps).reshape(-1, 2)
+    mean_z = np.tile((np.arange(chain_len) + 0.5) * height / chain_len, chains)
+    mean_np = rng.uniform((0, 0, radius), (box[0], box[1], box[2] - radius), (NPs, 3))
+
+    monomers = chains * chain_len
+    parts = monomers + NPs
+    types = np.concatenate((np.ones(monomers, dtype=np.int64), np.full(NPs, 2, dtype=np.int64)))
+
+    dir_base = sim_dir(root, radius, grafting_density, chain_len, NPs, gap)
+    name = sim_name(radius, grafting_density, chain_len, NPs, gap)
+    os.makedirs(dir_base, exist_ok=True)
+    write_mpd(os.path.join(dir_base, name + ".mpd"), name, box, parts)
+
+    frame_file = os.path.join(dir_base, "frames_" + name + ".xyz")
+    with open(frame_file, 'w') as fp:
+        for f in range(frames):
+            coords = np.empty((parts, 3))
+            coords[:monomers, :2] = mean_xy + rng.normal(0, 0.5, (monomers, 2))
+            coords[:monomers, 2] = np.abs(mean_z + rng.normal(0, 0.5, monomers))
+            coords[monomers:] = mean_np + rng.normal(0, 1.0, (NPs, 3))
+            coords[monomers:, 2] = np.clip(coords[monomers:, 2], radius, box[2] - radius)
+            # x and y are periodic, like the MD box
+            coords[:, 0] %= box[0]
+            coords[:, 1] %= box[1]
+
+            fp.write("{}\n{}\n".format(parts, name))
+            np.savetxt(fp, np.column_stack((types, coords)), fmt=["%d", "%.4f", "%.4f", "%.4f"], delimiter="\t")
+
+    with open(os.path.join(dir_base, "slurm-synthetic.out"), 'w') as fp:
+        fp.write("synthetic simulation, {} frames\n".format(frames))
+    return dir_base, name, frame_file, box
+
+
+if __name__ == "__main__":
+    # python synthetic_trajectory.py <root> [NPs] [chain length] [grafting density] [frames] [gap]
+    args = sys.argv[1:]
+    dir_base, name, frame_file, box = write_trajectory(
+        args[0],
+        NPs=int(args[1]) if len(args) > 1 else 64,
+        chain_len=int(args[2]) if len(args) > 2 else 96,
+        grafting_density=float(args[3]) if len(args) > 3 else 0.03,
+        frames=int(args[4]) if len(args) > 4 else 100,
+        gap=int(args[5]) if len(args) > 5 else None)
+    print(frame_file, box)
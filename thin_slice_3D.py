@@ -1,9 +1,11 @@
 
+import compressed_frames
+
 base_dir = "/scratch/chdavis/exp_5/NP_BRUSH/Umin_-0.175/rad_2/den_0.06/gap_0/len_32/NP_1024"
 
 thin_film = []
 
-with open(base_dir +"/last_frame.xyz" , 'r') as fp:
+with compressed_frames.open_frames(compressed_frames.find_frames(base_dir +"/last_frame.xyz"), 'rt') as fp:
     for i, line in enumerate(fp):
 
         if i < 2:
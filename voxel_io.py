@@ -0,0 +1,215 @@
+# voxel_io reads and writes the time averaged voxel grids made by gap_brush_analysis.build_density_voxels.
+# there are two on-disk formats:
+#   voxel_data.dat - the original format. a dense float64 (Nx, Ny, Nz, types) array written with np.save
+#   voxel_data.npz - compressed float32 written with np.savez_compressed. each type is cut into chunks of
+#                    chunk_z z layers ("type_<t>_<k>") so a slice only decompresses the chunk it falls in. sparse
+#                    types (by default the NPs, which are zero in most voxels) are stored as the flat indices and
+#                    values of their nonzero voxels instead ("type_<t>_index", "type_<t>_values").
+# load_voxels opens either format. a .npz grid is returned as a VoxelGrid that only reads what is indexed.
+# axis_projections gives the summed x, y and z profiles of a grid without reading all of it at once.
+# load_slice_spectra gives the 2D FFT magnitude of every z slice, cached next to the grid as <grid file>.fft.npy.
+import os
+import sys
+import numpy as np
+
+
+def save_voxels(path, voxel_array, chunk_z=16, sparse_types=(1,)):
+    """
+    writes a (Nx, Ny, Nz, types) voxel array to path in the compressed .npz format.
+    """
+    voxel_array = np.asarray(voxel_array)
+    shape = voxel_array.shape
+    members = {"shape": np.asarray(shape, dtype=np.int64), "chunk_z": np.asarray(chunk_z, dtype=np.int64),
+               "sparse_types": np.asarray(sparse_types, dtype=np.int64)}
+    for t in range(shape[3]):
+        channel = voxel_array[..., t].astype(np.float32)
+        if t in sparse_types:
+            index = np.flatnonzero(channel)
+            members["type_{}_index".format(t)] = index
+            members["type_{}_values".format(t)] = channel.ravel()[index]
+        else:
+            for k, z in enumerate(range(0, shape[2], chunk_z)):
+                members["type_{}_{}".format(t, k)] = channel[:, :, z:z + chunk_z]
+
+    # np.savez_compressed adds .npz to names without it, so write to a temporary .npz and move it in place
+    tmp_path = path + ".tmp.npz"
+    np.savez_compressed(tmp_path, **members)
+    os.replace(tmp_path, path)
+
+
+class VoxelGrid():
+    """
+    read only view of a .npz voxel grid that behaves like the (Nx, Ny, Nz, types) array for indexing.
+    only the z chunks a request touches are decompressed, and the last chunks read are kept.
+    """
+
+    def __init__(self, path):
+        self.Path = path
+        self.File = np.load(path, allow_pickle=False)
+        self.shape = tuple(int(x) for x in self.File["shape"])
+        self.ndim = 4
+        self.dtype = np.dtype(np.float32)
+        self.ChunkZ = int(self.File["chunk_z"])
+        self.SparseTypes = set(int(x) for x in self.File["sparse_types"])
+        self.Chunks = {}  # (type, chunk) -> decompressed chunk
+        self.Sparse = {}  # type -> ((x, y, z) of the nonzero voxels, values)
+
+    def _chunk(self, t, k):
+        if (t, k) not in self.Chunks:
+            if len(self.Chunks) >= 32:
+                self.Chunks.pop(next(iter(self.Chunks)))  # drop the oldest chunk
+            if t in self.SparseTypes:
+                self.Chunks[(t, k)] = self._sparse_chunk(t, k)
+            else:
+                self.Chunks[(t, k)] = self.File["type_{}_{}".format(t, k)]
+        return self.Chunks[(t, k)]
+
+    def _sparse_chunk(self, t, k):
+        if t not in self.Sparse:
+            index = self.File["type_{}_index".format(t)]
+            self.Sparse[t] = (np.unravel_index(index, self.shape[:3]), self.File["type_{}_values".format(t)])
+        (x, y, z), values = self.Sparse[t]
+        z0 = k * self.ChunkZ
+        z1 = min(z0 + self.ChunkZ, self.shape[2])
+        chunk = np.zeros(self.shape[:2] + (z1 - z0,), dtype=np.float32)
+        inside = (z >= z0) & (z < z1)
+        chunk[x[inside], y[inside], z[inside] - z0] = values[inside]
+        return chunk
+
+    def _block(self, types, z0, z1):
+        """
+        dense (Nx, Ny, z1 - z0, len(types)) array for the z layers [z0, z1) of the given types.
+        """
+        block = np.zeros(self.shape[:2] + (z1 - z0, len(types)), dtype=np.float32)
+        for i, t in enumerate(types):
+            for k in range(z0 // self.ChunkZ, (z1 - 1) // self.ChunkZ + 1):
+                chunk = self._chunk(t, k)
+                c0 = k * self.ChunkZ
+                lo = max(z0, c0)
+                hi = min(z1, c0 + chunk.shape[2])
+                block[:, :, lo - z0:hi - z0, i] = chunk[:, :, lo - c0:hi - c0]
+        return block
+
+    def __getitem__(self, key):
+        if not isinstance(key, tuple):
+            key = (key,)
+        if any(k is Ellipsis for k in key):
+            e = key.index(Ellipsis)
+            key = key[:e] + (slice(None),) * (4 - len(key) + 1) + key[e + 1:]
+        key = key + (slice(None),) * (4 - len(key))
+        z_key, t_key = key[2], key[3]
+        if not isinstance(z_key, (int, np.integer, slice)) or not isinstance(t_key, (int, np.integer, slice)):
+            return np.asarray(self)[key]  # fancy indexing on z or type reads the whole grid
+
+        # only the z layers and types the key asks for are read
+        types = list(range(self.shape[3]))[t_key] if isinstance(t_key, slice) else [int(t_key) % self.shape[3]]
+        if isinstance(z_key, slice):
+            layers = range(*z_key.indices(self.shape[2]))
+            if len(layers) == 0:
+                z0, z1, z_rel = 0, 0, slice(None)
+            else:
+                z0, z1 = min(layers), max(layers) + 1
+                stop = layers.start - z0 + len(layers) * layers.step
+                z_rel = slice(layers.start - z0, stop if stop >= 0 else None, layers.step)
+        else:
+            z0 = int(z_key) % self.shape[2]
+            z1 = z0 + 1
+            z_rel = 0
+        t_rel = slice(None) if isinstance(t_key, slice) else 0
+        return self._block(types, z0, z1)[key[0], key[1], z_rel, t_rel]
+
+    def __array__(self, dtype=None, copy=None):
+        array = self._block(list(range(self.shape[3])), 0, self.shape[2])
+        return array if dtype is None else array.astype(dtype)
+
+
+
+def load_voxels(path, mmap=False):
+    """
+    opens a voxel grid in either format. .npz files are returned as a VoxelGrid, anything else is loaded with np.load.
+    with mmap the .dat/.npy files are memory mapped, so only the voxels that are indexed are read from disk.
+    """
+    if path.endswith(".npz"):
+        return VoxelGrid(path)
+    if mmap:
+        return np.load(path, mmap_mode='r', allow_pickle=False)
+    return np.load(path, allow_pickle=False)
+
+
+def axis_projections(grid, chunk_z=16):
+    """
+    sums of every type over pairs of axes, read chunk_z z layers at a time so the whole grid is never in memory.
+    returns a list with one (x profile (sum over y, z), y profile (sum over x, z), z profile (sum over x, y))
+    per type.
+    """
+    projections = []
+    for t in range(grid.shape[3]):
+        x_vals = np.zeros(grid.shape[0])
+        y_vals = np.zeros(grid.shape[1])
+        z_vals = np.zeros(grid.shape[2])
+        for z in range(0, grid.shape[2], chunk_z):
+            block = np.asarray(grid[:, :, z:z + chunk_z, t], dtype=np.float64)
+            x_vals += block.sum(axis=(1, 2))
+            y_vals += block.sum(axis=(0, 2))
+            z_vals[z:z + block.shape[2]] = block.sum(axis=(0, 1))
+        projections.append((x_vals, y_vals, z_vals))
+    return projections
+
+
+def voxel_path(dir_base):
+    """
+    path of the voxel grid in a simulation directory, preferring the compressed format.
+    """
+    if os.path.exists(dir_base + "/voxel_data.npz"):
+        return dir_base + "/voxel_data.npz"
+    return dir_base + "/voxel_data.dat"
+
+
+def slice_spectra(grid, chunk_z=16):
+    """
+    |fftshift(fft2(slice - mean of slice))| over x and y for every z slice and type of a grid, computed with one
+    batched fft2 per chunk_z z layers. returns a float32 array with the shape of the grid.
+    """
+    spectra = np.zeros(grid.shape, dtype=np.float32)
+    for z in range(0, grid.shape[2], chunk_z):
+        block = np.asarray(grid[:, :, z:z + chunk_z, :], dtype=np.float64)
+        block = block - block.mean(axis=(0, 1), keepdims=True)
+        spectra[:, :, z:z + block.shape[2], :] = np.abs(np.fft.fftshift(np.fft.fft2(block, axes=(0, 1)), axes=(0, 1)))
+    return spectra
+
+
+def spectra_path(path):
+    """
+    path of the cached slice spectra for a voxel grid file.
+    """
+    return path + ".fft.npy"
+
+
+def load_slice_spectra(path, grid=None):
+    """
+    returns the slice spectra (see slice_spectra) of the voxel grid file at path, memory mapped from the cache when
+    it is newer than the grid. otherwise they are computed (from grid if it is already open) and saved.
+    """
+    cache = spectra_path(path)
+    if os.path.exists(cache) and os.path.getmtime(cache) >= os.path.getmtime(path):
+        return np.load(cache, mmap_mode='r')
+
+    if grid is None:
+        grid = load_voxels(path, mmap=True)
+    spectra = slice_spectra(grid)
+    try:
+        with open(cache + ".tmp", 'wb') as fp:
+            np.save(fp, spectra)
+        os.replace(cache + ".tmp", cache)
+    except OSError as e:
+        # read only data directories still get the spectra, they just aren't kept
+        print("could not save slice spectra", cache, e)
+    return spectra
+
+
+if __name__ == "__main__":
+    # convert every voxel_data.dat passed on the command line to voxel_data.npz next to it
+    for dat_file in sys.argv[1:]:
+        npz_file = os.path.splitext(dat_file)[0] + ".npz"
+        save_voxels(npz_file, np.load(dat_file, allow_pickle=False))
+        print(dat_file, os.path.getsize(dat_file), "->", npz_file, os.path.getsize(npz_file), "bytes")